@@ -2,7 +2,8 @@ import math
 import time
 import cv2
 import cvzone
-from ultralytics import YOLO
+from LivenessBackend import load_liveness_model
+from KioskPipeline import StageStats, format_stats
 
 # Set confidence threshold for object detection
 confidence = 0.6
@@ -12,20 +13,23 @@ cap = cv2.VideoCapture(0)  # For Webcam
 cap.set(3, 640)  # Set the width of the frame
 cap.set(4, 480)  # Set the height of the frame
 
-# Load the YOLO model for detecting objects (path to the trained model)
-model = YOLO("../models/n_version_4_75.pt")
+# Load the YOLO model for detecting objects (path to the trained model).
+# A .onnx export from ExportLivenessModel.py runs on ONNX Runtime instead of PyTorch.
+model = load_liveness_model("../models/n_version_4_75.pt")
 
 # Define the class names for detection ("fake" and "real")
 classNames = ["fake", "real"]
 
-# Initialize variables for calculating frames per second (FPS)
-prev_frame_time = 0
-new_frame_time = 0
+# Latency / FPS of the model and of the whole loop, reported every few seconds.
+# For repeatable numbers on recorded frames use BenchmarkLiveness.py.
+inference_stats = StageStats('inference')
+loop_stats = StageStats('loop')
+stats_interval = 5
+last_report = time.perf_counter()
 
 # Start the webcam feed and process frames
 while True:
-    # Capture the new frame and calculate FPS
-    new_frame_time = time.time()
+    loop_start = time.perf_counter()
     success, img = cap.read()
 
     if not success:  # If there is an issue with reading the frame, continue to the next iteration
@@ -35,38 +39,32 @@ while True:
     img = cv2.flip(img, 1)
 
     # Perform object detection using the YOLO model on the current frame
-    results = model(img, stream=True, verbose=False)
-    for r in results:
-        boxes = r.boxes  # Get bounding boxes for detected objects
-        for box in boxes:
-            # Extract coordinates of the bounding box (top-left and bottom-right)
-            x1, y1, x2, y2 = box.xyxy[0]
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+    inference_start = time.perf_counter()
+    detections = model.detect(img)
+    inference_stats.record(time.perf_counter() - inference_start)
+    for x1, y1, x2, y2, conf, cls in detections:
+        # Coordinates of the bounding box (top-left and bottom-right)
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
 
-            # Calculate width and height of the bounding box
-            w, h = x2 - x1, y2 - y1
+        # Calculate width and height of the bounding box
+        w, h = x2 - x1, y2 - y1
 
-            # Get the confidence score of the detection
-            conf = math.ceil((box.conf[0] * 100)) / 100
+        # Round the confidence score up to two decimals
+        conf = math.ceil((conf * 100)) / 100
 
-            # Get the class of the detected object (0 for fake, 1 for real)
-            cls = int(box.cls[0])
+        # Get the class of the detected object (0 for fake, 1 for real)
+        cls = int(cls)
 
-            if conf > confidence:  # Only consider detections above the confidence threshold
-                # Set color for bounding box and label based on class
-                color = (0, 255, 0) if classNames[cls] == 'real' else (0, 0, 255)
+        if conf > confidence:  # Only consider detections above the confidence threshold
+            # Set color for bounding box and label based on class
+            color = (0, 255, 0) if classNames[cls] == 'real' else (0, 0, 255)
 
-                # Draw a corner rectangle around the detected object
-                cvzone.cornerRect(img, (x1, y1, w, h), colorC=color, colorR=color)
+            # Draw a corner rectangle around the detected object
+            cvzone.cornerRect(img, (x1, y1, w, h), colorC=color, colorR=color)
 
-                # Display the class name and confidence on the frame
-                cvzone.putTextRect(img, f'{classNames[cls].upper()} {int(conf * 100)}%',
-                                   (max(0, x1), max(35, y1)), scale=2, thickness=4, colorR=color, colorB=color)
-
-    # Calculate and print FPS (frames per second)
-    fps = 1 / (new_frame_time - prev_frame_time)
-    prev_frame_time = new_frame_time
-    print(f"FPS: {fps:.2f}")
+            # Display the class name and confidence on the frame
+            cvzone.putTextRect(img, f'{classNames[cls].upper()} {int(conf * 100)}%',
+                               (max(0, x1), max(35, y1)), scale=2, thickness=4, colorR=color, colorB=color)
 
     # Show the processed image with bounding boxes and labels
     cv2.imshow("Image", img)
@@ -75,7 +73,11 @@ while True:
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
+    loop_stats.record(time.perf_counter() - loop_start)
+    if time.perf_counter() - last_report > stats_interval:
+        print(format_stats([inference_stats.summary(), loop_stats.summary()]))
+        last_report = time.perf_counter()
+
 # Release the webcam and close all OpenCV windows when done
 cap.release()
 cv2.destroyAllWindows()
-jnh
@@ -1,13 +1,15 @@
 import os
-import pickle
 import cv2
 import face_recognition
 import cvzone
-import numpy as np
-from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
+from GalleryFile import load_face_index
+from ProfileCache import ProfileCache
+from AttendanceSink import AttendanceSink, FirebaseBackend, attendance_lookup
+from FaceTracker import FaceTracker
+from InferenceScheduler import InferenceScheduler
 
 # Initialize Firebase app using the provided service account key and set the database URL.
 cred = credentials.Certificate("serviceAccountKey.json")
@@ -15,6 +17,16 @@ firebase_admin.initialize_app(cred, {
     'databaseURL': " "  # create a live database at firebase console and place it here
 })
 
+# Student profiles are read from a local cache, bulk-loaded once and kept fresh by a listener.
+profile_cache = ProfileCache(db)
+print(f"Loaded {profile_cache.warm()} student profiles")
+profile_cache.start()
+
+# Marks are journaled locally and sent as server-side increments by a background writer,
+# so a cached total_attendance is never written back over another kiosk's marks.
+attendance_sink = AttendanceSink(FirebaseBackend(db)).start()
+lookup_attendance = attendance_lookup(profile_cache, attendance_sink)
+
 # Initialize camera capture (webcam) with specific width and height settings.
 cap = cv2.VideoCapture(0)
 cap.set(3, 640)  # Set width
@@ -31,14 +43,10 @@ for path in modePathList:
     imgModeList.append(cv2.imread(os.path.join(folderModePath, path)))
 # Now imgModeList holds all mode images (like loading screen, attendance info, etc.)
 
-# Load the pre-computed face encodings and corresponding student IDs from a pickle file.
+# Load the pre-computed face encodings and corresponding student IDs from the memory-mapped gallery.
 print("Loading Encode File ...")
-file = open('EncodeFile.p', 'rb')
-encodeListKnownWithIds = pickle.load(file)
-file.close()
-# Unpack the list to get known encodings and student IDs.
-encodeListKnown, studentIds = encodeListKnownWithIds
-print(studentIds)
+face_index = load_face_index('EncodeFile.gal')
+print(face_index.ids)
 print("Encode File Loaded")
 
 # Initialize control variables: modeType for UI mode, counter for timing events, and an id placeholder.
@@ -46,6 +54,15 @@ modeType = 0         # UI display mode; 0 might be default, 1 - loading, 2 - inf
 counter = 0          # Counter to control the duration of UI state transitions.
 id = -1              # Initial student ID (will update when a known face is detected).
 
+# Faces are tracked across frames; a tracked face keeps its identity and is only re-encoded
+# when it is new, its match was weak, or a periodic refresh is due.
+tracker = FaceTracker()
+frameIndex = 0
+
+# HOG detection runs at a low rate while the scene is static; motion or a face brings it back to every frame.
+scheduler = InferenceScheduler()
+faceCurFrame = []
+
 # Main loop to continuously read frames from the camera.
 while True:
     success, img = cap.read()  # Capture a frame from the camera.
@@ -55,9 +72,27 @@ while True:
     imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
     imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)  # Convert from BGR (OpenCV default) to RGB.
 
-    # Detect face locations and compute face encodings in the smaller image.
-    faceCurFrame = face_recognition.face_locations(imgS)
-    encodeCurFrame = face_recognition.face_encodings(imgS, faceCurFrame)
+    # Detect face locations in the smaller image and follow them with the tracker.
+    # On a skipped frame the scene has not changed, so the last locations still hold.
+    if scheduler.should_run(img):
+        faceCurFrame = face_recognition.face_locations(imgS)
+        scheduler.note_faces(len(faceCurFrame))
+    faceTracks = tracker.update([(x1 * 4, y1 * 4, x2 * 4, y2 * 4) for y1, x2, y2, x1 in faceCurFrame],
+                                ["unknown"] * len(faceCurFrame), frameIndex)
+
+    # Only encode (and match, in one query) the faces whose track needs it.
+    pendingFaces = [i for i, faceTrack in enumerate(faceTracks) if tracker.needs_encoding(faceTrack, frameIndex)]
+    if pendingFaces:
+        encodeCurFrame = face_recognition.face_encodings(imgS, [faceCurFrame[i] for i in pendingFaces])
+        matchIds, matchDistances = face_index.match(encodeCurFrame)
+        for i, matchId, matchDistance in zip(pendingFaces, matchIds, matchDistances):
+            tracker.assign(faceTracks[i], matchId, matchDistance, frameIndex)
+    if faceCurFrame:
+        tracker.count_frame(len(faceCurFrame), len(pendingFaces))
+    frameIndex += 1
+    if frameIndex % 300 == 0:
+        print(f"Encoding skipped on {tracker.stats()['skip_ratio'] * 100:.0f}% of frames with faces, "
+              f"HOG ran on {scheduler.duty_cycle() * 100:.0f}% of frames")
 
     # Overlay the captured frame onto the main background image.
     # Here the live feed is placed at a specific location on the background.
@@ -67,15 +102,10 @@ while True:
 
     # If faces are detected in the frame.
     if faceCurFrame:
-        # Loop through each detected face and its encoding.
-        for encodeFace, faceLoc in zip(encodeCurFrame, faceCurFrame):
-            # Compare the detected face encoding to known encodings and calculate distances.
-            matches = face_recognition.compare_faces(encodeListKnown, encodeFace)
-            faceDis = face_recognition.face_distance(encodeListKnown, encodeFace)
-            # Get the index of the best match with the smallest distance.
-            matchIndex = np.argmin(faceDis)
-
-            if matches[matchIndex]:
+        # Loop through each detected face and the identity of its track.
+        for faceTrack, faceLoc in zip(faceTracks, faceCurFrame):
+            matchId = faceTrack.identity
+            if matchId is not None:
                 # If a known face is detected, draw a rectangle around the face on the background.
                 y1, x2, y2, x1 = faceLoc
                 # Since face detection was done on the resized image, rescale the coordinates.
@@ -84,7 +114,7 @@ while True:
                 bbox = 55 + x1, 162 + y1, x2 - x1, y2 - y1
                 imgBackground = cvzone.cornerRect(imgBackground, bbox, rt=0)
                 # Retrieve the student ID corresponding to the matched face.
-                id = studentIds[matchIndex]
+                id = matchId
 
                 # If this is the first frame when the face has been detected, trigger a UI update.
                 if counter == 0:
@@ -97,31 +127,23 @@ while True:
         # If the counter is non-zero, process the detected face information.
         if counter != 0:
             if counter == 1:
-                # Get student information from Firebase database using the detected student id.
-                studentInfo = db.reference(f'Students/{id}').get()
+                # Get student information from the profile cache (Firebase only on a miss) and
+                # mark attendance if more than 30 seconds have passed since the last record.
+                studentInfo, marked = lookup_attendance(id)
                 print(studentInfo)
-
-                # Retrieve the last attendance time from database and convert to a datetime object.
-                datetimeObject = datetime.strptime(studentInfo['last_attendance_time'],
-                                                    "%Y-%m-%d %H:%M:%S")
-
-                # Calculate the elapsed seconds since the last attendance record.
-                secondsElapsed = (datetime.now() - datetimeObject).total_seconds()
-                print(secondsElapsed)
-                # Update attendance if more than 30 seconds have passed since the last record.
-                if secondsElapsed > 30:
-                    ref = db.reference(f'Students/{id}')
-                    studentInfo['total_attendance'] += 1  # Increment total attendance count.
-                    ref.child('total_attendance').set(studentInfo['total_attendance'])
-                    ref.child('last_attendance_time').set(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                else:
+                if studentInfo is None:
+                    # No profile for this id: nothing to show or mark.
+                    modeType = 0
+                    counter = 0
+                    imgBackground[44:44 + 633, 808:808 + 414] = imgModeList[modeType]
+                elif not marked:
                     # If less than 30 seconds since last attendance, set a different mode to indicate quick re-scan.
                     modeType = 3
                     counter = 0
                     imgBackground[44:44 + 633, 808:808 + 414] = imgModeList[modeType]
 
-            # If the mode is not the "already processed" mode.
-            if modeType != 3:
+            # If the mode is not the "already processed" mode and the student has a profile.
+            if modeType != 3 and studentInfo is not None:
                 # Change the mode based on the counter value to create transitions in the user interface.
                 if 10 < counter < 20:
                     modeType = 2
@@ -0,0 +1,310 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Append-only history of every recognition: student, camera, time, match distance,
+# liveness score and whether it marked attendance.
+#   events  one row per recognition; ts is Unix time, so nothing is parsed per event.
+#           Indexed on (student_id, ts) and (ts). UPDATE and DELETE are refused.
+#   daily   per (day, student) rollup kept by an insert trigger in the same
+#           transaction, so day and student reports never scan the raw events.
+#   sync    cursors of derived views. As AttendanceSink's journal, the Firebase
+#           total_attendance / last_attendance_time counters are synced from here:
+#           marked events after the cursor are sent as increments, then the cursor
+#           moves; counts from before the ledger existed stay as the baseline.
+# Reports:
+#   python AttendanceLedger.py day --from 2026-10-01 --to 2026-10-31
+#   python AttendanceLedger.py session --start "2026-10-12 09:00" --minutes 60
+#   python AttendanceLedger.py student 0104053
+#   python AttendanceLedger.py counters
+#   python AttendanceLedger.py bench --events 2000000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    distance REAL,
+    liveness REAL,
+    marked INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_student_time ON events (student_id, ts);
+CREATE INDEX IF NOT EXISTS events_time ON events (ts);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    events INTEGER NOT NULL,
+    marked INTEGER NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (day, student_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_student ON daily (student_id, day);
+CREATE TABLE IF NOT EXISTS sync (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS events_rollup AFTER INSERT ON events BEGIN
+    INSERT INTO daily (day, student_id, events, marked, first_ts, last_ts)
+    VALUES (date(NEW.ts, 'unixepoch', 'localtime'), NEW.student_id, 1, NEW.marked, NEW.ts, NEW.ts)
+    ON CONFLICT (day, student_id) DO UPDATE SET
+        events = events + 1,
+        marked = marked + excluded.marked,
+        first_ts = min(first_ts, excluded.first_ts),
+        last_ts = max(last_ts, excluded.last_ts);
+END;
+CREATE TRIGGER IF NOT EXISTS events_no_update BEFORE UPDATE ON events BEGIN
+    SELECT RAISE(ABORT, 'the attendance ledger is append-only');
+END;
+CREATE TRIGGER IF NOT EXISTS events_no_delete BEFORE DELETE ON events BEGIN
+    SELECT RAISE(ABORT, 'the attendance ledger is append-only');
+END;
+"""
+
+
+def local_time(ts):
+    return datetime.fromtimestamp(ts).strftime(TIME_FORMAT)
+
+
+class AttendanceLedger:
+
+    def __init__(self, path='attendance_ledger.db', camera='kiosk', sync_name='firebase'):
+        self.path = path
+        self.camera = camera        # default camera name of record()
+        self.sync_name = sync_name  # cursor used by the journal interface below
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO sync (name, seq) VALUES (?, 0)", (sync_name,))
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record(self, student_id, camera=None, distance=None, liveness=None, marked=False, when=None):
+        ts = (when or datetime.now()).timestamp()
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO events (student_id, camera, ts, distance, liveness, marked) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(student_id), camera or self.camera, ts, none_or_float(distance), none_or_float(liveness),
+                 int(bool(marked)))).lastrowid
+
+    def record_many(self, rows):
+        # rows of (student_id, camera, ts, distance, liveness, marked), in one transaction
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO events (student_id, camera, ts, distance, liveness, marked) "
+                                       "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # === Journal interface of AttendanceSink ===
+
+    def append(self, student_id, when, marked, details):
+        self.record(student_id, marked=marked, when=when, **details)
+
+    def peek(self, limit):
+        # Marked events not yet synced: [(seq, student_id, marked_at)]
+        rows = self._query("SELECT seq, student_id, ts FROM events WHERE marked = 1 "
+                           "AND seq > (SELECT seq FROM sync WHERE name = ?) ORDER BY seq LIMIT ?",
+                           (self.sync_name, limit))
+        return [(seq, student_id, local_time(ts)) for seq, student_id, ts in rows]
+
+    def remove(self, rows):
+        # Sent: move the cursor past them (the events themselves stay)
+        with self._lock:
+            self._conn.execute("UPDATE sync SET seq = max(seq, ?) WHERE name = ?",
+                               (max(row[0] for row in rows), self.sync_name))
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM events WHERE marked = 1 "
+                           "AND seq > (SELECT seq FROM sync WHERE name = ?)", (self.sync_name,))[0][0]
+
+    # === Reports ===
+
+    def per_day(self, start_day, end_day):
+        # [(day, students, marked, events)] for days start_day..end_day (YYYY-MM-DD)
+        return self._query("SELECT day, COUNT(*), SUM(marked > 0), SUM(events) FROM daily "
+                           "WHERE day BETWEEN ? AND ? GROUP BY day ORDER BY day", (start_day, end_day))
+
+    def session(self, start, end, camera=None):
+        # Who was seen between two datetimes:
+        # [(student_id, first, last, events, marked, best distance, best liveness)]
+        sql = ("SELECT student_id, min(ts), max(ts), COUNT(*), SUM(marked), min(distance), max(liveness) "
+               "FROM events WHERE ts >= ? AND ts < ?")
+        params = [start.timestamp(), end.timestamp()]
+        if camera:
+            sql += " AND camera = ?"
+            params.append(camera)
+        rows = self._query(sql + " GROUP BY student_id ORDER BY min(ts)", params)
+        return [(student_id, local_time(first), local_time(last), *rest)
+                for student_id, first, last, *rest in rows]
+
+    def student(self, student_id, start_day='0000-00-00', end_day='9999-99-99'):
+        # One student's days: [(day, first, last, events, marked)]
+        rows = self._query("SELECT day, first_ts, last_ts, events, marked FROM daily "
+                           "WHERE student_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                           (str(student_id), start_day, end_day))
+        return [(day, local_time(first)[11:], local_time(last)[11:], events, marked)
+                for day, first, last, events, marked in rows]
+
+    def student_events(self, student_id, start, end):
+        # Raw events of one student between two datetimes: [(time, camera, distance, liveness, marked)]
+        rows = self._query("SELECT ts, camera, distance, liveness, marked FROM events "
+                           "WHERE student_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                           (str(student_id), start.timestamp(), end.timestamp()))
+        return [(local_time(ts), *rest) for ts, *rest in rows]
+
+    def counters(self):
+        # Attendance per student as derived from the ledger alone: {id: (marked, last marked_at)}.
+        # daily.last_ts is the last event of any kind, so the last mark is read from the
+        # events of the student's last marked day (an index range on (student_id, ts)).
+        rows = self._query(
+            "SELECT totals.student_id, totals.marked, "
+            "(SELECT max(ts) FROM events WHERE events.student_id = totals.student_id AND marked = 1 "
+            "AND ts BETWEEN daily.first_ts AND daily.last_ts) "
+            "FROM (SELECT student_id, SUM(marked) AS marked, max(CASE WHEN marked > 0 THEN day END) AS day "
+            "FROM daily GROUP BY student_id) AS totals "
+            "LEFT JOIN daily ON daily.day = totals.day AND daily.student_id = totals.student_id")
+        return {student_id: (count, local_time(last) if last else None) for student_id, count, last in rows}
+
+
+def none_or_float(value):
+    return None if value is None else float(value)
+
+
+def print_rows(header, rows):
+    print(" ".join(f"{name:>12}" for name in header))
+    for row in rows:
+        print(" ".join(f"{value:>12.3f}" if isinstance(value, float) else f"{str(value):>12}" for value in row))
+    print(f"({len(rows)} rows)")
+
+
+def synthetic_events(count, students=5000, days=180, cameras=4, seed=0):
+    # A semester of sessions: each event is a student seen at a 9:00-17:00 slot
+    rng = random.Random(seed)
+    start = datetime(2026, 3, 2).timestamp()
+    for _ in range(count):
+        day = rng.randrange(days)
+        ts = start + day * 86400 + rng.randrange(9, 17) * 3600 + rng.random() * 3600
+        yield (f"{rng.randrange(students):07d}", f"cam{rng.randrange(cameras)}", ts,
+               rng.uniform(0.2, 0.6), rng.uniform(0.7, 1.0), int(rng.random() < 0.6))
+
+
+def bench(args):
+    with tempfile.TemporaryDirectory() as folder:
+        ledger = AttendanceLedger(os.path.join(folder, 'ledger.db'))
+        start = time.perf_counter()
+        events = synthetic_events(args.events, args.students, args.days)
+        while True:
+            chunk = [row for _, row in zip(range(100000), events)]
+            if not chunk:
+                break
+            ledger.record_many(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"{args.events} events for {args.students} students over {args.days} days: "
+              f"inserted in {elapsed:.1f} s ({args.events / elapsed:.0f} events/s), "
+              f"{os.path.getsize(ledger.path) / 2 ** 20:.0f} MiB")
+
+        start = time.perf_counter()
+        for _ in range(200):
+            ledger.record('0000001', 'cam0', 0.4, 0.9, True)
+        print(f"one record() from the kiosk: {(time.perf_counter() - start) / 200 * 1000:.3f} ms")
+
+        first = datetime(2026, 3, 2)
+        queries = [
+            ('per_day, 1 week', lambda: ledger.per_day('2026-04-06', '2026-04-12')),
+            ('per_day, 1 month', lambda: ledger.per_day('2026-04-01', '2026-04-30')),
+            ('session, 1 hour', lambda: ledger.session(first + timedelta(days=35, hours=9),
+                                                       first + timedelta(days=35, hours=10))),
+            ('student, all days', lambda: ledger.student('0000042')),
+            ('student events, 1 week', lambda: ledger.student_events('0000042', first + timedelta(days=35),
+                                                                     first + timedelta(days=42))),
+            ('counters, all students', lambda: ledger.counters()),
+            ('sync peek', lambda: ledger.peek(100)),
+        ]
+        print(f"{'query':>24} {'rows':>6} {'mean ms':>8} {'max ms':>8}")
+        for name, query in queries:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = query()
+                times.append((time.perf_counter() - start) * 1000)
+            print(f"{name:>24} {len(rows):>6} {sum(times) / len(times):8.2f} {max(times):8.2f}")
+        ledger.close()
+
+
+def parse_when(value):
+    return datetime.fromisoformat(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance ledger reports")
+    parser.add_argument('--ledger', default='attendance_ledger.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    day = commands.add_parser('day', help="students and events per day")
+    day.add_argument('--from', dest='start', default=(datetime.now() - timedelta(days=6)).strftime('%Y-%m-%d'))
+    day.add_argument('--to', dest='end', default=datetime.now().strftime('%Y-%m-%d'))
+
+    session = commands.add_parser('session', help="who was seen in a time window")
+    session.add_argument('--start', type=parse_when, required=True, help='e.g. "2026-10-12 09:00"')
+    session.add_argument('--minutes', type=float, default=60)
+    session.add_argument('--camera', default=None)
+
+    student = commands.add_parser('student', help="one student's attendance by day")
+    student.add_argument('student_id')
+    student.add_argument('--from', dest='start', default='0000-00-00')
+    student.add_argument('--to', dest='end', default='9999-99-99')
+
+    commands.add_parser('counters', help="total_attendance / last_attendance_time per student, from the ledger")
+
+    benchmark = commands.add_parser('bench', help="insert and query timings on a synthetic ledger")
+    benchmark.add_argument('--events', type=int, default=2000000)
+    benchmark.add_argument('--students', type=int, default=5000)
+    benchmark.add_argument('--days', type=int, default=180)
+    benchmark.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args)
+        return
+    if not os.path.exists(args.ledger):
+        print(f"no ledger at {args.ledger}", file=sys.stderr)
+        sys.exit(1)
+    ledger = AttendanceLedger(args.ledger)
+    if args.command == 'day':
+        print_rows(('day', 'students', 'marked', 'events'), ledger.per_day(args.start, args.end))
+    elif args.command == 'session':
+        end = args.start + timedelta(minutes=args.minutes)
+        print_rows(('student', 'first', 'last', 'events', 'marked', 'distance', 'liveness'),
+                   ledger.session(args.start, end, args.camera))
+    elif args.command == 'counters':
+        print_rows(('student', 'marked', 'last marked'),
+                   [(student_id, *counter) for student_id, counter in sorted(ledger.counters().items())])
+    else:
+        print_rows(('day', 'first', 'last', 'events', 'marked'), ledger.student(args.student_id, args.start, args.end))
+    ledger.close()
+
+
+if __name__ == '__main__':
+    main()
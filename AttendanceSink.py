@@ -0,0 +1,203 @@
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime
+from KioskPipeline import StageStats
+
+# Attendance writes, off the UI and recognition threads.
+#   mark() appends the event to a local SQLite write-ahead journal and returns at once.
+#   A writer thread drains the journal in batches, coalesces events per student and
+#   applies each batch with one multi-path update; rows are deleted only after the
+#   backend accepted them, so outages and restarts never lose attendance.
+# The journal is SqliteJournal by default; pass journal=AttendanceLedger(...) to keep
+# every recognition instead and sync the Firebase counters from the ledger.
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class FirebaseBackend:
+    # Works with firebase_admin.db or FakeFirebase.FakeDatabase.
+    # The increment is done server side ('.sv' increment), so two kiosks marking the
+    # same student never overwrite each other's count. The whole batch is one multi-path
+    # update: it is applied entirely or not at all, so a retried batch never counts twice.
+
+    def __init__(self, db, root='Students'):
+        self.db = db
+        self.root = root
+
+    def apply(self, updates):
+        # updates: {student_id: (count, last_attendance_time)}
+        paths = {}
+        for student_id, (count, marked_at) in updates.items():
+            paths[f'{student_id}/total_attendance'] = {'.sv': {'increment': count}}
+            paths[f'{student_id}/last_attendance_time'] = marked_at
+        self.db.reference(self.root).update(paths)
+
+
+class SqliteJournal:
+    # Marks not yet sent; a row is deleted once the backend accepted it
+
+    def __init__(self, path='attendance_journal.db'):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pending ("
+                           "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "student_id TEXT NOT NULL, "
+                           "marked_at TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+    def append(self, student_id, when, marked, details):
+        # Only marks are kept; details (camera, distance, liveness) are for a ledger
+        if marked:
+            with self._lock:
+                self._conn.execute("INSERT INTO pending (student_id, marked_at) VALUES (?, ?)",
+                                   (student_id, when.strftime(TIME_FORMAT)))
+
+    def peek(self, limit):
+        with self._lock:
+            return self._conn.execute("SELECT seq, student_id, marked_at FROM pending ORDER BY seq LIMIT ?",
+                                      (limit,)).fetchall()
+
+    def remove(self, rows):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending WHERE seq = ?", [(row[0],) for row in rows])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class AttendanceSink:
+
+    def __init__(self, backend, journal_path='attendance_journal.db', batch_size=100,
+                 flush_interval=0.5, max_backoff=30.0, journal=None):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        self._owns_journal = journal is None
+        self.journal = journal if journal is not None else SqliteJournal(journal_path)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()  # one batch in flight, or two threads send the same rows
+        self._thread = threading.Thread(target=self._run, name='attendance-sink', daemon=True)
+
+        self.flush_stats = StageStats('attendance')
+        self.flushed_events = 0
+        self.flushed_batches = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread.ident is not None:  # started
+            self._thread.join(timeout=5)
+        if self._thread.is_alive():
+            return  # the writer is still in a round trip; its rows stay journaled
+        if flush:
+            try:
+                while self.flush():
+                    pass
+            except Exception:
+                pass  # still journaled; sent on the next start
+        if self._owns_journal:
+            self.journal.close()
+
+    def mark(self, student_id, when=None, **details):
+        return self.record(student_id, True, when, **details)
+
+    def record(self, student_id, marked, when=None, **details):
+        # details: camera, distance, liveness of the recognition (kept by a ledger journal)
+        when = when or datetime.now()
+        self.journal.append(str(student_id), when, marked, details)
+        if marked and self.pending() >= self.batch_size:
+            self._wakeup.set()
+        return when.strftime(TIME_FORMAT)
+
+    def pending(self):
+        return self.journal.count()
+
+    def flush(self):
+        # Sends one batch; returns the number of journal rows it cleared
+        with self._flush_lock:
+            rows = self.journal.peek(self.batch_size)
+            if not rows:
+                return 0
+
+            updates = {}
+            for _, student_id, marked_at in rows:
+                count, last = updates.get(student_id, (0, marked_at))
+                updates[student_id] = (count + 1, max(last, marked_at))
+
+            start = time.perf_counter()
+            self.backend.apply(updates)
+            self.flush_stats.record(time.perf_counter() - start)
+
+            self.journal.remove(rows)
+            self.flushed_events += len(rows)
+            self.flushed_batches += 1
+            return len(rows)
+
+    def _run(self):
+        backoff = 0.0
+        while not self._stop.is_set():
+            self._wakeup.wait(backoff or self.flush_interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            try:
+                while self.flush() == self.batch_size and not self._stop.is_set():
+                    pass
+                backoff = 0.0
+            except Exception as error:
+                self.errors += 1
+                self.last_error = repr(error)
+                if backoff == 0.0:
+                    traceback.print_exc()
+                backoff = min(self.max_backoff, max(1.0, backoff * 2))
+
+    def stats(self):
+        summary = self.flush_stats.summary()
+        summary.update({
+            'kind': 'attendance_sink',
+            'pending': self.pending(),
+            'flushed_events': self.flushed_events,
+            'flushed_batches': self.flushed_batches,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        })
+        return summary
+
+
+def attendance_lookup(profile_cache, attendance_sink, min_seconds=30, camera=None):
+    # lookup_attendance(id, ...) -> (studentInfo, marked) for the recognition stage.
+    # With the profile cache it rarely touches the network at all. camera, distance and
+    # liveness describe the recognition and are journaled with it.
+    def lookup_attendance(id, camera=camera, distance=None, liveness=None):
+        studentInfo = profile_cache.get(id)
+        if studentInfo is None:
+            return None, False
+        # Answered from the local last-seen index instead of a database read
+        secondsElapsed = profile_cache.seconds_since_seen(id)
+
+        # Prevents marking attendance if it was marked less than a certain time frame (in seconds)
+        if secondsElapsed > min_seconds:      # === THIS IS THE 30-SECOND BUFFER LOGIC ======================
+            # Server-side increment, so two kiosks seeing the same student don't race
+            marked_at = attendance_sink.mark(id, camera=camera, distance=distance, liveness=liveness)
+            profile_cache.note_marked(id, marked_at)
+            studentInfo['last_attendance_time'] = marked_at
+            studentInfo['total_attendance'] += 1
+            return studentInfo, True
+        attendance_sink.record(id, False, camera=camera, distance=distance, liveness=liveness)
+        return studentInfo, False  # Already marked
+    return lookup_attendance
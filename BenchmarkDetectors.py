@@ -0,0 +1,118 @@
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from GalleryFile import load_face_index
+from FaceQuality import QualityGate
+from KioskPipeline import detect_faces, encode_boxes
+from LivenessBackend import load_liveness_model
+
+# Frame latency and accuracy: YOLO + dlib HOG + encode (two detectors) against
+# YOLO boxes fed straight into face_encodings (single pass). Both paths run the
+# kiosk's own encode_boxes: HOG faces paired with the YOLO boxes, and the quality
+# gate unless --no-quality-gate.
+#
+# Samples layout: one folder per student id holding frames or short videos of that
+# student; a folder named "_spoof" holds photo/screen attacks that must never match.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+def iter_samples(folder, every=1):
+    for student_id in sorted(os.listdir(folder)):
+        directory = os.path.join(folder, student_id)
+        if not os.path.isdir(directory):
+            continue
+        expected = None if student_id == '_spoof' else student_id
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(path)
+                if img is not None:
+                    yield expected, img
+            elif name.lower().endswith(VIDEO_EXTENSIONS):
+                cap = cv2.VideoCapture(path)
+                index = 0
+                while True:
+                    success, img = cap.read()
+                    if not success:
+                        break
+                    if index % every == 0:
+                        yield expected, img
+                    index += 1
+                cap.release()
+
+
+class PathResult:
+
+    def __init__(self, name):
+        self.name = name
+        self.times = []
+        self.correct = self.wrong = self.missed = self.frames = 0
+
+    def add(self, seconds, expected, ids):
+        self.frames += 1
+        self.times.append(seconds)
+        ids = {i for i in ids if i is not None}
+        if expected is not None and expected in ids:
+            self.correct += 1
+        elif expected is not None:
+            self.missed += 1
+        if ids - {expected}:
+            self.wrong += 1  # someone else (or anyone, for a spoof) would have been marked
+
+    def row(self):
+        times = np.array(self.times) * 1000 if self.times else np.zeros(1)
+        frames = max(self.frames, 1)
+        return (f"{self.name:>14} {times.mean():8.1f} {np.percentile(times, 50):8.1f} {np.percentile(times, 95):8.1f}"
+                f" {self.correct / frames:8.3f} {self.missed / frames:8.3f} {self.wrong / frames:8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Two-detector vs single-pass recognition benchmark")
+    parser.add_argument('--samples', default='Samples')
+    parser.add_argument('--model', default='../models/n_version_4_75.pt')
+    parser.add_argument('--gallery', default='EncodeFile.gal')
+    parser.add_argument('--confidence', type=float, default=0.6)
+    parser.add_argument('--scale', type=float, default=0.25, help="encode scale for both paths")
+    parser.add_argument('--every', type=int, default=1, help="use every Nth video frame")
+    parser.add_argument('--no-quality-gate', action='store_true', help="encode every face, however poor")
+    args = parser.parse_args()
+
+    yolo_model = load_liveness_model(args.model)
+    face_index = load_face_index(args.gallery)
+    quality_gate = None if args.no_quality_gate else QualityGate()
+    yolo = PathResult('yolo only')
+    two = PathResult('two-detector')
+    single = PathResult('single-pass')
+
+    for expected, img in iter_samples(args.samples, args.every):
+        img = cv2.resize(img, (640, 480))
+        start = time.perf_counter()
+        boxes = detect_faces(yolo_model, img, args.confidence)
+        yolo_time = time.perf_counter() - start
+        yolo.add(yolo_time, None, [])
+        real_boxes = [box for box in boxes if box[4] == "real"]
+        face_boxes, labels = [box[:4] for box in real_boxes], [box[4] for box in real_boxes]
+
+        # Two detectors: HOG finds the faces again, each is paired with a real box
+        # Single pass: the real boxes are the face locations, no HOG pass
+        for result, single_pass in ((two, False), (single, True)):
+            start = time.perf_counter()
+            ids = []
+            if real_boxes:
+                _, encodings, _ = encode_boxes(img, face_boxes, labels, single_pass, args.scale,
+                                               quality_gate=quality_gate)
+                if len(encodings):
+                    ids = face_index.match(encodings)[0]
+            result.add(yolo_time + time.perf_counter() - start, expected, ids)
+
+    print(f"{two.frames} frames")
+    print(f"{'path':>14} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'correct':>8} {'missed':>8} {'wrong':>8}")
+    for result in (yolo, two, single):
+        print(result.row())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from GalleryFile import save_gallery
+
+# Each loader runs in a fresh interpreter so import state and RSS are not shared.
+# Note: the page cache is warm after the files are written; for a true cold start
+# drop caches first (echo 3 > /proc/sys/vm/drop_caches) and pass --no-write.
+PROBE = r'''
+import json, pickle, sys, time
+start = time.perf_counter()
+import numpy as np
+from FaceIndex import FaceIndex
+from GalleryFile import load_gallery
+imported = time.perf_counter()
+
+def memory():
+    fields = {}
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                    fields[key] = int(value.split()[0]) // 1024
+    except OSError:
+        import resource
+        fields['VmRSS'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+    return fields
+
+kind, path = sys.argv[1], sys.argv[2]
+before = memory()
+t0 = time.perf_counter()
+if kind == 'pickle':
+    with open(path, 'rb') as file:
+        encodeListKnown, studentIds = pickle.load(file)
+    face_index = FaceIndex(encodeListKnown, studentIds)
+else:
+    embeddings, sq_norms, ids = load_gallery(path)
+    face_index = FaceIndex(embeddings, ids, sq_norms=sq_norms)
+loaded = time.perf_counter()
+after_load = memory()
+face_index.search(np.zeros((1, face_index.dim), dtype=np.float32), 1)  # touches every page
+queried = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'load_ms': (loaded - t0) * 1000,
+    'first_query_ms': (queried - loaded) * 1000,
+    'rss_before_mb': before.get('VmRSS'),
+    'rss_loaded_mb': after_load.get('VmRSS'),
+    'after_query': memory(),
+}))
+'''
+
+
+def write_files(directory, n, rng):
+    encodeListKnown = [row for row in rng.normal(size=(n, 128)) * 0.09]
+    studentIds = [f"{i:07d}" for i in range(n)]
+    pickle_path = os.path.join(directory, f"gallery_{n}.p")
+    gallery_path = os.path.join(directory, f"gallery_{n}.gal")
+    with open(pickle_path, 'wb') as file:
+        pickle.dump([encodeListKnown, studentIds], file)
+    save_gallery(gallery_path, encodeListKnown, studentIds)
+    return pickle_path, gallery_path
+
+
+def probe(kind, path):
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, '-c', PROBE, kind, path], cwd=here,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and memory: EncodeFile.p vs memory-mapped gallery")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--dir', help="keep the generated files here instead of a temp dir")
+    parser.add_argument('--no-write', action='store_true', help="reuse files already in --dir")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix='gallery_bench_')
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(0)
+
+    print(f"{'ids':>7} {'format':>7} {'file MB':>8} {'load ms':>8} {'1st query ms':>12} "
+          f"{'RSS loaded MB':>13} {'anon MB':>8} {'file-backed MB':>14}")
+    for n in args.sizes:
+        if args.no_write:
+            paths = (os.path.join(directory, f"gallery_{n}.p"), os.path.join(directory, f"gallery_{n}.gal"))
+        else:
+            paths = write_files(directory, n, rng)
+        for kind, path in zip(('pickle', 'gallery'), paths):
+            result = probe(kind, path)
+            after = result['after_query']
+            print(f"{n:>7} {kind:>7} {os.path.getsize(path) / 2 ** 20:>8.1f} {result['load_ms']:>8.1f} "
+                  f"{result['first_query_ms']:>12.1f} {result['rss_loaded_mb'] - result['rss_before_mb']:>13} "
+                  f"{after.get('RssAnon', '-'):>8} {after.get('RssFile', '-'):>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from FaceTracker import greedy_pairs, iou_matrix
+from LivenessBackend import load_liveness_model
+
+# Latency / FPS of the liveness backends on recorded frames, and a parity check of
+# the exported models against the PyTorch checkpoint.
+#   python BenchmarkLiveness.py --frames Samples --onnx n_version_4_75.onnx --parity
+# --parity exits non-zero when an exported model disagrees with PyTorch.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_frames(source, limit=200, size=(640, 480)):
+    # A video file, or a folder (searched recursively) of images and videos
+    paths = [source]
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(source) for name in names)
+    frames = []
+    for path in paths:
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append(cv2.resize(img, size))
+        else:
+            cap = cv2.VideoCapture(path)
+            while len(frames) < limit:
+                success, img = cap.read()
+                if not success:
+                    break
+                frames.append(cv2.resize(img, size))
+            cap.release()
+        if len(frames) >= limit:
+            break
+    return frames[:limit]
+
+
+def time_backend(model, frames, warmup=5):
+    for img in frames[:warmup]:
+        model.detect(img)
+    times, outputs = [], []
+    for img in frames:
+        start = time.perf_counter()
+        outputs.append(model.detect(img))
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000, outputs
+
+
+def compare(reference, candidate, min_conf):
+    # Boxes above min_conf matched by IoU; returns agreement numbers for one backend
+    matched = missing = extra = class_flips = 0
+    ious, conf_diffs = [], []
+    for ref, out in zip(reference, candidate):
+        ref, out = ref[ref[:, 4] > min_conf], out[out[:, 4] > min_conf]
+        iou = iou_matrix(ref[:, :4], out[:, :4])
+        pairs = greedy_pairs(iou, 0.5)
+        matched += len(pairs)
+        missing += len(ref) - len(pairs)
+        extra += len(out) - len(pairs)
+        for row, col in pairs:
+            ious.append(iou[row, col])
+            conf_diffs.append(abs(ref[row, 4] - out[col, 4]))
+            class_flips += int(ref[row, 5] != out[col, 5])
+    total = max(matched + missing, 1)
+    return {
+        'recall': matched / total,
+        'extra': extra,
+        'class_flips': class_flips,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'max_conf_diff': float(np.max(conf_diffs)) if conf_diffs else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Liveness backend latency and parity")
+    parser.add_argument('--frames', default='Samples', help="video file or folder of images/videos")
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--torch', default='../models/n_version_4_75.pt')
+    parser.add_argument('--onnx', help="ONNX model (FP32 or INT8) run with ONNX Runtime")
+    parser.add_argument('--openvino', help="ONNX or OpenVINO IR run with OpenVINO")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--parity', action='store_true', help="compare detections against the PyTorch model")
+    parser.add_argument('--min-conf', type=float, default=0.6, help="parity is checked above the kiosk threshold")
+    parser.add_argument('--min-recall', type=float, default=0.98)
+    parser.add_argument('--min-iou', type=float, default=0.9)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.count)
+    if not frames:
+        raise SystemExit(f"No frames found in {args.frames}")
+
+    backends = [('torch', args.torch)]
+    if args.onnx:
+        backends.append(('onnx', args.onnx))
+    if args.openvino:
+        backends.append(('openvino', args.openvino))
+
+    print(f"{len(frames)} frames, imgsz {args.imgsz}, threads {args.threads or 'default'}")
+    print(f"{'backend':>10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'FPS':>7}")
+    outputs = {}
+    for name, path in backends:
+        model = load_liveness_model(path, name, args.imgsz, args.threads)
+        times, outputs[name] = time_backend(model, frames)
+        print(f"{name:>10} {times.mean():8.1f} {np.percentile(times, 50):8.1f} {np.percentile(times, 95):8.1f}"
+              f" {1000 / times.mean():7.1f}")
+
+    if not args.parity:
+        return
+    failed = False
+    for name, _ in backends[1:]:
+        result = compare(outputs['torch'], outputs[name], args.min_conf)
+        ok = (result['recall'] >= args.min_recall and result['mean_iou'] >= args.min_iou
+              and result['class_flips'] == 0)
+        failed |= not ok
+        print(f"parity {name}: recall {result['recall']:.3f}, extra {result['extra']}, "
+              f"class flips {result['class_flips']}, mean IoU {result['mean_iou']:.3f}, "
+              f"max conf diff {result['max_conf_diff']:.3f} -> {'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
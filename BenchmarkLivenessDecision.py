@@ -0,0 +1,131 @@
+import argparse
+import os
+import cv2
+import numpy as np
+from FaceTracker import FaceTracker
+from KioskPipeline import detect_faces
+from LivenessAggregator import LivenessAggregator
+from LivenessBackend import load_liveness_model
+
+# Decision latency and false accepts of the liveness decision, on recorded clips:
+# the old global label buffer (every box of every frame in one list, 4 of the last
+# 5 labels "real") against the per-face LivenessAggregator.
+#   python BenchmarkLivenessDecision.py --samples Samples --enter 0.7 --exit 0.4
+# Samples layout as for BenchmarkDetectors.py: one folder per student with genuine
+# clips, and "_spoof" with photo/screen attacks that must never be accepted. Each
+# video is one clip; the images of a folder, in name order, are one clip.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+def iter_clips(folder):
+    for name in sorted(os.listdir(folder)):
+        directory = os.path.join(folder, name)
+        if not os.path.isdir(directory):
+            continue
+        genuine = name != '_spoof'
+        files = sorted(os.listdir(directory))
+        images = [cv2.imread(os.path.join(directory, f)) for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+        images = [img for img in images if img is not None]
+        if images:
+            yield genuine, name, images
+        for f in files:
+            if f.lower().endswith(VIDEO_EXTENSIONS):
+                cap = cv2.VideoCapture(os.path.join(directory, f))
+                frames = []
+                while True:
+                    success, img = cap.read()
+                    if not success:
+                        break
+                    frames.append(img)
+                cap.release()
+                yield genuine, f"{name}/{f}", frames
+
+
+def global_buffer(clip_boxes, buffer_size=5):
+    # The old rule; returns per frame whether a real-labelled box was let through
+    real_face_buffer, verified, accepted = [], set(), []
+    tracker = FaceTracker()
+    for index, boxes in enumerate(clip_boxes):
+        for box in boxes:
+            real_face_buffer.append(box[4])
+            if len(real_face_buffer) > buffer_size:
+                real_face_buffer.pop(0)
+        real_face_detected = real_face_buffer.count("real") >= buffer_size - 1
+        tracks = tracker.update([box[:4] for box in boxes], [box[4] for box in boxes], index)
+        if real_face_detected:
+            verified.update(track.track_id for track in tracks if track.label == "real")
+        accepted.append(any(track.track_id in verified for track in tracks))
+    return accepted
+
+
+def per_track(clip_boxes, aggregator):
+    tracker = FaceTracker(liveness=aggregator)
+    accepted = []
+    for index, boxes in enumerate(clip_boxes):
+        tracks = tracker.update([box[:4] for box in boxes], [box[4] for box in boxes], index,
+                                [box[5] for box in boxes])
+        accepted.append(any(track.verified_real for track in tracks))
+    return accepted
+
+
+class RuleResult:
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.missed = self.genuine = 0
+        self.spoof_clips = self.spoof_accepted = 0
+        self.spoof_frames = self.spoof_frames_accepted = 0
+
+    def add(self, genuine, clip_boxes, accepted):
+        seen = [index for index, boxes in enumerate(clip_boxes) if boxes]
+        if genuine:
+            self.genuine += 1
+            if True in accepted and seen:
+                self.latencies.append(accepted.index(True) - seen[0] + 1)
+            else:
+                self.missed += 1
+            return
+        self.spoof_clips += 1
+        self.spoof_accepted += int(any(accepted))
+        self.spoof_frames += len(seen)
+        self.spoof_frames_accepted += sum(accepted)
+
+    def row(self):
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        far = self.spoof_accepted / self.spoof_clips if self.spoof_clips else 0.0
+        frame_far = self.spoof_frames_accepted / self.spoof_frames if self.spoof_frames else 0.0
+        return (f"{self.name:>12} {latencies.mean():9.1f} {np.percentile(latencies, 95):9.1f}"
+                f" {self.missed:>4}/{self.genuine:<4} {far:9.3f} {frame_far:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Liveness decision latency and false accepts")
+    parser.add_argument('--samples', default='Samples')
+    parser.add_argument('--model', default='../models/n_version_4_75.pt')
+    parser.add_argument('--confidence', type=float, default=0.6)
+    parser.add_argument('--window', type=int, default=5)
+    parser.add_argument('--alpha', type=float, default=0.5)
+    parser.add_argument('--enter', type=float, default=0.7)
+    parser.add_argument('--exit', type=float, default=0.4)
+    args = parser.parse_args()
+
+    yolo_model = load_liveness_model(args.model)
+    aggregator = LivenessAggregator(args.window, alpha=args.alpha, enter=args.enter, exit=args.exit)
+    old, new = RuleResult('global'), RuleResult('per-track')
+    for genuine, name, frames in iter_clips(args.samples):
+        clip_boxes = [detect_faces(yolo_model, cv2.resize(img, (640, 480)), args.confidence) for img in frames]
+        old.add(genuine, clip_boxes, global_buffer(clip_boxes, args.window))
+        new.add(genuine, clip_boxes, per_track(clip_boxes, aggregator))
+
+    print(f"{old.genuine} genuine clips, {old.spoof_clips} spoof clips")
+    print("latency: frames from first detection to acceptance (genuine clips)")
+    print("FAR: spoof clips with any accepted face / spoof frames with an accepted face")
+    print(f"{'rule':>12} {'lat mean':>9} {'lat p95':>9} {'missed':>9} {'clip FAR':>9} {'frame FAR':>9}")
+    for result in (old, new):
+        print(result.row())
+
+
+if __name__ == '__main__':
+    main()
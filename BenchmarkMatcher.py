@@ -0,0 +1,131 @@
+import argparse
+import time
+import numpy as np
+from FaceIndex import FaceIndex
+
+try:
+    import face_recognition
+except ImportError:  # dlib is heavy to build; fall back to the same math it uses
+    face_recognition = None
+
+
+def legacy_match(encodeListKnown, encodeFace):
+    # The per-face path main.py used before FaceIndex
+    if face_recognition is not None:
+        matches = face_recognition.compare_faces(encodeListKnown, encodeFace)
+        faceDis = face_recognition.face_distance(encodeListKnown, encodeFace)
+    else:
+        faceDis = np.linalg.norm(np.array(encodeListKnown) - encodeFace, axis=1)
+        matches = list(faceDis <= 0.6)
+    matchIndex = np.argmin(faceDis)
+    return matchIndex if matches[matchIndex] else -1
+
+
+def make_gallery(n, rng):
+    # dlib descriptors sit roughly on a sphere of radius ~1; good enough for timing
+    gallery = rng.normal(size=(n, 128)) * 0.09
+    return [row for row in gallery]
+
+
+def make_conditions(n, conditions, rng):
+    # Per-student appearance modes (lighting, glasses, pose): each student is a base
+    # descriptor plus one offset per mode, ~0.45 apart, so a photo in one mode does not
+    # reliably match an enrollment photo taken in another
+    base = rng.normal(size=(n, 1, 128)) * 0.09
+    return (base + rng.normal(size=(n, conditions, 128)) * 0.04).astype(np.float32)
+
+
+def time_it(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FaceIndex against compare_faces/face_distance")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--faces', type=int, default=4, help="faces per frame")
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--ivf-min', type=int, default=50000, help="also time the IVF mode from this size")
+    parser.add_argument('--per-student', type=int, default=0,
+                        help="enroll this many encodings per student and compare single vs multi enrollment")
+    parser.add_argument('--conditions', type=int, default=6, help="appearance modes per student (--per-student)")
+    parser.add_argument('--shortlist', type=int, default=4, help="identities searched in full by the two-stage mode")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.per_student:
+        per_student(args, rng)
+        return
+    print(f"{'gallery':>8} {'mode':>8} {'ms/frame':>10} {'recall@1':>9}")
+    for n in args.sizes:
+        encodeListKnown = make_gallery(n, rng)
+        studentIds = [str(i) for i in range(n)]
+        truth = rng.integers(0, n, size=(args.frames, args.faces))
+        frames = [np.array([encodeListKnown[t] for t in row]) + rng.normal(size=(args.faces, 128)) * 0.02
+                  for row in truth]
+
+        def run_legacy():
+            return [[legacy_match(encodeListKnown, face) for face in frame] for frame in frames]
+
+        seconds, found = time_it(run_legacy, args.repeats)
+        recall = np.mean(np.array(found) == truth)
+        print(f"{n:>8} {'legacy':>8} {seconds * 1000 / args.frames:>10.3f} {recall:>9.3f}")
+
+        start = time.perf_counter()
+        face_index = FaceIndex(encodeListKnown, studentIds)
+        build = time.perf_counter() - start
+
+        def run_index():
+            return [face_index.search(frame, 1)[0][:, 0] for frame in frames]
+
+        seconds, found = time_it(run_index, args.repeats)
+        recall = np.mean(np.array(found) == truth)
+        print(f"{n:>8} {'exact':>8} {seconds * 1000 / args.frames:>10.3f} {recall:>9.3f}"
+              f"   (build {build * 1000:.1f} ms)")
+
+        if n >= args.ivf_min:
+            start = time.perf_counter()
+            face_index.build_ivf()
+            build = time.perf_counter() - start
+            seconds, found = time_it(run_index, args.repeats)
+            recall = np.mean(np.array(found) == truth)
+            print(f"{n:>8} {'ivf':>8} {seconds * 1000 / args.frames:>10.3f} {recall:>9.3f}"
+                  f"   (build {build * 1000:.1f} ms)")
+            face_index.drop_ivf()
+
+
+def per_student(args, rng):
+    # Sizes are students. Queries come from any mode; enrollment covers the first
+    # --per-student modes. A face counts as recognized when the nearest row has the
+    # right id within the kiosk tolerance (0.6).
+    print(f"{'students':>8} {'mode':>10} {'rows':>8} {'scanned':>8} {'ms/frame':>10} {'recall':>7}")
+    for n in args.sizes:
+        modes = make_conditions(n, max(args.conditions, args.per_student), rng)
+        truth = rng.integers(0, n, size=(args.frames, args.faces))
+        mode = rng.integers(0, args.conditions, size=truth.shape)
+        frames = [modes[row, m] + rng.normal(size=(args.faces, 128)).astype(np.float32) * 0.015
+                  for row, m in zip(truth, mode)]
+        ids = [str(i) for i in range(n) for _ in range(args.per_student)]
+        single = FaceIndex(modes[:, 0], [str(i) for i in range(n)])
+        all_rows = FaceIndex(modes[:, :args.per_student].reshape(-1, 128), ids)
+        two_stage = FaceIndex(all_rows.embeddings, ids)
+        start = time.perf_counter()
+        identities = two_stage.build_identities(args.shortlist)
+        build = time.perf_counter() - start
+
+        for name, face_index, scanned in [('single', single, n), ('all rows', all_rows, len(all_rows)),
+                                          ('two-stage', two_stage, identities.scanned())]:
+            seconds, found = time_it(lambda: [face_index.match(frame)[0] for frame in frames], args.repeats)
+            recall = np.mean(np.array(found, dtype=object) == truth.astype(str))
+            note = f"   (build {build * 1000:.1f} ms)" if name == 'two-stage' else ""
+            print(f"{n:>8} {name:>10} {len(face_index):>8} {scanned:>8.0f} "
+                  f"{seconds * 1000 / args.frames:>10.3f} {recall:>7.3f}{note}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from KioskPipeline import Detections, Frame, KioskUI, Recognition, draw_corners
+
+# Compose time and per-frame allocations of the kiosk renderer, and a pixel check of
+# its persistent-buffer output against the old copy-the-background-every-frame layout.
+#   python BenchmarkRender.py --frames 1000
+# Exits 1 if any frame differs.
+
+
+class LegacyKioskUI(KioskUI):
+    # The layout as it was drawn before the persistent buffer: reference output only
+
+    def compose(self, img, detections=None, event=None):
+        if event is not None and self.counter == 0:
+            self.id = event.student_id
+            self.studentInfo = event.student_info
+            self.counter = 1
+            self.modeType = 1 if event.marked else 3
+
+        frame = self.imgBackground.copy()
+        frame[162:162 + 480, 55:55 + 640] = img
+
+        if detections is not None:
+            for x1, y1, x2, y2, label, conf in detections.boxes:
+                color = (0, 255, 0) if label == "real" else (0, 0, 255)
+                cv2.rectangle(frame, (55 + x1, 162 + y1), (55 + x2, 162 + y2), color, 2)
+        if event is not None:
+            draw_corners(frame, event.face_box)
+
+        if self.counter == 0:
+            self.modeType = 0
+            frame[44:44 + 633, 808:808 + 414] = self.imgModeList[self.modeType]
+            return frame
+
+        if self.modeType != 3:
+            self.modeType = 1 if self.counter <= self.info_frames else 2
+        frame[44:44 + 633, 808:808 + 414] = self.imgModeList[self.modeType]
+        if self.modeType == 1:
+            self.draw_student_info(frame)
+
+        self.counter += 1
+        last = self.info_frames if self.modeType == 3 else self.total_frames
+        if self.counter >= last:
+            self.counter = 0
+            self.modeType = 0
+            self.studentInfo = {}
+            self.id = -1
+            self.liveness_reset.set()
+            self.ui_busy.clear()
+        return frame
+
+
+def scripted_frames(count, seed=0):
+    # Camera frames, boxes (some running off the viewport) and recognitions at fixed points
+    rng = np.random.default_rng(seed)
+    camera = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(8)]
+    names = ["Ada Lovelace", "Alan Turing", "Grace Brewster Murray Hopper, Rear Admiral, United States Navy"]
+    script = []
+    for index in range(count):
+        frame = Frame(index, 0.0, camera[index % len(camera)])
+        boxes = []
+        for _ in range(int(rng.integers(0, 3))):
+            x1, y1 = int(rng.integers(-40, 600)), int(rng.integers(-40, 440))
+            w, h = int(rng.integers(5, 200)), int(rng.integers(5, 200))
+            boxes.append((x1, y1, x1 + w, y1 + h, ("fake", "real")[int(rng.integers(0, 2))], 0.9))
+        detections = Detections(frame, boxes)
+        event = None
+        if index % 90 == 5 and boxes:
+            name = names[(index // 90) % len(names)]
+            info = {'name': name, 'major': 'Physics', 'total_attendance': index, 'standing': 'G',
+                    'year': 3, 'starting_year': 2021}
+            event = Recognition(frame, str(index), info, (index // 90) % 4 != 3, boxes[0][:4])
+        script.append((frame.img, detections, event))
+    return script
+
+
+def run(ui_class, imgBackground, imgModeList, script, check=None):
+    ui = ui_class(imgBackground, imgModeList, threading.Event(), threading.Event())
+    times, outputs = [], []
+    for img, detections, event in script:
+        start = time.perf_counter()
+        output = ui.compose(img, detections, event)
+        times.append(time.perf_counter() - start)
+        if check is not None:
+            outputs.append(output.copy())
+    return np.array(times) * 1000, outputs, ui
+
+
+def allocations(ui_class, imgBackground, imgModeList, script):
+    # Bytes allocated per compose() call (numpy buffers are traced by tracemalloc)
+    ui = ui_class(imgBackground, imgModeList, threading.Event(), threading.Event())
+    ui.compose(*script[0])
+    tracemalloc.start()
+    allocated = []
+    for img, detections, event in script[1:]:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        output = ui.compose(img, detections, event)
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        del output
+    tracemalloc.stop()
+    return np.array(allocated)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiosk renderer benchmark and pixel check")
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    imgBackground = cv2.imread('Resources/background.png')
+    folderModePath = 'Resources/Modes'
+    imgModeList = [cv2.imread(os.path.join(folderModePath, path)) for path in sorted(os.listdir(folderModePath))]
+    script = scripted_frames(args.frames, args.seed)
+
+    legacy_times, legacy_out, _ = run(LegacyKioskUI, imgBackground, imgModeList, script, check=True)
+    times, out, ui = run(KioskUI, imgBackground, imgModeList, script, check=True)
+    mismatches = [index for index, (a, b) in enumerate(zip(legacy_out, out)) if not np.array_equal(a, b)]
+
+    print(f"{len(script)} frames, {ui.recognitions} recognitions, panel written on {ui.panel_writes} frames")
+    print(f"{'renderer':>10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'KB alloc/frame':>15}")
+    for name, ui_class, result in (('copy', LegacyKioskUI, legacy_times), ('buffer', KioskUI, times)):
+        allocated = allocations(ui_class, imgBackground, imgModeList, script) / 1024
+        print(f"{name:>10} {result.mean():8.3f} {np.percentile(result, 50):8.3f} {np.percentile(result, 95):8.3f}"
+              f" {allocated.mean():15.1f}")
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} frames differ from the reference layout, first at {mismatches[0]}")
+        sys.exit(1)
+    print("pixel-identical to the reference layout")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import pickle
+import sys
+from GalleryFile import save_gallery, load_gallery
+
+# One-shot converter from the old EncodeFile.p pickle to the memory-mapped gallery
+# usage: python ConvertEncodeFile.py [EncodeFile.p] [EncodeFile.gal]
+source = sys.argv[1] if len(sys.argv) > 1 else 'EncodeFile.p'
+target = sys.argv[2] if len(sys.argv) > 2 else 'EncodeFile.gal'
+
+print(f"Loading {source} ...")
+with open(source, 'rb') as file:
+    encodeListKnown, studentIds = pickle.load(file)
+
+save_gallery(target, encodeListKnown, studentIds)
+
+# Read it back so a bad conversion is caught here and not on the kiosk
+embeddings, _, ids = load_gallery(target)
+assert ids == [str(i) for i in studentIds]
+assert all(abs(embeddings[i] - encodeListKnown[i]).max() < 1e-6 for i in range(len(ids)))
+print(f"Saved {len(ids)} identities ({embeddings.shape[1]}-d) to {target}")
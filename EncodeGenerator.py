@@ -1,38 +1,243 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import cv2
+import numpy as np
 import face_recognition
-import pickle
-import os
+from GalleryFile import save_gallery, load_gallery
+
+# Incremental enrollment: only new or changed images in Images/ are encoded.
+# EncodeManifest.json remembers, per image path, its mtime/size/content hash,
+# the student id, the encode status and its row in the gallery.
+# A student is either one image Images/<id>.png or a folder Images/<id>/ of photos in
+# different conditions. Every photo gives one encoding; encodings further than
+# --outlier-distance from the student's median encoding (another person, a bad crop)
+# are pruned, and at most --max-per-student are kept, chosen to cover the spread.
+# Pruned encodings stay in the manifest so each run re-decides with all photos.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def file_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def encode_image(job):
+    # Runs in a worker process: read, hash, decode and encode one image.
+    path, known_hash = job
+    timings = {}
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError as error:
+        return path, 'unreadable', None, None, str(error), timings
+    digest = file_hash(data)
+    timings['read'] = time.perf_counter() - start
+    if digest == known_hash:
+        # Only the mtime changed (copied or touched); keep the old encoding
+        return path, 'unchanged', digest, None, None, timings
+
+    start = time.perf_counter()
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    timings['decode'] = time.perf_counter() - start
+    if img is None:
+        return path, 'unreadable', digest, None, "not a decodable image", timings
+
+    start = time.perf_counter()
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(img)
+    timings['encode'] = time.perf_counter() - start
+    if not encodings:
+        return path, 'no_face', digest, None, "no face found", timings
+    return path, 'ok', digest, encodings[0], None, timings
+
+
+def load_manifest(manifest_path, gallery_path):
+    if not os.path.exists(manifest_path):
+        return {}, None
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    entries = manifest.get('images', {})
+
+    # Rows are only trusted if the gallery is the exact file this manifest was written with
+    gallery = manifest.get('gallery')
+    if gallery and os.path.exists(gallery_path):
+        stat = os.stat(gallery_path)
+        if gallery == {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+            # Copied out of the mapping: the gallery file is replaced at the end of the run
+            return entries, np.array(load_gallery(gallery_path)[0])
+    print("Gallery does not match the manifest; re-encoding everything")
+    return {}, None
+
+
+def old_encoding(entry, old_embeddings):
+    # Unchanged image: its gallery row, or the manifest copy if it was pruned
+    if entry.get('row') is None:
+        return np.array(entry['encoding'], dtype=np.float32)
+    return old_embeddings[entry['row']]
+
+
+def save_manifest(manifest_path, gallery_path, entries):
+    stat = os.stat(gallery_path)
+    manifest = {
+        'version': 1,
+        'gallery': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+        'images': entries,
+    }
+    tmp_path = f"{manifest_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def scan_images(folderPath):
+    found = {}
+    for name in sorted(os.listdir(folderPath)):
+        path = os.path.join(folderPath, name)
+        if os.path.isdir(path):
+            photos = [(os.path.join(path, photo), name) for photo in sorted(os.listdir(path))]
+        else:
+            photos = [(path, os.path.splitext(name)[0])]
+        for photo, student_id in photos:
+            if photo.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(photo):
+                stat = os.stat(photo)
+                found[photo] = {'id': student_id, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return found
+
+
+def select_encodings(encodings, max_per_student=8, outlier_distance=0.45):
+    # One student's encodings -> (indices to keep, {index: 'outlier' or 'cap'})
+    encodings = np.asarray(encodings, dtype=np.float32)
+    distances = np.linalg.norm(encodings - np.median(encodings, axis=0), axis=1)
+    nearest = int(np.argmin(distances))
+    inliers = [i for i in range(len(encodings)) if distances[i] <= outlier_distance or i == nearest]
+    dropped = {i: 'outlier' for i in range(len(encodings)) if i not in inliers}
+    # Greedy farthest point from the most typical photo: the kept ones span the conditions
+    kept = [nearest]
+    spread = np.linalg.norm(encodings[inliers] - encodings[nearest], axis=1)
+    while len(kept) < min(max_per_student, len(inliers)):
+        choice = int(np.argmax(spread))
+        kept.append(inliers[choice])
+        spread = np.minimum(spread, np.linalg.norm(encodings[inliers] - encodings[inliers[choice]], axis=1))
+    dropped.update({i: 'cap' for i in inliers if i not in kept})
+    return sorted(kept), dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode student images into EncodeFile.gal")
+    parser.add_argument('--images', default='Images')
+    parser.add_argument('--gallery', default='EncodeFile.gal')
+    parser.add_argument('--manifest', default='EncodeManifest.json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--full', action='store_true', help="ignore the manifest and re-encode every image")
+    parser.add_argument('--max-per-student', type=int, default=8, help="encodings kept per student")
+    parser.add_argument('--outlier-distance', type=float, default=0.45,
+                        help="prune encodings further than this from the student's median encoding")
+    args = parser.parse_args()
+
+    stage = {}
+    start = time.perf_counter()
+    old_entries, old_embeddings = ({}, None) if args.full else load_manifest(args.manifest, args.gallery)
+    found = scan_images(args.images)
+    stage['scan'] = time.perf_counter() - start
+
+    # Unchanged size and mtime: trust the manifest. Otherwise hand it to a worker,
+    # which skips the encode if the content hash turns out to be the same.
+    entries, jobs = {}, []
+    for path, info in found.items():
+        old = old_entries.get(path)
+        if old and old['size'] == info['size'] and old['mtime_ns'] == info['mtime_ns']:
+            entries[path] = old
+        else:
+            jobs.append((path, old['sha1'] if old and old.get('status') == 'ok' else None))
+    removed = sorted(set(old_entries) - set(found))
+
+    print(f"{len(found)} images: {len(found) - len(jobs)} unchanged, {len(jobs)} to check, {len(removed)} removed")
+    for path in removed:
+        print(f"  removed {old_entries[path]['id']} ({path})")
+
+    new_encodings = {}
+    failures = []
+    worker_time = {'read': 0.0, 'decode': 0.0, 'encode': 0.0}
+    start = time.perf_counter()
+    if jobs:
+        print("Encoding Started ...")
+        # Workers read images themselves, so nothing is preloaded in this process
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as executor:
+            for done, (path, status, digest, encoding, error, timings) in enumerate(
+                    executor.map(encode_image, jobs, chunksize=4), 1):
+                for key, value in timings.items():
+                    worker_time[key] += value
+                entry = dict(found[path], sha1=digest, status=status)
+                if status == 'unchanged':
+                    entry['status'] = 'ok'
+                    entry['row'] = old_entries[path]['row']
+                    if 'encoding' in old_entries[path]:
+                        entry['encoding'] = old_entries[path]['encoding']
+                elif status == 'ok':
+                    new_encodings[path] = encoding
+                else:
+                    entry['error'] = error
+                    failures.append((path, error))
+                entries[path] = entry
+                if done % 50 == 0:
+                    print(f"  {done}/{len(jobs)}")
+    stage['encode'] = time.perf_counter() - start
+
+    # Merge: unchanged encodings come from the old gallery (or the manifest, if they
+    # were pruned), new ones from the workers; then each student's set is re-selected
+    start = time.perf_counter()
+    by_student = {}
+    for path in sorted(entries):
+        entry = entries[path]
+        if entry['status'] != 'ok':
+            continue
+        encoding = new_encodings[path] if path in new_encodings else old_encoding(entry, old_embeddings)
+        by_student.setdefault(entry['id'], []).append((path, np.asarray(encoding, dtype=np.float32)))
+    dropped_counts = {'outlier': 0, 'cap': 0}
+    kept = {}
+    for student_id, photos in by_student.items():
+        _, dropped = select_encodings([encoding for _, encoding in photos], args.max_per_student,
+                                         args.outlier_distance)
+        for index, (path, encoding) in enumerate(photos):
+            entry = entries[path]
+            entry.pop('dropped', None)
+            entry.pop('encoding', None)
+            entry['row'] = None
+            if index in dropped:
+                entry['dropped'] = dropped[index]
+                entry['encoding'] = [round(float(value), 7) for value in encoding]
+                dropped_counts[dropped[index]] += 1
+                if dropped[index] == 'outlier':
+                    print(f"  pruned {path}: too far from the other photos of {student_id}")
+            else:
+                kept[path] = encoding
+    encodeListKnown, studentIds = [], []
+    for path in sorted(entries):
+        entry = entries[path]
+        if path not in kept:
+            continue
+        encodeListKnown.append(kept[path])
+        entry['row'] = len(studentIds)
+        studentIds.append(entry['id'])
+    save_gallery(args.gallery, np.array(encodeListKnown, dtype=np.float32).reshape(-1, 128), studentIds)
+    save_manifest(args.manifest, args.gallery, entries)
+    stage['merge'] = time.perf_counter() - start
+    print("File Saved")
+
+    for path, error in failures:
+        print(f"  skipped {path}: {error}")
+    total = sum(stage.values())
+    print(f"{len(studentIds)} encodings of {len(by_student)} students in gallery, {len(new_encodings)} new, "
+          f"{len(failures)} failed, {dropped_counts['outlier']} pruned as outliers, "
+          f"{dropped_counts['cap']} over the per-student cap")
+    print(f"{len(jobs) / stage['encode'] if jobs else 0:.1f} images/s over {len(jobs)} images, total {total:.2f} s")
+    print("stages (wall): " + ", ".join(f"{k} {v:.2f} s" for k, v in stage.items()))
+    print("workers (cpu): " + ", ".join(f"{k} {v:.2f} s" for k, v in worker_time.items()))
+
 
-# Importing student images
-folderPath = 'Images'
-pathList = os.listdir(folderPath)
-print(pathList)
-imgList = []
-studentIds = []
-for path in pathList:
-    imgList.append(cv2.imread(os.path.join(folderPath, path)))
-    studentIds.append(os.path.splitext(path)[0])
-    # print(path)
-    # print(os.path.splitext(path)[0])
-print(studentIds)
-
-
-def findEncodings(imagesList):
-    encodeList = []
-    for img in imagesList:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        encode = face_recognition.face_encodings(img)[0]
-        encodeList.append(encode)
-
-    return encodeList
-
-
-print("Encoding Started ...")
-encodeListKnown = findEncodings(imgList)
-encodeListKnownWithIds = [encodeListKnown, studentIds]
-print("Encoding Complete")
-
-file = open("EncodeFile.p", 'wb')
-pickle.dump(encodeListKnownWithIds, file)
-file.close()
-print("File Saved")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import re
+from LivenessBackend import _ExportedBackend
+from BenchmarkLiveness import load_frames
+
+# Export the anti-spoofing checkpoint to ONNX, optionally with INT8 static
+# quantization calibrated on sample frames (a folder of images and/or videos).
+# The result runs with LivenessBackend.OnnxBackend or OpenVinoBackend.
+
+
+class FrameReader:
+    # onnxruntime CalibrationDataReader over the sample frames
+
+    def __init__(self, frames, input_name, imgsz):
+        self.preprocess = _ExportedBackend(imgsz).preprocess
+        self.input_name = input_name
+        self.frames = iter(frames)
+
+    def get_next(self):
+        img = next(self.frames, None)
+        if img is None:
+            return None
+        return {self.input_name: self.preprocess(img)[0]}
+
+
+def head_nodes(onnx_path):
+    # Nodes of the detection head (the last /model.N/ block) stay in float: quantizing
+    # the box decode costs far more accuracy than it saves time
+    import onnx
+    graph = onnx.load(onnx_path).graph
+    blocks = [int(m.group(1)) for node in graph.node for m in [re.match(r'^/model\.(\d+)/', node.name)] if m]
+    if not blocks:
+        return []
+    prefix = f"/model.{max(blocks)}/"
+    return [node.name for node in graph.node if node.name.startswith(prefix)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the liveness model to ONNX (optionally INT8)")
+    parser.add_argument('--model', default='../models/n_version_4_75.pt')
+    parser.add_argument('--imgsz', type=int, nargs='+', default=[640], help="square size or height width")
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--int8', action='store_true', help="also write a statically quantized model")
+    parser.add_argument('--calib', default='CalibrationFrames', help="frames used to calibrate INT8 ranges")
+    parser.add_argument('--calib-count', type=int, default=200)
+    parser.add_argument('--quantize-head', action='store_true', help="quantize the detection head too")
+    parser.add_argument('--dynamic', action='store_true',
+                        help="dynamic batch axis, so MultiCameraServer.py runs all streams in one call")
+    args = parser.parse_args()
+    imgsz = args.imgsz[0] if len(args.imgsz) == 1 else tuple(args.imgsz)
+
+    from ultralytics import YOLO
+    onnx_path = YOLO(args.model).export(format='onnx', imgsz=imgsz, opset=args.opset, simplify=True,
+                                               dynamic=args.dynamic)
+    print(f"Exported {onnx_path}")
+    if not args.int8:
+        return
+
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    frames = load_frames(args.calib, args.calib_count)
+    if not frames:
+        raise SystemExit(f"No calibration frames found in {args.calib}")
+    base = os.path.splitext(onnx_path)[0]
+    prepared_path = f"{base}_prep.onnx"
+    int8_path = f"{base}_int8.onnx"
+    quant_pre_process(onnx_path, prepared_path)
+
+    input_name = ort.InferenceSession(prepared_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    quantize_static(prepared_path, int8_path, FrameReader(frames, input_name, imgsz),
+                    quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8, per_channel=True,
+                    nodes_to_exclude=[] if args.quantize_head else head_nodes(prepared_path))
+    os.remove(prepared_path)
+    print(f"Quantized with {len(frames)} frames: {int8_path}")
+    print(f"Check it with: python BenchmarkLiveness.py --parity --onnx {int8_path}")
+
+
+if __name__ == '__main__':
+    main()
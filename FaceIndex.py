@@ -0,0 +1,247 @@
+import numpy as np
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+
+# Upper bound on the number of distances computed per matrix product
+QUERY_CHUNK_ELEMENTS = 1 << 22
+
+
+class FaceIndex:
+    # Gallery of known face encodings kept as one contiguous float32 matrix.
+    # Squared norms are precomputed so a whole frame of faces is matched with a
+    # single matrix product: |q - g|^2 = |q|^2 + |g|^2 - 2 q.g
+
+    def __init__(self, encodings, ids, sq_norms=None, dim=128):
+        self.ids = list(ids)
+        embeddings = np.asarray(encodings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(self.ids), dim)
+        if len(embeddings) != len(self.ids):
+            raise ValueError(f"{len(embeddings)} encodings but {len(self.ids)} ids")
+        self.embeddings = np.ascontiguousarray(embeddings)
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings)
+        self.sq_norms = np.asarray(sq_norms, dtype=np.float32)
+        self.dim = self.embeddings.shape[1]
+        self.ivf = None
+        self.identities = None
+        self._buffers = None  # growable copies, once add() is used
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _as_queries(self, queries):
+        q = np.asarray(queries, dtype=np.float32)
+        return q.reshape(-1, self.dim)
+
+    def _exact(self, q, rows=None):
+        # Squared distances, shape (len(q), len(rows or gallery))
+        gallery = self.embeddings if rows is None else self.embeddings[rows]
+        norms = self.sq_norms if rows is None else self.sq_norms[rows]
+        d2 = q @ gallery.T
+        d2 *= -2.0
+        d2 += norms
+        d2 += np.einsum('ij,ij->i', q, q)[:, None]
+        np.maximum(d2, 0.0, out=d2)
+        return d2
+
+    def search(self, queries, k=1):
+        # Returns (indices, distances), both shaped (n_queries, k), nearest first.
+        # Rows with fewer than k candidates are padded with index -1 / distance inf.
+        q = self._as_queries(queries)
+        if len(q) == 0 or len(self) == 0:
+            return (np.full((len(q), k), -1, dtype=np.int64),
+                    np.full((len(q), k), np.inf, dtype=np.float32))
+        if self.ivf is not None:
+            return self.ivf.search(q, k)
+        if self.identities is not None:
+            return self.identities.search(q, k)
+
+        # Chunk the queries so the distance matrix stays bounded for big batches
+        chunk = max(1, QUERY_CHUNK_ELEMENTS // len(self))
+        if len(q) <= chunk:
+            return _top_k(self._exact(q), k)
+        parts = [_top_k(self._exact(q[i:i + chunk]), k) for i in range(0, len(q), chunk)]
+        return (np.concatenate([p[0] for p in parts]),
+                np.concatenate([p[1] for p in parts]))
+
+    def match(self, queries, tolerance=DEFAULT_TOLERANCE):
+        # Best id per query, or None when the nearest encoding is further than
+        # the tolerance (the compare_faces rule). Returns (ids, distances).
+        indices, distances = self.search(queries, 1)
+        ids = []
+        for index, distance in zip(indices[:, 0], distances[:, 0]):
+            ids.append(self.ids[index] if index >= 0 and distance <= tolerance else None)
+        return ids, distances[:, 0]
+
+    def build_ivf(self, n_lists=None, n_probe=8, iterations=10, seed=0):
+        # Approximate mode for large galleries (100k+): an inverted file over a
+        # k-means coarse quantizer. Only the n_probe closest lists are scanned.
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(self))))
+        self.ivf = _IVF(self, n_lists, n_probe, iterations, seed)
+        return self.ivf
+
+    def drop_ivf(self):
+        self.ivf = None
+
+    def build_identities(self, shortlist=4):
+        # Two-stage mode for galleries with several encodings per student: one centroid
+        # per identity is searched first, then only the encodings of the `shortlist`
+        # nearest identities. Query cost stays close to one vector per student.
+        self.identities = _Identities(self, shortlist)
+        return self.identities
+
+    def add(self, encodings, ids):
+        # Appends encodings (e.g. live captures). The first call copies the gallery out
+        # of its memory map into buffers with spare room, so later calls are cheap.
+        new = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        ids = [str(i) for i in ids]
+        if len(new) != len(ids):
+            raise ValueError(f"{len(new)} encodings but {len(ids)} ids")
+        start, end = len(self.ids), len(self.ids) + len(new)
+        if self._buffers is None or len(self._buffers[0]) < end:
+            capacity = end + max(64, end // 4)
+            embeddings = np.empty((capacity, self.dim), dtype=np.float32)
+            sq_norms = np.empty(capacity, dtype=np.float32)
+            embeddings[:start] = self.embeddings
+            sq_norms[:start] = self.sq_norms
+            self._buffers = (embeddings, sq_norms)
+        embeddings, sq_norms = self._buffers
+        embeddings[start:end] = new
+        sq_norms[start:end] = np.einsum('ij,ij->i', new, new)
+        self.embeddings, self.sq_norms = embeddings[:end], sq_norms[:end]
+        self.ids.extend(ids)
+        rows = np.arange(start, end)
+        if self.identities is not None:
+            self.identities.add(rows)
+        if self.ivf is not None:
+            self.ivf.add(rows)
+        return rows
+
+
+def _top_k(d2, k):
+    n, m = d2.shape
+    k_eff = min(k, m)
+    if k_eff == 1:
+        idx = np.argmin(d2, axis=1)[:, None]
+    else:
+        idx = np.argpartition(d2, k_eff - 1, axis=1)[:, :k_eff]
+        order = np.argsort(np.take_along_axis(d2, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    dist = np.sqrt(np.take_along_axis(d2, idx, axis=1))
+    if k_eff < k:
+        idx = np.pad(idx, ((0, 0), (0, k - k_eff)), constant_values=-1)
+        dist = np.pad(dist, ((0, 0), (0, k - k_eff)), constant_values=np.inf)
+    return idx.astype(np.int64), dist.astype(np.float32)
+
+
+class _IVF:
+
+    def __init__(self, index, n_lists, n_probe, iterations, seed):
+        self.index = index
+        self.n_probe = min(n_probe, n_lists)
+        self.centroids = _kmeans(index.embeddings, n_lists, iterations, seed)
+        self.centroid_index = FaceIndex(self.centroids, range(len(self.centroids)))
+        assignment, _ = self.centroid_index.search(index.embeddings, 1)
+        assignment = assignment[:, 0]
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def add(self, rows):
+        assignment, _ = self.centroid_index.search(self.index.embeddings[rows], 1)
+        for row, j in zip(rows, assignment[:, 0]):
+            self.lists[j] = np.append(self.lists[j], row)
+
+    def search(self, q, k):
+        probes, _ = self.centroid_index.search(q, self.n_probe)
+        indices = np.full((len(q), k), -1, dtype=np.int64)
+        distances = np.full((len(q), k), np.inf, dtype=np.float32)
+        for i, lists in enumerate(probes):
+            rows = np.concatenate([self.lists[j] for j in lists if j >= 0])
+            if len(rows) == 0:
+                continue
+            d2 = self.index._exact(q[i:i + 1], rows)
+            idx, dist = _top_k(d2, k)
+            found = idx[0] >= 0
+            indices[i, found] = rows[idx[0, found]]
+            distances[i, found] = dist[0, found]
+        return indices, distances
+
+
+class _Identities:
+
+    def __init__(self, index, shortlist):
+        self.index = index
+        self.shortlist = shortlist
+        names, inverse = np.unique(np.array(index.ids, dtype=object), return_inverse=True)
+        self.names = list(names)
+        self.position = {name: j for j, name in enumerate(self.names)}
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+        self.rows = [order[bounds[j]:bounds[j + 1]] for j in range(len(names))]
+        self.counts = np.diff(bounds)
+        # Per-identity sums, one reshape-and-sum per distinct count (reduceat over
+        # rows is several times slower)
+        self.sums = np.empty((len(names), index.dim))
+        for count in np.unique(self.counts):
+            members = np.flatnonzero(self.counts == count)
+            rows = order[(bounds[members][:, None] + np.arange(count)).ravel()]
+            grouped = index.embeddings[rows].reshape(len(members), count, -1)
+            self.sums[members] = grouped.sum(axis=1, dtype=np.float64)
+        self.centroid_index = FaceIndex((self.sums / self.counts[:, None]).astype(np.float32), self.names)
+
+    def add(self, rows):
+        # New rows update their identity's centroid (or start a new identity)
+        for row in rows:
+            name = self.index.ids[row]
+            embedding = self.index.embeddings[row]
+            j = self.position.get(name)
+            if j is None:
+                self.position[name] = j = len(self.names)
+                self.names.append(name)
+                self.rows.append(np.array([row]))
+                self.counts = np.append(self.counts, 1)
+                self.sums = np.vstack([self.sums, embedding[None].astype(np.float64)])
+                self.centroid_index = FaceIndex((self.sums / self.counts[:, None]).astype(np.float32), self.names)
+                continue
+            self.rows[j] = np.append(self.rows[j], row)
+            self.counts[j] += 1
+            self.sums[j] += embedding
+            centroid = (self.sums[j] / self.counts[j]).astype(np.float32)
+            self.centroid_index.embeddings[j] = centroid
+            self.centroid_index.sq_norms[j] = centroid @ centroid
+
+    def search(self, q, k):
+        candidates, _ = self.centroid_index.search(q, min(self.shortlist, len(self.names)))
+        indices = np.full((len(q), k), -1, dtype=np.int64)
+        distances = np.full((len(q), k), np.inf, dtype=np.float32)
+        for i, shortlist in enumerate(candidates):
+            rows = np.concatenate([self.rows[j] for j in shortlist if j >= 0])
+            d2 = self.index._exact(q[i:i + 1], rows)
+            idx, dist = _top_k(d2, k)
+            found = idx[0] >= 0
+            indices[i, found] = rows[idx[0, found]]
+            distances[i, found] = dist[0, found]
+        return indices, distances
+
+    def scanned(self):
+        # Vectors compared per query: every centroid plus the shortlisted identities' rows
+        return len(self.names) + self.shortlist * float(np.mean(self.counts))
+
+
+def _kmeans(data, k, iterations, seed):
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment, _ = FaceIndex(centroids, range(k)).search(data, 1)
+        assignment = assignment[:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        counts = np.bincount(assignment, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
@@ -0,0 +1,156 @@
+import json
+import math
+import threading
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+from LazyImport import lazy_import
+
+face_recognition = lazy_import('face_recognition')
+
+# Pre-encode quality gate. Every face about to go through the dlib ResNet encoder is
+# scored on the scaled image the encoder sees; faces that are too small, blurred,
+# badly lit or turned away are skipped (their track retries on a later frame).
+# Cheap checks run first and the first failing one is the reason:
+#   size        shorter side of the face in the scaled image (px)
+#   brightness  mean gray level of the face
+#   contrast    gray-level standard deviation of the face
+#   blur        variance of the Laplacian of the face (low = blurred)
+#   pose        5-point landmarks: yaw = nose offset along the eye line and pitch =
+#               nose distance below it, both per eye distance; roll = eye-line angle
+# score() is plain data, so it also runs in MultiCameraServer's encoding workers.
+# note() counts the decisions and, with log_path, appends one JSON line per face
+# with its scores and the match that followed, for tuning the thresholds.
+FaceQuality = namedtuple('FaceQuality', 'row size brightness contrast blur yaw pitch roll passed reason')
+
+
+class QualityGate:
+
+    def __init__(self, min_size=20, brightness=(40, 220), min_contrast=12.0, min_blur=15.0, max_yaw=0.35,
+                 max_roll=25.0, pitch=None, use_pose=True, enforce=True, log_path=None):
+        self.min_size = min_size
+        self.brightness = brightness        # (lowest, highest) mean gray level
+        self.min_contrast = min_contrast
+        self.min_blur = min_blur
+        self.max_yaw = max_yaw              # |nose offset| / eye distance
+        self.max_roll = max_roll            # degrees
+        self.pitch = pitch                  # optional (lowest, highest) nose drop / eye distance
+        self.use_pose = use_pose
+        self.enforce = enforce              # False: score and log, but encode everything
+        self.log_path = log_path
+        self._log = None
+        self._lock = threading.Lock()
+
+        self.scored = 0
+        self.passed = 0
+        self.skipped = {}
+        self.matched = 0
+        self.unmatched = 0
+
+    def __getstate__(self):
+        # Workers get the thresholds only
+        state = self.__dict__.copy()
+        state['_log'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def score(self, imgS, location, row=0):
+        # imgS: the RGB image given to face_encodings; location: (top, right, bottom, left)
+        top, right, bottom, left = location
+        size = min(bottom - top, right - left)
+        yaw = pitch = roll = None
+        if size < self.min_size:
+            return FaceQuality(row, size, None, None, None, yaw, pitch, roll, False, 'size')
+        gray = cv2.cvtColor(imgS[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+        brightness, contrast = (float(value[0][0]) for value in cv2.meanStdDev(gray))
+        blur = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        reason = None
+        if not self.brightness[0] <= brightness <= self.brightness[1]:
+            reason = 'brightness'
+        elif contrast < self.min_contrast:
+            reason = 'contrast'
+        elif blur < self.min_blur:
+            reason = 'blur'
+        elif self.use_pose:
+            yaw, pitch, roll = self.pose(imgS, location)
+            if yaw is None:
+                reason = 'landmarks'
+            elif abs(yaw) > self.max_yaw or abs(roll) > self.max_roll or (
+                    self.pitch is not None and not self.pitch[0] <= pitch <= self.pitch[1]):
+                reason = 'pose'
+        return FaceQuality(row, size, brightness, contrast, blur, yaw, pitch, roll, reason is None, reason)
+
+    def pose(self, imgS, location):
+        landmarks = face_recognition.face_landmarks(imgS, [location], model='small')
+        if not landmarks:
+            return None, None, None
+        points = landmarks[0]
+        eyes = sorted([np.mean(points['left_eye'], axis=0), np.mean(points['right_eye'], axis=0)],
+                      key=lambda eye: eye[0])
+        nose = np.asarray(points['nose_tip'][0], dtype=np.float64)
+        axis = eyes[1] - eyes[0]
+        distance = float(np.hypot(*axis))
+        if distance < 1:
+            return None, None, None
+        axis /= distance
+        offset = nose - (eyes[0] + eyes[1]) / 2
+        yaw = float(offset @ axis) / distance
+        pitch = float(axis[0] * offset[1] - axis[1] * offset[0]) / distance
+        roll = math.degrees(math.atan2(axis[1], axis[0]))
+        return yaw, pitch, roll
+
+    def filter(self, imgS, locations, rows=None):
+        # -> (indices of the locations to encode, FaceQuality of every location)
+        rows = range(len(locations)) if rows is None else rows
+        qualities = [self.score(imgS, location, row) for location, row in zip(locations, rows)]
+        keep = [index for index, quality in enumerate(qualities) if quality.passed or not self.enforce]
+        return keep, qualities
+
+    def note(self, qualities, matches=None, source=None):
+        # matches: {row: (identity, distance)} of the faces that were encoded
+        matches = matches or {}
+        with self._lock:
+            for quality in qualities:
+                self.scored += 1
+                if quality.passed:
+                    self.passed += 1
+                else:
+                    self.skipped[quality.reason] = self.skipped.get(quality.reason, 0) + 1
+                identity, distance = matches.get(quality.row, (None, None))
+                if quality.row in matches:
+                    if identity is None:
+                        self.unmatched += 1
+                    else:
+                        self.matched += 1
+                if self.log_path:
+                    if self._log is None:
+                        self._log = open(self.log_path, 'a', buffering=1)
+                    entry = dict(quality._asdict(), time=round(time.time(), 3), source=source,
+                                 encoded=quality.row in matches, identity=identity,
+                                 distance=None if distance is None else round(float(distance), 4))
+                    del entry['row']
+                    self._log.write(json.dumps(entry) + '\n')
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def stats(self):
+        with self._lock:
+            encoded = self.matched + self.unmatched
+            return {
+                'stage': 'quality',
+                'kind': 'quality',
+                'scored': self.scored,
+                'passed': self.passed,
+                'skipped': dict(self.skipped),
+                'encoded': encoded,
+                'unmatched': self.unmatched,
+                'unmatched_ratio': self.unmatched / encoded if encoded else 0.0,
+            }
@@ -0,0 +1,156 @@
+import numpy as np
+from LivenessAggregator import LivenessAggregator
+
+# IoU tracker for face boxes. A track keeps the identity (and match distance) from
+# its last encoding, so the same person in front of the camera is only re-encoded
+# when the track is new, the last match was not confident, or a refresh is due.
+
+
+class Track:
+
+    def __init__(self, track_id, box, label, frame_index, liveness):
+        self.track_id = track_id
+        self.box = box                # (x1, y1, x2, y2) in camera coordinates
+        self.label = label            # latest anti-spoof label for this box
+        self.liveness = liveness      # LivenessState of this face only
+        self.verified_real = False    # in the real state of its liveness history
+        self.announced = None         # identity last reported for this track (multi-subject mode)
+        self.quality = None           # FaceQuality of its last encode attempt, when gated
+        self.identity = None          # student id, None while unknown
+        self.distance = float('inf')  # match distance of that identity
+        self.encoded_at = None        # frame index of the last encoding
+        self.last_seen = frame_index
+        self.hits = 1
+
+    def __repr__(self):
+        return f"Track({self.track_id}, {self.identity}, {self.box})"
+
+
+def iou_matrix(boxes_a, boxes_b):
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_pairs(iou, threshold):
+    # Highest-overlap pairs first; each row and column used at most once
+    pairs = []
+    if iou.size == 0:
+        return pairs
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(iou, axis=None)[::-1]:
+        row, col = divmod(int(flat), iou.shape[1])
+        if iou[row, col] < threshold:
+            break
+        if row not in used_rows and col not in used_cols:
+            pairs.append((row, col))
+            used_rows.add(row)
+            used_cols.add(col)
+    return pairs
+
+
+class FaceTracker:
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, refresh_every=30, retry_every=5, confident_distance=0.5,
+                 liveness=None):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed          # frames a track survives without a box
+        self.refresh_every = refresh_every    # re-encode a confidently known track this often (frames)
+        self.retry_every = retry_every        # ... and an unknown or low-confidence one this often
+        self.confident_distance = confident_distance
+        self.liveness = liveness or LivenessAggregator()
+        self.tracks = []
+        self._next_id = 1
+
+        self.frames = 0
+        self.encode_frames = 0
+        self.faces = 0
+        self.encoded_faces = 0
+        self.fake_detections = 0   # boxes the anti-spoof model labelled fake
+        self.spoof_rejections = 0  # tracks that ended without ever passing liveness
+
+    def update(self, boxes, labels, frame_index, confs=None):
+        # boxes/labels (and anti-spoof confidences) for the current frame; returns the
+        # live track for each box, with its liveness verdict updated
+        tracks = [None] * len(boxes)
+        iou = iou_matrix([t.box for t in self.tracks], boxes)
+        for row, col in greedy_pairs(iou, self.iou_threshold):
+            track = self.tracks[row]
+            track.box, track.label = tuple(boxes[col]), labels[col]
+            track.last_seen = frame_index
+            track.hits += 1
+            tracks[col] = track
+        for col, box in enumerate(boxes):
+            if tracks[col] is None:
+                tracks[col] = Track(self._next_id, tuple(box), labels[col], frame_index, self.liveness.new_state())
+                self._next_id += 1
+                self.tracks.append(tracks[col])
+        for col, track in enumerate(tracks):
+            conf = 1.0 if confs is None else confs[col]
+            track.verified_real = self.liveness.update(track.liveness, labels[col], conf)
+            if labels[col] != "real":
+                self.fake_detections += 1
+        kept = []
+        for track in self.tracks:
+            if frame_index - track.last_seen <= self.max_missed:
+                kept.append(track)
+            elif track.liveness.decided_at is None and track.liveness.frames >= self.liveness.window:
+                self.spoof_rejections += 1
+        self.tracks = kept
+        return tracks
+
+    def is_live(self, track):
+        return track.verified_real
+
+    def reset_liveness(self):
+        # Every face has to prove liveness again (after the kiosk showed a student)
+        for track in self.tracks:
+            self.liveness.reset(track.liveness)
+            track.verified_real = False
+
+    def needs_encoding(self, track, frame_index):
+        if track.encoded_at is None:
+            return True
+        age = frame_index - track.encoded_at
+        if track.identity is None or track.distance > self.confident_distance:
+            return age >= self.retry_every
+        return age >= self.refresh_every
+
+    def assign(self, track, identity, distance, frame_index):
+        track.identity = identity
+        track.distance = float(distance)
+        track.encoded_at = frame_index
+
+    def count_frame(self, faces, encoded):
+        # Bookkeeping for the skip ratio: one call per frame that reached recognition
+        self.frames += 1
+        self.faces += faces
+        if encoded:
+            self.encode_frames += 1
+            self.encoded_faces += encoded
+
+    def reset(self):
+        self.tracks = []
+
+    def stats(self):
+        return {
+            'stage': 'tracker',
+            'kind': 'tracker',
+            'tracks': len(self.tracks),
+            'frames': self.frames,
+            'encode_frames': self.encode_frames,
+            'skip_ratio': 1 - self.encode_frames / self.frames if self.frames else 0.0,
+            'faces': self.faces,
+            'encoded_faces': self.encoded_faces,
+            'tracks_started': self._next_id - 1,
+            'fake_detections': self.fake_detections,
+            'spoof_rejections': self.spoof_rejections,
+        }
@@ -0,0 +1,206 @@
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# In-process stand-in for the parts of firebase_admin.db the kiosk uses:
+#   db.reference(path).get() / .set() / .update() / .child() / .transaction()
+#   .get(shallow=True) and .order_by_key().start_at(key).limit_to_first(n).get()
+# Multi-path updates and the {'.sv': {'increment': n}} server value behave like the
+# Realtime Database REST API. `latency` simulates a network round trip and
+# `offline = True` makes every call raise, to exercise retry paths. listen() delivers
+# 'put' events synchronously on the writing thread.
+
+Event = namedtuple('Event', 'event_type path data')
+
+
+class FakeDatabaseError(Exception):
+    pass
+
+
+def _split(path):
+    return [part for part in str(path).split('/') if part]
+
+
+def _key_order(key):
+    # Realtime Database key order: 32-bit integer keys numerically first, then strings
+    if re.fullmatch(r'-?(0|[1-9][0-9]*)', key) and -2 ** 31 <= int(key) < 2 ** 31:
+        return 0, int(key), ''
+    return 1, 0, key
+
+
+class FakeDatabase:
+
+    def __init__(self, data=None, latency=0.0):
+        self.data = copy.deepcopy(data) if data is not None else {}
+        self.latency = latency
+        self.offline = False
+        self.calls = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def reference(self, path='/'):
+        return FakeReference(self, _split(path))
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.offline:
+            raise FakeDatabaseError("database unreachable")
+
+    def _get(self, parts):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def _set(self, parts, value):
+        if not parts:
+            self.data = copy.deepcopy(value) if value is not None else {}
+            self._notify(parts)
+            return
+        node = self.data
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(self._resolve(parts, value))
+        self._notify(parts)
+
+    def _shallow(self, parts):
+        node = self._get_node(parts)
+        if isinstance(node, dict):
+            return {key: True if isinstance(value, dict) else value for key, value in node.items()}
+        return copy.deepcopy(node)
+
+    def _get_node(self, parts):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _notify(self, parts):
+        for prefix, callback in list(self._listeners):
+            if parts[:len(prefix)] == prefix:
+                relative = parts[len(prefix):]
+                callback(Event('put', '/' + '/'.join(relative), self._get(parts)))
+            elif prefix[:len(parts)] == parts:
+                callback(Event('put', '/', self._get(prefix)))
+
+    def _resolve(self, parts, value):
+        # Server values: only increment is supported
+        if isinstance(value, dict) and '.sv' in value:
+            current = self._get(parts) or 0
+            return current + value['.sv']['increment']
+        return value
+
+
+class FakeReference:
+
+    def __init__(self, database, parts):
+        self._db = database
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._parts)
+
+    def child(self, path):
+        return FakeReference(self._db, self._parts + _split(path))
+
+    def get(self, shallow=False):
+        with self._db._lock:
+            self._db._round_trip()
+            if shallow:
+                return self._db._shallow(self._parts)
+            return self._db._get(self._parts)
+
+    def order_by_key(self):
+        return FakeQuery(self._db, self._parts)
+
+    def set(self, value):
+        with self._db._lock:
+            self._db._round_trip()
+            self._db._set(self._parts, value)
+
+    def update(self, value):
+        # Multi-path update: every key is a path relative to this reference, applied atomically
+        if not isinstance(value, dict) or not value:
+            raise ValueError("update() needs a non-empty dict")
+        with self._db._lock:
+            self._db._round_trip()
+            for path, item in value.items():
+                self._db._set(self._parts + _split(path), item)
+
+    def delete(self):
+        self.set(None)
+
+    def listen(self, callback):
+        with self._db._lock:
+            entry = (self._parts, callback)
+            self._db._listeners.append(entry)
+            callback(Event('put', '/', self._db._get(self._parts)))
+        return _Registration(self._db, entry)
+
+    def transaction(self, transaction_update):
+        with self._db._lock:
+            self._db._round_trip()
+            value = transaction_update(self._db._get(self._parts))
+            self._db._set(self._parts, value)
+            return value
+
+
+class FakeQuery:
+    # order_by_key() queries, for paging through a large node
+
+    def __init__(self, database, parts):
+        self._db = database
+        self._parts = parts
+        self._start = None
+        self._limit = None
+
+    def start_at(self, key):
+        self._start = str(key)
+        return self
+
+    def limit_to_first(self, limit):
+        self._limit = limit
+        return self
+
+    def get(self):
+        with self._db._lock:
+            self._db._round_trip()
+            node = self._db._get_node(self._parts)
+            if not isinstance(node, dict):
+                return OrderedDict()
+            keys = sorted(node, key=_key_order)
+            if self._start is not None:
+                keys = [key for key in keys if _key_order(key) >= _key_order(self._start)]
+            if self._limit is not None:
+                keys = keys[:self._limit]
+            return OrderedDict((key, copy.deepcopy(node[key])) for key in keys)
+
+
+class _Registration:
+
+    def __init__(self, database, entry):
+        self._db = database
+        self._entry = entry
+
+    def close(self):
+        with self._db._lock:
+            if self._entry in self._db._listeners:
+                self._db._listeners.remove(self._entry)
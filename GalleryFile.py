@@ -0,0 +1,110 @@
+import os
+import struct
+import numpy as np
+from FaceIndex import FaceIndex
+
+# On-disk gallery layout (little endian):
+#   header   64 bytes: magic, version, dim, count, flags, embeddings/norms/ids offsets
+#   float32  count x dim embedding block, 64-byte aligned so it can be memory mapped
+#   float32  count squared norms (precomputed for FaceIndex)
+#   uint32   count + 1 offsets into the id blob, then the utf-8 id blob
+# The embedding block is mapped read-only, so every kiosk process on a host
+# shares the same page-cache pages instead of holding its own copy.
+# A student may have several rows (EncodeGenerator enrolls a folder of photos);
+# centroids are derived when the index is loaded, so they can never go stale.
+
+MAGIC = b'FGAL'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIIQQQ')
+HEADER_SIZE = 64
+ALIGN = 64
+
+
+class GalleryFormatError(ValueError):
+    pass
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save_gallery(path, encodings, ids, dim=128):
+    ids = [str(i) for i in ids]
+    embeddings = np.asarray(encodings, dtype='<f4')
+    if embeddings.ndim != 2:
+        embeddings = embeddings.reshape(len(ids), dim)
+    embeddings = np.ascontiguousarray(embeddings)
+    count, dim = embeddings.shape
+    if count != len(ids):
+        raise ValueError(f"{count} encodings but {len(ids)} ids")
+    sq_norms = np.einsum('ij,ij->i', embeddings, embeddings).astype('<f4')
+
+    blob = b''.join(i.encode('utf-8') for i in ids)
+    offsets = np.zeros(count + 1, dtype='<u4')
+    np.cumsum([len(i.encode('utf-8')) for i in ids], out=offsets[1:])
+
+    embeddings_offset = HEADER_SIZE
+    norms_offset = _aligned(embeddings_offset + embeddings.nbytes)
+    ids_offset = _aligned(norms_offset + sq_norms.nbytes)
+
+    # Write next to the target and swap it in, so readers never see a torn file
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, dim, count, 0,
+                               embeddings_offset, norms_offset, ids_offset).ljust(HEADER_SIZE, b'\0'))
+        file.write(embeddings.tobytes())
+        file.write(b'\0' * (norms_offset - file.tell()))
+        file.write(sq_norms.tobytes())
+        file.write(b'\0' * (ids_offset - file.tell()))
+        file.write(offsets.tobytes())
+        file.write(blob)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, 'rb') as file:
+        raw = file.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise GalleryFormatError(f"{path}: truncated header")
+    magic, version, dim, count, flags, embeddings_offset, norms_offset, ids_offset = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise GalleryFormatError(f"{path}: not a gallery file")
+    if version != VERSION:
+        raise GalleryFormatError(f"{path}: unsupported gallery version {version}")
+    return {
+        'version': version, 'dim': dim, 'count': count, 'flags': flags,
+        'embeddings_offset': embeddings_offset, 'norms_offset': norms_offset, 'ids_offset': ids_offset,
+    }
+
+
+def load_gallery(path):
+    # Returns (embeddings, sq_norms, ids). Both arrays are read-only memmaps.
+    header = read_header(path)
+    count, dim = header['count'], header['dim']
+    if count == 0:
+        return np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.float32), []
+
+    embeddings = np.memmap(path, dtype='<f4', mode='r', offset=header['embeddings_offset'], shape=(count, dim))
+    sq_norms = np.memmap(path, dtype='<f4', mode='r', offset=header['norms_offset'], shape=(count,))
+    with open(path, 'rb') as file:
+        file.seek(header['ids_offset'])
+        offsets = np.frombuffer(file.read(4 * (count + 1)), dtype='<u4')
+        blob = file.read(int(offsets[-1]))
+    if len(blob) != offsets[-1]:
+        raise GalleryFormatError(f"{path}: truncated id table")
+    text = blob.decode('utf-8')
+    if len(text) == len(blob):  # ascii ids (the usual case): slice the str directly
+        ids = [text[offsets[i]:offsets[i + 1]] for i in range(count)]
+    else:
+        ids = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+    return embeddings, sq_norms, ids
+
+
+def load_face_index(path, shortlist=4):
+    embeddings, sq_norms, ids = load_gallery(path)
+    face_index = FaceIndex(embeddings, ids, sq_norms=sq_norms, dim=embeddings.shape[1])
+    if len(set(ids)) < len(ids):
+        face_index.build_identities(shortlist)
+    return face_index
@@ -0,0 +1,74 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+# Motion-gated scheduling of the heavy models for idle kiosks. Every frame is shrunk
+# to a tiny grayscale thumbnail and compared with the previous one; while the scene
+# is static the models run only every idle_interval seconds. Motion, or a face in
+# the last inference, switches to full rate at once (the frame that shows the motion
+# is itself inferred), so first appearance -> recognition is not delayed.
+
+
+class InferenceScheduler:
+
+    def __init__(self, thumb_size=(32, 24), motion_threshold=3.0, active_hold=2.0, idle_interval=0.5):
+        self.thumb_size = thumb_size              # (width, height) of the difference thumbnail
+        self.motion_threshold = motion_threshold  # mean absolute gray-level change that counts as motion
+        self.active_hold = active_hold            # seconds of full rate after the last motion or face
+        self.idle_interval = idle_interval        # seconds between inferences on a static scene
+        self._previous = None
+        self._last_activity = None
+        self._last_run = None
+        self._lock = threading.Lock()
+
+        self.frames = 0
+        self.inferences = 0
+        self.motion_frames = 0
+        self.active = False
+
+    def thumbnail(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        return cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def should_run(self, img, now=None):
+        # True when this frame should go through the models
+        now = time.perf_counter() if now is None else now
+        thumb = self.thumbnail(img)
+        with self._lock:
+            self.frames += 1
+            motion = self._previous is None or np.abs(thumb - self._previous).mean() > self.motion_threshold
+            self._previous = thumb
+            if motion:
+                self.motion_frames += 1
+                self._last_activity = now
+            self.active = self._last_activity is not None and now - self._last_activity < self.active_hold
+            run = self.active or self._last_run is None or now - self._last_run >= self.idle_interval
+            if run:
+                self._last_run = now
+                self.inferences += 1
+            return run
+
+    def note_faces(self, count, now=None):
+        # A face keeps the models at full rate even if the person stands still
+        if count:
+            with self._lock:
+                self._last_activity = time.perf_counter() if now is None else now
+                self.active = True
+
+    def duty_cycle(self):
+        # Fraction of frames that ran the models
+        with self._lock:
+            return self.inferences / self.frames if self.frames else 1.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stage': 'scheduler',
+                'kind': 'scheduler',
+                'state': 'active' if self.active else 'idle',
+                'duty_cycle': self.inferences / self.frames if self.frames else 1.0,
+                'frames': self.frames,
+                'inferences': self.inferences,
+                'motion_frames': self.motion_frames,
+            }
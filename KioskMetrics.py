@@ -0,0 +1,326 @@
+import json
+import math
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from KioskPipeline import HISTOGRAM_BUCKETS
+
+# Runtime metrics for the kiosk and the multi-camera server. Every component already
+# reports a stats() summary, a dict named by its 'stage'; collect() returns the
+# current list of them and this module publishes it:
+#   MetricsServer     local HTTP endpoint: /metrics in Prometheus text format, /stats
+#                     as JSON, /ready (200 once startup is ready, else 503) and
+#                     /profile?seconds=N (a sampling profile of every thread)
+#   MetricsLog        one JSON line with every summary each `interval` seconds
+#   SamplingProfiler  stack sampling on demand; install_profiler_signal() toggles it
+#                     with SIGUSR1 and writes the profile when it stops
+# Summary fields become metrics by name: kiosk_<field>{stage="..."}, counters for the
+# cumulative fields in COUNTERS and gauges otherwise. A dict of numbers (skip reasons,
+# outcomes) puts its keys in a 'key' label, a dict of dicts (gallery tiers, startup
+# components) adds its inner field to the name, and StageStats histograms become
+# Prometheus histograms in seconds.
+
+PREFIX = 'kiosk'
+COUNTERS = {
+    'count', 'busy_seconds', 'dropped', 'recognitions', 'hits', 'misses', 'evictions', 'errors',
+    'flushed_events', 'flushed_batches', 'frames', 'encode_frames', 'faces', 'encoded_faces', 'tracks_started',
+    'fake_detections', 'spoof_rejections', 'outcomes', 'scored', 'passed', 'skipped', 'encoded', 'unmatched',
+    'offered', 'added', 'rejected', 'motion_frames', 'loads',
+}
+SKIPPED_FIELDS = {'stage', 'kind', 'last_error', 'histograms'}
+HISTOGRAM_NAMES = {'duration': 'duration_seconds', 'latency': 'latency_seconds'}
+
+
+def _name(*parts):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', '_'.join((PREFIX,) + parts))
+
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _number(value):
+    return isinstance(value, (int, float)) or hasattr(value, 'dtype')  # bools count as 0 / 1
+
+
+def prometheus_text(summaries):
+    # Prometheus text exposition format 0.0.4; samples of one metric stay together
+    families = {}  # name -> (type, [lines])
+
+    def add(kind, name, labels, value):
+        if value is None or isinstance(value, str):
+            return
+        if isinstance(value, bool):
+            value = int(value)
+        if kind == 'counter':
+            name += '_total'
+        families.setdefault(name, (kind, []))[1].append(f"{name}{_labels(labels)} {_value(value)}")
+
+    for summary in summaries:
+        stage = {'stage': summary.get('stage', '')}
+        for field, value in summary.items():
+            if field in SKIPPED_FIELDS:
+                continue
+            kind = 'counter' if field in COUNTERS else 'gauge'
+            if isinstance(value, dict):
+                for key, inner in value.items():
+                    if isinstance(inner, dict):
+                        for subfield, number in inner.items():
+                            if _number(number):
+                                add(kind, _name(field, subfield), dict(stage, key=key), number)
+                    elif _number(inner):
+                        add(kind, _name(field), dict(stage, key=key), inner)
+            elif _number(value):
+                add(kind, _name(field), stage, value)
+        for histogram, data in summary.get('histograms', {}).items():
+            name = _name('stage', HISTOGRAM_NAMES.get(histogram, histogram))
+            lines = families.setdefault(name, ('histogram', []))[1]
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS + (math.inf,), data['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(dict(stage, le=_value(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(stage)} {_value(data['sum'])}")
+            lines.append(f"{name}_count{_labels(stage)} {cumulative}")
+
+    out = []
+    for name, (kind, lines) in sorted(families.items()):
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        return value.item()  # numpy scalars
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def json_snapshot(summaries):
+    return json.dumps({'time': round(time.time(), 3), 'stats': summaries}, default=_json_default)
+
+
+class MetricsServer:
+
+    def __init__(self, collect, port=9108, host='127.0.0.1', status=None, profile_interval=0.01):
+        self.collect = collect        # () -> list of stats() summaries
+        self.status = status          # () -> dict with 'state' (KioskStartup.Startup.status), optional
+        self.host = host              # local only by default: no authentication here
+        self.port = port
+        self.profile_interval = profile_interval
+        self.requests = 0
+        self.error = None
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                server.requests += 1
+                url = urlparse(self.path)
+                try:
+                    code, content_type, body = server.handle(url.path, parse_qs(url.query))
+                except Exception:
+                    code, content_type, body = 500, 'text/plain', traceback.format_exc()
+                data = body.encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as error:
+            # Port taken (another kiosk or the server on this host): run without the endpoint
+            self.error = f"{type(error).__name__}: {error}"
+            print(f"metrics endpoint off, cannot listen on {self.host}:{self.port}: {error}")
+            return self
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]  # port=0 picks a free one
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def handle(self, path, query):
+        # -> (status code, content type, body)
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4; charset=utf-8', prometheus_text(self.collect())
+        if path == '/stats':
+            return 200, 'application/json', json_snapshot(self.collect())
+        if path == '/ready':
+            if self.status is None:
+                return 404, 'text/plain', "no readiness state\n"
+            status = self.status()
+            return (200 if status['state'] == 'ready' else 503), 'application/json', json.dumps(status)
+        if path == '/profile':
+            seconds = min(float(query.get('seconds', ['10'])[0]), 120.0)
+            profiler = SamplingProfiler(self.profile_interval)
+            profiler.start()
+            time.sleep(seconds)
+            profiler.stop(write=False)
+            if query.get('format', ['top'])[0] == 'folded':
+                return 200, 'text/plain', profiler.collapsed()
+            return 200, 'text/plain', profiler.top()
+        return 404, 'text/plain', "endpoints: /metrics /stats /ready /profile?seconds=10[&format=folded]\n"
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+class MetricsLog:
+    # Appends json_snapshot(collect()) to path every `interval` seconds
+
+    def __init__(self, collect, path, interval=10.0):
+        self.collect = collect
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-log', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        with open(self.path, 'a', buffering=1) as log:
+            while not self._stop.wait(self.interval):
+                try:
+                    log.write(json_snapshot(self.collect()) + '\n')
+                except Exception:
+                    traceback.print_exc()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+
+class SamplingProfiler:
+    # Records the Python stack of every thread each `interval` seconds while running.
+    # collapsed() is one "thread;outer;...;inner count" line per distinct stack (the
+    # input of flamegraph.pl and speedscope); top() ranks functions by samples.
+    # Sampling costs one stack walk per thread per interval, nothing while stopped.
+
+    def __init__(self, interval=0.01, directory='profiles'):
+        self.interval = interval
+        self.directory = directory
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return self
+        self.stacks.clear()
+        self.samples = 0
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self, write=True):
+        # Stops sampling; returns the path of the written profile (write=True) or None
+        if not self.running:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return self.write() if write else None
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, n=25):
+        # Self samples: the function was running; total: it was anywhere on the stack
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+        seconds = self.samples * self.interval
+        lines = [f"{self.samples} samples ({seconds:.1f} s), {sum(self.stacks.values())} thread stacks",
+                 f"{'self':>7} {'total':>7}  function"]
+        for function, count in own.most_common(n):
+            lines.append(f"{count:>7} {total[function]:>7}  {function}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S', time.localtime(self.started)))
+        with open(stem + '.folded', 'w') as file:
+            file.write(self.collapsed())
+        with open(stem + '.txt', 'w') as file:
+            file.write(self.top())
+        return stem + '.folded'
+
+
+def install_profiler_signal(profiler, signum=None):
+    # kill -USR1 <pid> starts the profiler, the next one stops it and writes the files.
+    # Returns False where there is no such signal (Windows: use /profile instead).
+    signum = signum if signum is not None else getattr(signal, 'SIGUSR1', None)
+    if signum is None:
+        return False
+
+    def toggle(_signum, _frame):
+        path = profiler.toggle()
+        print(f"profile written to {path}" if path else f"profiling every {profiler.interval * 1000:.0f} ms")
+
+    signal.signal(signum, toggle)
+    return True
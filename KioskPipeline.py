@@ -0,0 +1,796 @@
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import deque, namedtuple
+import cv2
+import numpy as np
+from FaceTracker import FaceTracker, greedy_pairs, iou_matrix
+from LazyImport import lazy_import
+
+face_recognition = lazy_import('face_recognition')  # dlib models load on first use
+
+# Pipelined kiosk runtime: capture -> anti-spoof inference -> recognition -> render.
+# Stages run on their own threads and talk through LatestQueue, which keeps only
+# the newest items, so a slow stage skips stale frames instead of falling behind.
+#
+# State ownership:
+#   capture thread      cap
+#   inference thread    yolo model
+#   recognition thread  face tracks and their liveness, face_recognition calls,
+#                       Firebase reads/writes for the recognized id
+#   render loop         modeType, counter, id, studentInfo (KioskUI, main thread only)
+# The only cross-thread signals are two Events: ui_busy (set by recognition when it
+# hands over a student, cleared by the UI when the sequence ends) and liveness_reset
+# (set by the UI, consumed by recognition to make every face prove liveness again).
+
+Frame = namedtuple('Frame', 'index captured_at img')
+# boxes: list of (x1, y1, x2, y2, label, conf) in camera coordinates
+Detections = namedtuple('Detections', 'frame boxes')
+# face_box: (x1, y1, x2, y2) of the recognized face in camera coordinates
+Recognition = namedtuple('Recognition', 'frame student_id student_info marked face_box')
+
+
+class LatestQueue:
+    # Bounded queue that drops the oldest item when full
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        # Returns None on timeout; timeout=0 polls
+        with self._cond:
+            if not self._items and timeout != 0:
+                self._cond.wait_for(lambda: self._items, timeout)
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Upper bounds (s) of the cumulative duration / latency histograms (KioskMetrics.py)
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class StageStats:
+    # Percentiles over the last `window` records for the console, plus histograms
+    # since start for the metrics endpoint
+
+    def __init__(self, name, window=500):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self.started = time.perf_counter()
+        self.durations = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.duration_counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.latency_counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration, latency=None):
+        with self._lock:
+            self.count += 1
+            self.busy += duration
+            self.durations.append(duration)
+            self.duration_counts[bisect_left(HISTOGRAM_BUCKETS, duration)] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+                self.latency_counts[bisect_left(HISTOGRAM_BUCKETS, latency)] += 1
+                self.latency_sum += latency
+
+    def summary(self):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            durations = np.array(self.durations) * 1000
+            latencies = np.array(self.latencies) * 1000
+            count, busy = self.count, self.busy
+            histograms = {'duration': {'counts': list(self.duration_counts), 'sum': busy}}
+            if any(self.latency_counts):
+                histograms['latency'] = {'counts': list(self.latency_counts), 'sum': self.latency_sum}
+        summary = {'stage': self.name, 'kind': 'stage', 'count': count, 'fps': count / elapsed, 'utilization': busy / elapsed,
+                   'busy_seconds': busy, 'histograms': histograms}
+        if len(durations):
+            summary['ms_p50'], summary['ms_p95'] = np.percentile(durations, [50, 95])
+        if len(latencies):
+            summary['latency_ms_p50'], summary['latency_ms_p95'] = np.percentile(latencies, [50, 95])
+        return summary
+
+
+class RecognitionCounts:
+    # Outcome of every lookup_attendance call: marked, duplicate (marked less than
+    # min_seconds ago; the kiosk's "already marked" screen, modeType 3) or no_profile
+
+    def __init__(self, name='recognitions'):
+        self.name = name
+        self.outcomes = {'marked': 0, 'duplicate': 0, 'no_profile': 0}
+        self._lock = threading.Lock()
+
+    def count(self, studentInfo, marked):
+        outcome = 'no_profile' if studentInfo is None else 'marked' if marked else 'duplicate'
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def summary(self):
+        with self._lock:
+            return {'stage': self.name, 'kind': 'outcomes', 'outcomes': dict(self.outcomes)}
+
+
+def _stage_line(s):
+    line = f"{s['stage']:>12}: {s['fps']:6.1f}/s  busy {s['utilization'] * 100:5.1f}%"
+    if 'ms_p50' in s:
+        line += f"  {s['ms_p50']:7.1f} ms p50 {s['ms_p95']:7.1f} ms p95"
+    if 'latency_ms_p50' in s:
+        line += f"  latency {s['latency_ms_p50']:7.1f} ms p50 {s['latency_ms_p95']:7.1f} ms p95"
+    return line
+
+
+def _outcomes_line(s):
+    return f"{s['stage']:>12}: " + ", ".join(f"{outcome} {count}" for outcome, count in s['outcomes'].items())
+
+
+def _tracker_line(s):
+    return (f"{s['stage']:>12}: encoding skipped on {s['skip_ratio'] * 100:5.1f}% of frames, "
+            f"{s['encoded_faces']}/{s['faces']} faces encoded, {s['tracks']} live tracks, "
+            f"{s['fake_detections']} fake detections, {s['spoof_rejections']} spoofs rejected")
+
+
+def _enrollment_line(s):
+    return (f"{s['stage']:>12}: {s['added']}/{s['offered']} captures added, "
+            f"{s['online_encodings']} online encodings for {s['students']} students")
+
+
+def _gallery_line(s):
+    tiers = ", ".join(f"{tier} {entry['share'] * 100:.0f}% ({entry['ms_per_search']:.2f} ms)"
+                      for tier, entry in s['tiers'].items()) or "no queries"
+    return f"{s['stage']:>12}: {tiers}; mapped {', '.join(s['loaded'])} ({s['mapped_mb']:.1f} MB)"
+
+
+def _quality_line(s):
+    skipped = ", ".join(f"{reason} {count}" for reason, count in sorted(s['skipped'].items())) or "none"
+    return (f"{s['stage']:>12}: {s['passed']}/{s['scored']} faces passed (skipped: {skipped}), "
+            f"{s['unmatched']}/{s['encoded']} encodes unmatched")
+
+
+def _scheduler_line(s):
+    return (f"{s['stage']:>12}: {s['state']}, models ran on {s['duty_cycle'] * 100:5.1f}% of "
+            f"{s['frames']} frames ({s['motion_frames']} with motion)")
+
+
+def _startup_line(s):
+    components = ", ".join(f"{name} {entry['seconds']:.2f} s" for name, entry in s['components'].items())
+    return f"{s['stage']:>12}: {'ready' if s['ready'] else 'not ready'} ({components or 'nothing loaded'})"
+
+
+def _other_line(s):
+    # A summary kind without its own line: its plain numbers
+    return f"{s['stage']:>12}: " + ", ".join(f"{field} {value}" for field, value in s.items()
+                                              if field not in ('stage', 'kind') and isinstance(value, (int, float)))
+
+
+# summary['kind'] -> its console line. A StageStats summary is 'stage'; owners that add
+# fields to one give it their own kind ('queue', 'camera', 'profile_cache', 'attendance_sink').
+STATS_LINES = {
+    'stage': _stage_line,
+    'queue': lambda s: _stage_line(s) + f"  dropped {s['dropped']}",
+    'camera': lambda s: _stage_line(s) + f"  dropped {s['dropped']}  recognitions {s['recognitions']}",
+    'profile_cache': lambda s: _stage_line(s) + (f"  hit ratio {s['hit_ratio'] * 100:5.1f}%  size {s['size']}"
+                                                 f"  errors {s['errors']}"),
+    'attendance_sink': lambda s: _stage_line(s) + f"  pending {s['pending']}  errors {s['errors']}",
+    'outcomes': _outcomes_line,
+    'tracker': _tracker_line,
+    'enrollment': _enrollment_line,
+    'gallery': _gallery_line,
+    'quality': _quality_line,
+    'scheduler': _scheduler_line,
+    'startup': _startup_line,
+}
+
+
+def format_stats(summaries):
+    return "\n".join(STATS_LINES.get(s.get('kind'), _other_line)(s) for s in summaries)
+
+
+def detect_faces(yolo_model, img, confidence_threshold=0.6, classNames=("fake", "real")):
+    # Anti-spoofing pass: [(x1, y1, x2, y2, label, conf)] above the confidence threshold.
+    # yolo_model is any LivenessBackend (PyTorch, ONNX Runtime or OpenVINO)
+    return to_boxes(yolo_model.detect(img), confidence_threshold, classNames)
+
+
+def to_boxes(rows, confidence_threshold=0.6, classNames=("fake", "real")):
+    boxes = []
+    for x1, y1, x2, y2, conf, cls in rows:
+        if conf > confidence_threshold:
+            boxes.append((int(x1), int(y1), int(x2), int(y2), classNames[int(cls)], float(conf)))
+    return boxes
+
+
+def small_rgb(img, scale=0.25):
+    # Smaller RGB copy for face_recognition
+    imgS = cv2.resize(img, (0, 0), None, scale, scale)
+    return cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
+
+
+def box_to_location(box, scale, shape):
+    # Camera box (x1, y1, x2, y2) -> face_recognition (top, right, bottom, left) on the scaled image
+    x1, y1, x2, y2 = box[:4]
+    height, width = shape[:2]
+    return (max(0, round(y1 * scale)), min(width, round(x2 * scale)),
+            min(height, round(y2 * scale)), max(0, round(x1 * scale)))
+
+
+def location_to_box(location, scale):
+    top, right, bottom, left = location
+    return (int(left / scale), int(top / scale), int(right / scale), int(bottom / scale))
+
+
+class Stage(threading.Thread):
+
+    def __init__(self, name, inbox, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.inbox = inbox
+        self.stop_event = stop_event
+        self.stats = StageStats(name)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            item = self.inbox.get(timeout=0.1)
+            if item is None:
+                continue
+            start = time.perf_counter()
+            try:
+                self.process(item)
+            except Exception:
+                # Keep the kiosk alive on a bad frame or a transient network error
+                traceback.print_exc()
+            end = time.perf_counter()
+            self.stats.record(end - start, end - getattr(item, 'frame', item).captured_at)
+
+    def process(self, item):
+        raise NotImplementedError
+
+
+class CaptureStage(threading.Thread):
+
+    def __init__(self, cap, outboxes, stop_event, flip=True):
+        super().__init__(name='capture', daemon=True)
+        self.cap = cap
+        self.outboxes = outboxes
+        self.stop_event = stop_event
+        self.flip = flip
+        self.stats = StageStats('capture')
+
+    def run(self):
+        index = 0
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            success, img = self.cap.read()
+            if not success:
+                time.sleep(0.01)
+                continue
+            if self.flip:
+                img = cv2.flip(img, 1)  # Mirror camera for natural view
+            frame = Frame(index, time.perf_counter(), img)
+            index += 1
+            for outbox in self.outboxes:
+                outbox.put(frame)
+            self.stats.record(frame.captured_at - start)
+
+
+class InferenceStage(Stage):
+
+    # scheduler (InferenceScheduler, optional) skips frames of a static, empty scene;
+    # skipped frames produce no Detections, so render keeps the last overlay.
+
+    def __init__(self, inbox, outboxes, stop_event, yolo_model,
+                 confidence_threshold=0.6, classNames=("fake", "real"), scheduler=None):
+        super().__init__('inference', inbox, stop_event)
+        self.outboxes = outboxes
+        self.yolo_model = yolo_model
+        self.confidence_threshold = confidence_threshold
+        self.classNames = classNames
+        self.scheduler = scheduler
+
+    def process(self, frame):
+        if self.scheduler is not None and not self.scheduler.should_run(frame.img, frame.captured_at):
+            return
+
+        boxes = detect_faces(self.yolo_model, frame.img, self.confidence_threshold, self.classNames)
+        if self.scheduler is not None:
+            self.scheduler.note_faces(len(boxes), frame.captured_at)
+        detections = Detections(frame, boxes)
+        for outbox in self.outboxes:
+            outbox.put(detections)
+
+
+class RecognitionStage(Stage):
+    # lookup_attendance(student_id, distance=, liveness=) -> (studentInfo, marked) does
+    # the Firebase work; it runs here so network round trips never block the render loop.
+
+    # The YOLO boxes are tracked across frames (FaceTracker); a track keeps its identity
+    # and its own liveness history (LivenessAggregator), so faces are only located and
+    # encoded when a track needs it, and only faces that are live themselves count.
+    # single_pass=True encodes the YOLO "real" boxes directly instead of running HOG,
+    # so each identity comes from the box that passed the liveness check.
+    # multi_subject=True reports every recognized face once per track (each with its
+    # own event) instead of one student per UI sequence.
+    # quality_gate (FaceQuality.QualityGate) skips faces not worth an encode, and
+    # enrollment (OnlineEnrollment) adds confident live captures to the gallery.
+
+    def __init__(self, inbox, events, stop_event, ui_busy, face_index, lookup_attendance, tracker=None,
+                 single_pass=False, encode_scale=0.25, timings=None, multi_subject=False, liveness_reset=None,
+                 quality_gate=None, enrollment=None):
+        super().__init__('recognition', inbox, stop_event)
+        self.events = events
+        self.ui_busy = ui_busy
+        self.face_index = face_index
+        self.lookup_attendance = lookup_attendance
+        self.tracker = tracker or FaceTracker()
+        self.single_pass = single_pass
+        self.encode_scale = encode_scale
+        self.timings = timings  # optional dict of resize / locate / encode seconds (ReplayBenchmark.py)
+        self.multi_subject = multi_subject
+        self.liveness_reset = liveness_reset
+        self.quality_gate = quality_gate
+        self.enrollment = enrollment
+        self.outcomes = RecognitionCounts()
+
+    def process(self, detections):
+        frame_index = detections.frame.index
+        if self.liveness_reset is not None and self.liveness_reset.is_set():
+            self.liveness_reset.clear()
+            self.tracker.reset_liveness()
+        boxes = detections.boxes
+        tracks = self.tracker.update([box[:4] for box in boxes], [box[4] for box in boxes], frame_index,
+                                     [box[5] for box in boxes])
+        if self.ui_busy.is_set():
+            return
+
+        live_tracks = [track for track in tracks if track.verified_real]
+        if not live_tracks:
+            return
+        pending = [track for track in live_tracks if self.tracker.needs_encoding(track, frame_index)]
+        encoded = self.encode_tracks(detections.frame.img, pending, frame_index) if pending else 0
+        self.tracker.count_frame(len(live_tracks), encoded)
+
+        if self.multi_subject:
+            for track in live_tracks:
+                if track.identity is None or track.identity == track.announced:
+                    continue
+                track.announced = track.identity
+                studentInfo, marked = self.lookup(track)
+                if studentInfo is not None:
+                    self.events.put(Recognition(detections.frame, track.identity, studentInfo, marked, track.box))
+            return
+
+        for track in live_tracks:
+            if track.identity is None:
+                continue
+            studentInfo, marked = self.lookup(track)
+            if studentInfo is None:
+                continue
+            self.ui_busy.set()
+            self.events.put(Recognition(detections.frame, track.identity, studentInfo, marked, track.box))
+            return
+
+    def lookup(self, track):
+        studentInfo, marked = self.lookup_attendance(track.identity, distance=track.distance,
+                                                     liveness=track.liveness.score)
+        self.outcomes.count(studentInfo, marked)
+        return studentInfo, marked
+
+    def encode_tracks(self, img, pending, frame_index):
+        encoded_tracks, encodeCurFrame = encode_pending(img, pending, self.single_pass, self.encode_scale,
+                                                         self.timings, self.quality_gate)
+        matchIds, matchDistances = [], []
+        if encoded_tracks:
+            matchIds, matchDistances = self.face_index.match(encodeCurFrame)
+        assign_matches(self.tracker, pending, encoded_tracks, matchIds, matchDistances, frame_index)
+        if self.enrollment is not None:
+            for track, encoding, matchId, distance in zip(encoded_tracks, encodeCurFrame, matchIds, matchDistances):
+                self.enrollment.offer(matchId, encoding, distance, track.liveness.score, track.quality)
+        if self.quality_gate is not None:
+            self.quality_gate.note([track.quality for track in pending if track.quality is not None],
+                                   {track.track_id: (matchId, distance) for track, matchId, distance
+                                    in zip(encoded_tracks, matchIds, matchDistances)})
+        return len(encoded_tracks)
+
+
+def encode_pending(img, pending, single_pass=False, scale=0.25, timings=None, quality_gate=None):
+    # Encodings for the pending tracks that could be encoded: (tracks, encodings).
+    # With a quality gate each pending track's quality is set (row = its track id), or None.
+    rows, encodings, qualities = encode_boxes(img, [track.box for track in pending],
+                                              [track.label for track in pending], single_pass, scale, timings,
+                                              quality_gate)
+    for track in pending:
+        track.quality = None
+    for quality in qualities:
+        track = pending[quality.row]
+        track.quality = quality._replace(row=track.track_id)
+    return [pending[row] for row in rows], encodings
+
+
+def encode_boxes(img, boxes, labels, single_pass=False, scale=0.25, timings=None, quality_gate=None):
+    # Plain-data core of encode_pending (it can run in a worker process): (rows, encodings,
+    # qualities); qualities holds a FaceQuality per scored face when quality_gate is given.
+    # timings, when given, is a dict that collects seconds spent in resize / locate / quality / encode.
+    clock = [time.perf_counter()]
+
+    def lap(step):
+        if timings is not None:
+            now = time.perf_counter()
+            timings[step] = timings.get(step, 0.0) + now - clock[0]
+            clock[0] = now
+
+    if single_pass:
+        rows = [row for row, label in enumerate(labels) if label == "real"]
+        if not rows:
+            return [], [], []
+        imgS = small_rgb(img, scale) if scale != 1 else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        lap('resize')
+        locations = [box_to_location(boxes[row], scale, imgS.shape) for row in rows]
+    else:
+        imgS = small_rgb(img, scale)
+        lap('resize')
+        faceCurFrame = face_recognition.face_locations(imgS)
+        lap('locate')
+        # HOG boxes are tighter than the YOLO ones, so pair them on a low overlap
+        hog_boxes = [location_to_box(location, scale) for location in faceCurFrame]
+        pairs = greedy_pairs(iou_matrix(boxes, hog_boxes), 0.1)
+        if not pairs:
+            return [], [], []
+        rows = [row for row, _ in pairs]
+        locations = [faceCurFrame[col] for _, col in pairs]
+
+    qualities = []
+    if quality_gate is not None:
+        keep, qualities = quality_gate.filter(imgS, locations, rows)
+        rows, locations = [rows[index] for index in keep], [locations[index] for index in keep]
+        lap('quality')
+        if not rows:
+            return [], [], qualities
+    encodings = face_recognition.face_encodings(imgS, locations)
+    lap('encode')
+    return rows, encodings, qualities
+
+
+def assign_matches(tracker, pending, encoded_tracks, matchIds, matchDistances, frame_index):
+    for track, matchId, matchDistance in zip(encoded_tracks, matchIds, matchDistances):
+        tracker.assign(track, matchId, matchDistance, frame_index)
+    encoded = {id(track) for track in encoded_tracks}
+    for track in pending:
+        if id(track) not in encoded:
+            # Nothing to encode this time; retry after retry_every frames
+            tracker.assign(track, track.identity, track.distance, frame_index)
+
+
+# Layout of the kiosk window: regions (y1, y2, x1, x2) of the background image
+VIEWPORT = (162, 162 + 480, 55, 55 + 640)   # camera image
+PANEL = (44, 44 + 633, 808, 808 + 414)      # mode panel
+
+
+def region(img, rect):
+    y1, y2, x1, x2 = rect
+    return img[y1:y2, x1:x2]
+
+
+def overlaps(a, b):
+    return a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]
+
+
+def inside(a, b):
+    return b[0] <= a[0] and a[1] <= b[1] and b[2] <= a[2] and a[3] <= b[3]
+
+
+def clip_rect(rect, shape):
+    y1, y2, x1, x2 = rect
+    height, width = shape[:2]
+    return max(0, y1), min(height, y2), max(0, x1), min(width, x2)
+
+
+def prepare_panel(img):
+    # Mode images are converted once at load time to what a paste needs
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    if img.shape[:2] != (PANEL[1] - PANEL[0], PANEL[3] - PANEL[2]):
+        raise ValueError(f"mode image is {img.shape[1]}x{img.shape[0]}, the panel is 414x633")
+    return np.ascontiguousarray(img, dtype=np.uint8)
+
+
+class KioskUI:
+    # Render-side state machine. Only the render loop touches it.
+    # compose() draws into one persistent buffer instead of copying the background
+    # every frame: the camera viewport is written every frame, the mode panel only
+    # when what it shows changes, and whatever overlays painted outside the viewport
+    # is restored from the background on the next frame. The student-info panel is
+    # rendered once per recognition. The returned image is reused by the next call.
+    # multi_subject=True never blocks recognition: events are queued and shown in turn
+    # (info_frames each, the "marked" screen only when nobody is waiting), and the
+    # waiting students are listed over the camera image.
+
+    def __init__(self, imgBackground, imgModeList, ui_busy, liveness_reset, info_frames=40, total_frames=70,
+                 multi_subject=False):
+        self.imgBackground = imgBackground
+        self.imgModeList = [prepare_panel(img) for img in imgModeList]
+        self.ui_busy = ui_busy
+        self.liveness_reset = liveness_reset
+        self.info_frames = info_frames
+        self.total_frames = total_frames
+        self.modeType = 0    # Determines which UI mode is shown
+        self.counter = 0     # Controls timing for displaying attendance info
+        self.id = -1         # ID of the recognized student
+        self.studentInfo = {}
+
+        self.canvas = imgBackground.copy()
+        self.panel_key = None      # what the panel region of the canvas shows now
+        self.info_panel = None     # cached student-info panel of the current recognition
+        self.recognitions = 0
+        self.dirty = []            # rects painted outside the viewport by the last frame
+        self.panel_writes = 0
+
+        self.multi_subject = multi_subject
+        self.queue = deque()       # recognitions waiting for the panel (multi-subject mode)
+        self.fresh = []            # recognitions received since the last frame
+
+    def push(self, event):
+        # Multi-subject mode: queue a recognition for the panel
+        self.queue.append(event)
+        self.fresh.append(event)
+
+    def compose(self, img, detections=None, event=None):
+        if self.multi_subject:
+            if event is not None:
+                self.push(event)
+            # The "marked" screen gives way as soon as somebody is waiting
+            if self.queue and (self.counter == 0 or self.counter > self.info_frames):
+                self.show(self.queue.popleft())
+            face_boxes, self.fresh = [e.face_box for e in self.fresh], []
+        else:
+            if event is not None and self.counter == 0:
+                self.show(event)
+            face_boxes = [event.face_box] if event is not None else []
+
+        if self.counter == 0:
+            self.modeType = 0
+        elif self.modeType != 3:
+            self.modeType = 1 if self.counter <= self.info_frames else 2
+        self.render(img, detections, face_boxes)
+
+        if self.counter == 0:
+            return self.canvas
+        self.counter += 1
+        last = self.info_frames if self.modeType == 3 else self.total_frames
+        if self.counter >= last:
+            self.counter = 0
+            self.modeType = 0
+            self.studentInfo = {}
+            self.id = -1
+            self.info_panel = None
+            if not self.multi_subject:
+                self.liveness_reset.set()
+                self.ui_busy.clear()
+        return self.canvas
+
+    def show(self, event):
+        self.id = event.student_id
+        self.studentInfo = event.student_info
+        self.counter = 1
+        self.modeType = 1 if event.marked else 3  # 3: already marked in the last 30 s
+        self.info_panel = None
+        self.recognitions += 1
+
+    def render(self, img, detections, face_boxes):
+        canvas = self.canvas
+        written = self.dirty + [VIEWPORT]
+        for rect in self.dirty:
+            region(canvas, rect)[:] = region(self.imgBackground, rect)
+        self.dirty = []
+
+        # Draw webcam into background layout
+        region(canvas, VIEWPORT)[:] = img
+        if detections is not None:
+            for x1, y1, x2, y2, label, conf in detections.boxes:
+                color = (0, 255, 0) if label == "real" else (0, 0, 255)
+                cv2.rectangle(canvas, (55 + x1, 162 + y1), (55 + x2, 162 + y2), color, 2)
+                self.note_drawn((162 + min(y1, y2), 162 + max(y1, y2), 55 + min(x1, x2), 55 + max(x1, x2)), 2)
+        for face_box in face_boxes:
+            draw_corners(canvas, face_box)
+            x1, y1, x2, y2 = face_box
+            # Corner strokes are corner_len long even on a tiny box
+            self.note_drawn((162 + min(y1, y2), 162 + max(y1, y2), 55 + min(x1, x2), 55 + max(x1, x2)), 22)
+        if self.queue:
+            self.draw_queue(canvas)
+        written += self.dirty
+
+        key = (self.modeType, self.recognitions if self.modeType == 1 else None)
+        if key != self.panel_key or any(overlaps(PANEL, rect) for rect in written):
+            self.panel_writes += 1
+            self.panel_key = key
+            if self.modeType == 1:
+                self.paste_info_panel()
+            else:
+                region(canvas, PANEL)[:] = self.imgModeList[self.modeType]
+
+    def draw_queue(self, canvas, shown=3):
+        # "Next:" list at the bottom of the camera image
+        waiting = [str(e.student_info.get('name', e.student_id))[:28] for e in list(self.queue)[:shown]]
+        if len(self.queue) > shown:
+            waiting.append(f"+{len(self.queue) - shown} more")
+        for i, text in enumerate(reversed(waiting)):
+            origin = (55 + 10, 162 + 470 - 24 * i)
+            if i == len(waiting) - 1:
+                text = "Next: " + text
+            (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_COMPLEX, 0.6, 1)
+            cv2.rectangle(canvas, (origin[0] - 4, origin[1] - h - 4), (origin[0] + w + 4, origin[1] + baseline + 2),
+                          (40, 40, 40), cv2.FILLED)
+            cv2.putText(canvas, text, origin, cv2.FONT_HERSHEY_COMPLEX, 0.6, (255, 255, 255), 1)
+            self.note_drawn((origin[1] - h - 4, origin[1] + baseline + 2, origin[0] - 4, origin[0] + w + 4), 1)
+
+    def note_drawn(self, rect, margin):
+        # Remember what an overlay covered outside the viewport, to restore it next frame
+        y1, y2, x1, x2 = rect
+        rect = clip_rect((y1 - margin, y2 + margin + 1, x1 - margin, x2 + margin + 1), self.canvas.shape)
+        if rect[0] < rect[1] and rect[2] < rect[3] and not inside(rect, VIEWPORT):
+            self.dirty.append(rect)
+
+    def paste_info_panel(self):
+        extent = self.info_extent()
+        if not inside(extent, PANEL):
+            # Text runs off the panel (a very long name): draw it on the canvas every frame
+            region(self.canvas, PANEL)[:] = self.imgModeList[1]
+            self.draw_student_info(self.canvas)
+            self.note_drawn(extent, 0)
+            self.panel_key = None
+            return
+        if self.info_panel is None:
+            # Once per recognition, on a scratch copy so the pixels match drawing in place
+            scratch = self.imgBackground.copy()
+            region(scratch, PANEL)[:] = self.imgModeList[1]
+            self.draw_student_info(scratch)
+            self.info_panel = region(scratch, PANEL).copy()
+        region(self.canvas, PANEL)[:] = self.info_panel
+
+    def student_info_text(self):
+        # (text, origin, scale, color) of every line of the student-info panel
+        studentInfo = self.studentInfo
+        (w, _), _ = cv2.getTextSize(studentInfo['name'], cv2.FONT_HERSHEY_COMPLEX, 1, 1)
+        offset = (414 - w) // 2
+        return [
+            (str(studentInfo["total_attendance"]), (861, 125), 1, (255, 255, 255)),
+            (str(studentInfo["major"]), (1006, 550), 0.5, (255, 255, 255)),
+            (str(self.id), (1006, 493), 0.5, (255, 255, 255)),
+            (str(studentInfo["standing"]), (910, 625), 0.6, (100, 100, 100)),
+            (str(studentInfo["year"]), (1025, 625), 0.6, (100, 100, 100)),
+            (str(studentInfo["starting_year"]), (1125, 625), 0.6, (100, 100, 100)),
+            (str(studentInfo['name']), (808 + offset, 445), 1, (50, 50, 50)),
+        ]
+
+    def info_extent(self):
+        y1, y2, x1, x2 = PANEL
+        for text, (x, y), scale, _ in self.student_info_text():
+            (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_COMPLEX, scale, 1)
+            y1, y2 = min(y1, y - h - 2), max(y2, y + baseline + 2)
+            x1, x2 = min(x1, x - 2), max(x2, x + w + 2)
+        return y1, y2, x1, x2
+
+    def draw_student_info(self, frame):
+        for text, origin, scale, color in self.student_info_text():
+            cv2.putText(frame, text, origin, cv2.FONT_HERSHEY_COMPLEX, scale, color, 1)
+
+
+def draw_corners(frame, face_box, corner_color=(0, 255, 0), corner_len=20, thickness=2):
+    # Green corner box around a recognized face
+    x1, y1, x2, y2 = face_box
+    x1_disp, y1_disp = 55 + x1, 162 + y1
+    x2_disp, y2_disp = 55 + x2, 162 + y2
+    cv2.line(frame, (x1_disp, y1_disp), (x1_disp + corner_len, y1_disp), corner_color, thickness)
+    cv2.line(frame, (x1_disp, y1_disp), (x1_disp, y1_disp + corner_len), corner_color, thickness)
+    cv2.line(frame, (x2_disp, y1_disp), (x2_disp - corner_len, y1_disp), corner_color, thickness)
+    cv2.line(frame, (x2_disp, y1_disp), (x2_disp, y1_disp + corner_len), corner_color, thickness)
+    cv2.line(frame, (x1_disp, y2_disp), (x1_disp + corner_len, y2_disp), corner_color, thickness)
+    cv2.line(frame, (x1_disp, y2_disp), (x1_disp, y2_disp - corner_len), corner_color, thickness)
+    cv2.line(frame, (x2_disp, y2_disp), (x2_disp - corner_len, y2_disp), corner_color, thickness)
+    cv2.line(frame, (x2_disp, y2_disp), (x2_disp, y2_disp - corner_len), corner_color, thickness)
+
+
+class KioskPipeline:
+
+    def __init__(self, cap, yolo_model, face_index, lookup_attendance, imgBackground, imgModeList,
+                 confidence_threshold=0.6, classNames=("fake", "real"), single_pass=False,
+                 scheduler=None, multi_subject=False, liveness=None, quality_gate=None, enrollment=None):
+        self.stop_event = threading.Event()
+        self.ui_busy = threading.Event()
+        self.liveness_reset = threading.Event()
+
+        self.preview = LatestQueue()     # capture -> render, every frame at sensor rate
+        self.frames = LatestQueue()      # capture -> inference
+        self.detections = LatestQueue()  # inference -> recognition
+        self.overlays = LatestQueue()    # inference -> render
+        # recognition -> render; in multi-subject mode every event is kept for the UI queue
+        self.events = LatestQueue(64 if multi_subject else 1)
+        self.multi_subject = multi_subject
+
+        self.capture = CaptureStage(cap, [self.preview, self.frames], self.stop_event)
+        self.inference = InferenceStage(self.frames, [self.detections, self.overlays], self.stop_event,
+                                        yolo_model, confidence_threshold, classNames, scheduler)
+        # liveness: LivenessAggregator with the per-face window and thresholds
+        self.recognition = RecognitionStage(self.detections, self.events, self.stop_event, self.ui_busy,
+                                            face_index, lookup_attendance, FaceTracker(liveness=liveness),
+                                            single_pass=single_pass, multi_subject=multi_subject,
+                                            liveness_reset=self.liveness_reset, quality_gate=quality_gate,
+                                            enrollment=enrollment)
+        # Multi-subject: each student is shown for 20 frames instead of locking the kiosk for 70
+        self.ui = KioskUI(imgBackground, imgModeList, self.ui_busy, self.liveness_reset,
+                          info_frames=20 if multi_subject else 40, multi_subject=multi_subject)
+        self.render_stats = StageStats('render')
+        self.recognition_latency = StageStats('end-to-end')
+        self.last_detections = None
+
+    def start(self):
+        for stage in (self.capture, self.inference, self.recognition):
+            stage.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for stage in (self.capture, self.inference, self.recognition):
+            stage.join(timeout=2)
+        if self.recognition.quality_gate is not None:
+            self.recognition.quality_gate.close()
+        if self.recognition.enrollment is not None:
+            self.recognition.enrollment.save()
+
+    def render_next(self, timeout=1.0):
+        # Called from the main thread; returns the composed frame or None on timeout
+        frame = self.preview.get(timeout)
+        if frame is None:
+            return None
+        start = time.perf_counter()
+        detections = self.overlays.get(0)
+        if detections is not None:
+            self.last_detections = detections
+        events = []
+        while True:
+            event = self.events.get(0)
+            if event is None:
+                break
+            events.append(event)
+            if not self.multi_subject:
+                break
+        for event in events[:-1]:
+            self.ui.push(event)
+        output = self.ui.compose(frame.img, self.last_detections, events[-1] if events else None)
+        end = time.perf_counter()
+        self.render_stats.record(end - start, end - frame.captured_at)
+        for event in events:
+            # Capture of the recognized frame -> recognition handed to the screen
+            self.recognition_latency.record(0.0, end - event.frame.captured_at)
+        return output
+
+    def stats(self):
+        summaries = [self.capture.stats.summary(), self.inference.stats.summary(),
+                     self.recognition.stats.summary(), self.render_stats.summary(),
+                     self.recognition_latency.summary(), self.recognition.tracker.stats(),
+                     self.recognition.outcomes.summary()]
+        if self.inference.scheduler is not None:
+            summaries.append(self.inference.scheduler.stats())
+        if self.recognition.quality_gate is not None:
+            summaries.append(self.recognition.quality_gate.stats())
+        if self.recognition.enrollment is not None:
+            summaries.append(self.recognition.enrollment.stats())
+        if hasattr(self.recognition.face_index, 'stats'):
+            summaries.append(self.recognition.face_index.stats())  # ShardedGallery tiers
+        # Queues feeding each stage: items waiting now and items replaced by newer ones
+        for summary, queue in zip(summaries[1:4], (self.frames, self.detections, self.preview)):
+            summary['kind'] = 'queue'
+            summary['queued'] = len(queue)
+            summary['dropped'] = queue.dropped
+        return summaries
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# Kiosk startup. The slow parts (dlib models, the liveness model, the gallery, UI
+# assets, Firebase, the camera) load on a thread pool instead of one after another:
+# most of their time is file and network I/O or native code. A loader may wait for
+# another one's result (the profile cache needs Firebase), so the pool has a thread
+# for every loader. Before the camera goes live each model runs once on a synthetic
+# frame, so lazy allocation, page faults and graph optimization are paid here and
+# not on the first student's frame.
+# Readiness: state goes starting -> ready -> stopped, or failed. Every change and
+# every finished component is written to status_path as JSON (state, timings,
+# error) for a supervisor or health check to poll.
+
+
+class Startup:
+
+    def __init__(self, status_path=None, workers=16):
+        self.status_path = status_path
+        self.started = time.perf_counter()
+        self.state = None
+        self.since = None
+        self.error = None
+        self.components = {}  # name -> (start offset, seconds, seconds spent waiting on others)
+        self._local = threading.local()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # loaders finish on several threads
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='startup')
+        self.set_state('starting')
+
+    def submit(self, name, fn, *args):
+        self._futures[name] = self._executor.submit(self.run, name, fn, *args)
+        return self._futures[name]
+
+    def run(self, name, fn, *args):
+        # Timed on the calling thread; submit() runs it on the pool
+        start = time.perf_counter()
+        self._local.waited = 0.0
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.components[name] = (start - self.started, time.perf_counter() - start, self._local.waited)
+            self._write_status()
+
+    def result(self, name):
+        # Time blocked here is not counted as the caller's own work
+        start = time.perf_counter()
+        try:
+            return self._futures[name].result()
+        finally:
+            if hasattr(self._local, 'waited'):
+                self._local.waited += time.perf_counter() - start
+
+    def wait(self):
+        # -> {name: result} once every loader is done; the first failure is raised
+        try:
+            return {name: future.result() for name, future in self._futures.items()}
+        except Exception as error:
+            self.fail(error)
+            raise
+
+    def set_state(self, state):
+        with self._lock:
+            self.state = state
+            self.since = time.time()
+        self._write_status()
+
+    def ready(self):
+        self._executor.shutdown(wait=False)
+        self.set_state('ready')
+
+    def fail(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.set_state('failed')
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'since': round(self.since, 3),
+                'elapsed': round(time.perf_counter() - self.started, 3),
+                'error': self.error,
+                'components': {name: {'start': round(start, 3), 'seconds': round(seconds, 3),
+                                      'waited': round(waited, 3)}
+                               for name, (start, seconds, waited) in self.components.items()},
+            }
+
+    def stats(self):
+        # Summary for KioskMetrics: readiness and the seconds of each component
+        status = self.status()
+        return {'stage': 'startup', 'kind': 'startup', 'ready': status['state'] == 'ready',
+                'components': {name: {'seconds': round(entry['seconds'] - entry['waited'], 3)}
+                               for name, entry in status['components'].items()}}
+
+    def _write_status(self):
+        if not self.status_path:
+            return
+        temporary = self.status_path + '.tmp'
+        with self._write_lock:
+            with open(temporary, 'w') as file:
+                json.dump(self.status(), file, indent=2)
+            os.replace(temporary, self.status_path)
+
+    def report(self):
+        status = self.status()
+        components = sorted(status['components'].items(), key=lambda item: item[1]['start'])
+        sequential = sum(entry['seconds'] - entry['waited'] for _, entry in components)
+        lines = [f"startup {status['state']} after {status['elapsed']:.2f} s "
+                 f"({sequential:.2f} s if run one after another)"]
+        for name, entry in components:
+            waited = f", {entry['waited']:.2f} s waiting" if entry['waited'] >= 0.005 else ""
+            lines.append(f"{name:>16}: {entry['start']:6.2f} s -> {entry['start'] + entry['seconds']:6.2f} s "
+                         f"({entry['seconds'] - entry['waited']:.2f} s{waited})")
+        if status['error']:
+            lines.append(f"{'error':>16}: {status['error']}")
+        return "\n".join(lines)
+
+
+def synthetic_frame(shape=(480, 640, 3), seed=0):
+    # Smooth noise: exercises the same code paths as a camera frame
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(shape[0] // 16, shape[1] // 16, shape[2]), dtype=np.uint8)
+    return cv2.resize(small, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+
+
+def warmup_liveness(yolo_model, shape=(480, 640, 3), runs=2):
+    frame = synthetic_frame(shape)
+    for _ in range(runs):
+        yolo_model.detect(frame)
+
+
+def warmup_face_models(face_recognition, quality_gate=None, scale=0.25, shape=(480, 640, 3)):
+    # The kiosk's scaled frame: HOG detector, then the encoder on a fixed box (it runs
+    # whether or not there is a face) and the landmarks the quality gate uses
+    img = synthetic_frame((int(shape[0] * scale), int(shape[1] * scale), 3))
+    face_recognition.face_locations(img)
+    height, width = img.shape[:2]
+    location = (height // 4, width // 2 + height // 4, height * 3 // 4, width // 2 - height // 4)
+    face_recognition.face_encodings(img, [location])
+    if quality_gate is not None and quality_gate.use_pose:
+        quality_gate.pose(img, location)
+
+
+def warmup_gallery(face_index):
+    # Pages in the memory-mapped gallery. For a ShardedGallery only its hot shards: a
+    # query through it would miss them, map the whole global gallery and count in the
+    # tier stats
+    if hasattr(face_index, 'hot_shards'):
+        indexes = [face_index.shard(name) for name in face_index.hot_shards()]
+    else:
+        indexes = [face_index]
+    for index in indexes:
+        if index is not None and len(index):
+            index.match(np.zeros((1, index.dim), dtype=np.float32))
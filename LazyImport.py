@@ -0,0 +1,25 @@
+import importlib
+
+# Module proxy that imports on first attribute access. Importing face_recognition
+# loads the dlib detector, landmark and encoder models (seconds on a kiosk), so the
+# pipeline modules name it with lazy_import() and KioskStartup.py imports it on a
+# loader thread next to the gallery, the liveness model and Firebase.
+
+
+class LazyModule:
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+def lazy_import(name):
+    return LazyModule(name)
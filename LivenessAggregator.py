@@ -0,0 +1,68 @@
+import numpy as np
+
+# Per-face liveness over time. Each tracked face keeps a small ring buffer of its
+# own "real" votes and an exponentially weighted score of P(real) from the model's
+# confidences, so one genuine face can no longer vouch for a photo held next to it.
+# A face enters the real state when the score reaches `enter` and at least
+# `min_votes` of the last `window` frames were labelled real (the old 4-of-5 rule),
+# and leaves it when the score falls below `exit`. Every update is O(1).
+
+
+class LivenessState:
+    # One face's history; created by LivenessAggregator.new_state()
+
+    def __init__(self, window):
+        self.votes = np.zeros(window, dtype=np.uint8)  # ring buffer of real (1) / fake (0) labels
+        self.position = 0
+        self.filled = 0
+        self.real_votes = 0     # running sum of votes
+        self.score = None       # EWMA of P(real); None before the first frame
+        self.real = False
+        self.frames = 0         # frames seen
+        self.decided_at = None  # frame count when the face first entered the real state
+
+    def __repr__(self):
+        return f"LivenessState(real={self.real}, score={self.score}, votes={self.real_votes}/{self.filled})"
+
+
+class LivenessAggregator:
+
+    def __init__(self, window=5, min_votes=None, alpha=0.5, enter=0.7, exit=0.4):
+        if not 0 < alpha <= 1 or not exit <= enter:
+            raise ValueError("need 0 < alpha <= 1 and exit <= enter")
+        self.window = window
+        self.min_votes = window - 1 if min_votes is None else min_votes
+        self.alpha = alpha
+        self.enter = enter
+        self.exit = exit
+
+    def new_state(self):
+        return LivenessState(self.window)
+
+    def update(self, state, label, conf=1.0):
+        # One detection of this face; returns whether it is (still) in the real state
+        vote = 1 if label == "real" else 0
+        p_real = conf if vote else 1.0 - conf
+        if state.filled == self.window:
+            state.real_votes -= int(state.votes[state.position])
+        else:
+            state.filled += 1
+        state.votes[state.position] = vote
+        state.real_votes += vote
+        state.position = (state.position + 1) % self.window
+        state.score = p_real if state.score is None else self.alpha * p_real + (1 - self.alpha) * state.score
+        state.frames += 1
+
+        if state.real:
+            state.real = state.score >= self.exit
+        elif state.score >= self.enter and state.real_votes >= self.min_votes:
+            state.real = True
+            if state.decided_at is None:
+                state.decided_at = state.frames
+        return state.real
+
+    def reset(self, state):
+        state.votes[:] = 0
+        state.position = state.filled = state.real_votes = 0
+        state.score = None
+        state.real = False
@@ -0,0 +1,172 @@
+import os
+import cv2
+import numpy as np
+
+# Inference backends for the YOLO anti-spoofing model. Every backend has
+#   detect(img) -> float32 array (n, 6): x1, y1, x2, y2, conf, cls
+# in the coordinates of the BGR frame it was given, i.e. the same numbers the
+# PyTorch path reads from r.boxes.xyxy / conf / cls. Runtimes are imported only by
+# the backend that needs them, so an ONNX kiosk does not need torch installed.
+
+# ultralytics predict() defaults, applied by the exported-model backends
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+
+
+class TorchBackend:
+
+    def __init__(self, path, imgsz=640, threads=None):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(path)
+        self.imgsz = imgsz
+
+    def detect(self, img):
+        rows = []
+        for r in self.model(img, stream=True, verbose=False, imgsz=self.imgsz):
+            rows.append(r.boxes.data.cpu().numpy()[:, :6])
+        return np.concatenate(rows).astype(np.float32) if rows else np.zeros((0, 6), np.float32)
+
+    def detect_batch(self, imgs):
+        # One forward pass over frames from several cameras
+        return [r.boxes.data.cpu().numpy()[:, :6].astype(np.float32)
+                for r in self.model(list(imgs), stream=True, verbose=False, imgsz=self.imgsz)]
+
+
+class _ExportedBackend:
+    # Letterbox pre-processing and YOLO post-processing shared by ONNX Runtime and OpenVINO
+
+    def __init__(self, imgsz, conf=DEFAULT_CONF, iou=DEFAULT_IOU, dynamic_batch=False):
+        self.imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)  # (height, width)
+        self.conf = conf
+        self.iou = iou
+        self.dynamic_batch = dynamic_batch
+
+    def preprocess(self, img):
+        blob, scale, pad = letterbox(img, self.imgsz)
+        blob = cv2.cvtColor(blob, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)[None]
+        return np.ascontiguousarray(blob, dtype=np.float32) / 255.0, scale, pad
+
+    def postprocess(self, output, scale, pad):
+        output = np.asarray(output, dtype=np.float32)[0]
+        if output.ndim == 2 and output.shape[1] == 6 and output.shape[0] > output.shape[1]:
+            # Exported with nms=True: rows are already x1, y1, x2, y2, conf, cls
+            rows = output[output[:, 4] > self.conf]
+        else:
+            rows = decode_yolo(output, self.conf, self.iou)
+        if len(rows):
+            rows[:, [0, 2]] = (rows[:, [0, 2]] - pad[0]) / scale
+            rows[:, [1, 3]] = (rows[:, [1, 3]] - pad[1]) / scale
+        return rows
+
+    def detect(self, img):
+        blob, scale, pad = self.preprocess(img)
+        return self.postprocess(self.run(blob), scale, pad)
+
+    def detect_batch(self, imgs):
+        # Stacked into one run when the export has a dynamic batch axis (export with dynamic=True)
+        if not self.dynamic_batch or len(imgs) < 2:
+            return [self.detect(img) for img in imgs]
+        prepared = [self.preprocess(img) for img in imgs]
+        output = self.run(np.concatenate([blob for blob, _, _ in prepared]))
+        return [self.postprocess(output[i:i + 1], scale, pad) for i, (_, scale, pad) in enumerate(prepared)]
+
+    def run(self, blob):
+        raise NotImplementedError
+
+
+class OnnxBackend(_ExportedBackend):
+
+    def __init__(self, path, imgsz=640, threads=None, providers=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        shape = self.session.get_inputs()[0].shape
+        if isinstance(shape[2], int) and isinstance(shape[3], int):
+            imgsz = (shape[2], shape[3])  # static export: the model decides
+        super().__init__(imgsz, dynamic_batch=not isinstance(shape[0], int))
+
+    def run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(_ExportedBackend):
+    # Reads either the ONNX file or an OpenVINO IR (.xml)
+
+    def __init__(self, path, imgsz=640, threads=None, device='CPU'):
+        import openvino as ov
+        core = ov.Core()
+        model = core.read_model(path)
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            config['INFERENCE_NUM_THREADS'] = threads
+        self.compiled = core.compile_model(model, device, config)
+        self.request = self.compiled.create_infer_request()
+        shape = model.inputs[0].get_partial_shape()
+        if shape.is_static:
+            imgsz = (shape[2].get_length(), shape[3].get_length())
+        super().__init__(imgsz, dynamic_batch=shape[0].is_dynamic)
+
+    def run(self, blob):
+        return self.request.infer({0: blob})[self.compiled.output(0)]
+
+
+def letterbox(img, new_shape, color=(114, 114, 114)):
+    # Resize keeping aspect ratio and pad to new_shape (height, width), like ultralytics
+    height, width = img.shape[:2]
+    scale = min(new_shape[0] / height, new_shape[1] / width)
+    resized_w, resized_h = round(width * scale), round(height * scale)
+    pad_w, pad_h = (new_shape[1] - resized_w) / 2, (new_shape[0] - resized_h) / 2
+    if (resized_w, resized_h) != (width, height):
+        img = cv2.resize(img, (resized_w, resized_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = round(pad_h - 0.1), round(pad_h + 0.1)
+    left, right = round(pad_w - 0.1), round(pad_w + 0.1)
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return img, scale, (left, top)
+
+
+def decode_yolo(output, conf, iou):
+    # YOLOv8 head: (4 + classes, anchors) of cx, cy, w, h, class scores -> NMS'd rows
+    predictions = output.T if output.shape[0] < output.shape[1] else output
+    scores = predictions[:, 4:]
+    cls = scores.argmax(axis=1)
+    best = scores[np.arange(len(scores)), cls]
+    keep = best > conf
+    if not keep.any():
+        return np.zeros((0, 6), np.float32)
+    boxes, best, cls = predictions[keep, :4], best[keep], cls[keep]
+
+    xyxy = np.empty_like(boxes)
+    xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+    xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+    rows = []
+    for c in np.unique(cls):  # class-aware NMS, as ultralytics does by default
+        members = np.flatnonzero(cls == c)
+        rects = [[float(x1), float(y1), float(x2 - x1), float(y2 - y1)] for x1, y1, x2, y2 in xyxy[members]]
+        kept = cv2.dnn.NMSBoxes(rects, best[members].tolist(), conf, iou)
+        for k in np.array(kept).reshape(-1):
+            i = members[k]
+            rows.append([*xyxy[i], best[i], c])
+    rows = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return rows[np.argsort(-rows[:, 4])]
+
+
+def load_liveness_model(path, backend=None, imgsz=640, threads=None):
+    # backend: 'torch', 'onnx' or 'openvino'; picked from the file extension when omitted
+    if backend is None:
+        extension = os.path.splitext(path)[1].lower()
+        backend = {'.onnx': 'onnx', '.xml': 'openvino'}.get(extension, 'torch')
+    if backend == 'torch':
+        return TorchBackend(path, imgsz, threads)
+    if backend == 'onnx':
+        return OnnxBackend(path, imgsz, threads)
+    if backend == 'openvino':
+        return OpenVinoBackend(path, imgsz, threads)
+    raise ValueError(f"unknown liveness backend {backend!r}")
@@ -0,0 +1,284 @@
+import argparse
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import firebase_admin
+from firebase_admin import credentials, db
+from GalleryFile import load_face_index
+from LivenessBackend import load_liveness_model
+from KioskPipeline import (CaptureStage, LatestQueue, RecognitionCounts, StageStats, assign_matches, encode_boxes,
+                           format_stats, to_boxes)
+from FaceTracker import FaceTracker
+from FaceQuality import QualityGate
+from OnlineEnrollment import OnlineEnrollment
+from KioskMetrics import MetricsLog, MetricsServer, SamplingProfiler, install_profiler_signal
+from ShardedGallery import ShardedGallery, Timetable
+from AttendanceSink import AttendanceSink, FirebaseBackend, attendance_lookup
+from AttendanceLedger import AttendanceLedger
+from ProfileCache import ProfileCache
+
+# Headless attendance for several entrances from one process:
+#   python MultiCameraServer.py 0 1 rtsp://door-2/stream recordings/door3.mp4
+# Every tick takes the newest frame of each stream, runs the anti-spoofing model once
+# on the whole batch, encodes the faces that need it in a bounded pool of worker
+# processes and matches all encodings in one gallery query. The gallery, the liveness
+# model, the attendance sink and the profile cache are shared; trackers (with their
+# per-face liveness) and the "just recognized" hold are kept per stream.
+
+
+class CameraStream:
+    # Per-entrance state; only the server loop touches it (capture has its own thread)
+
+    def __init__(self, name, source, stop_event, hold_frames=70):
+        self.name = name
+        self.cap = cv2.VideoCapture(source)
+        self.frames = LatestQueue()
+        self.capture = CaptureStage(self.cap, [self.frames], stop_event, flip=False)
+        self.capture.name = f'capture-{name}'
+        self.tracker = FaceTracker()  # tracks carry their own liveness history, as in the kiosk
+        self.hold_frames = hold_frames  # frames recognition pauses after a student, like the kiosk UI sequence
+        self.hold = 0
+        self.stats = StageStats(name)
+        self.recognitions = 0
+
+    def observe(self, frame, boxes):
+        # Tracker and per-face liveness for one frame; returns (live tracks, tracks to encode)
+        tracks = self.tracker.update([box[:4] for box in boxes], [box[4] for box in boxes], frame.index,
+                                     [box[5] for box in boxes])
+        if self.hold:
+            self.hold -= 1
+            if not self.hold:
+                self.tracker.reset_liveness()
+            return [], []
+        live_tracks = [track for track in tracks if track.verified_real]
+        return live_tracks, [track for track in live_tracks if self.tracker.needs_encoding(track, frame.index)]
+
+    def summary(self):
+        s = self.stats.summary()
+        s['kind'] = 'camera'
+        s['queued'] = len(self.frames)
+        s['dropped'] = self.frames.dropped
+        s['recognitions'] = self.recognitions
+        s['fake_detections'] = self.tracker.fake_detections
+        s['spoof_rejections'] = self.tracker.spoof_rejections
+        return s
+
+
+class MultiCameraServer:
+
+    def __init__(self, sources, yolo_model, face_index, lookup_attendance, workers=None,
+                 confidence_threshold=0.6, classNames=("fake", "real"), single_pass=False, encode_scale=0.25,
+                 quality_gate=None, enrollment=None):
+        self.stop_event = threading.Event()
+        self.streams = [CameraStream(f'cam{i}', source, self.stop_event) for i, source in enumerate(sources)]
+        self.yolo_model = yolo_model
+        self.face_index = face_index
+        self.lookup_attendance = lookup_attendance
+        self.confidence_threshold = confidence_threshold
+        self.classNames = classNames
+        self.single_pass = single_pass
+        self.encode_scale = encode_scale
+        self.quality_gate = quality_gate  # scored in the workers, counted and logged here
+        self.enrollment = enrollment
+        # More encoders than streams never helps (one frame per stream per tick), nor more than cores
+        self.workers = max(1, min(workers or os.cpu_count(), len(self.streams), os.cpu_count()))
+        self.executor = None
+        self.inference = StageStats('inference')
+        self.encoding = StageStats('encoding')
+        self.outcomes = RecognitionCounts()
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        for stream in self.streams:
+            stream.capture.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for stream in self.streams:
+            stream.capture.join(timeout=1.0)
+            stream.cap.release()
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.quality_gate is not None:
+            self.quality_gate.close()
+        if self.enrollment is not None:
+            self.enrollment.save()
+
+    def step(self, timeout=0.05):
+        # One tick over all streams; returns the number of frames processed
+        ready = [(stream, stream.frames.get(timeout=0)) for stream in self.streams]
+        ready = [(stream, frame) for stream, frame in ready if frame is not None]
+        if not ready:
+            time.sleep(timeout / 10)
+            return 0
+
+        tick_start = time.perf_counter()
+        batch = self.yolo_model.detect_batch([frame.img for _, frame in ready])
+        self.inference.record(time.perf_counter() - tick_start)
+
+        work = []  # (stream, frame, live tracks, pending tracks)
+        for (stream, frame), rows in zip(ready, batch):
+            boxes = to_boxes(rows, self.confidence_threshold, self.classNames)
+            work.append((stream, frame, *stream.observe(frame, boxes)))
+
+        start = time.perf_counter()
+        futures = [self.executor.submit(encode_boxes, frame.img, [track.box for track in pending],
+                                        [track.label for track in pending], self.single_pass, self.encode_scale,
+                                        None, self.quality_gate)
+                   if pending else None
+                   for _, frame, _, pending in work]
+        encoded = [future.result() if future else ([], [], []) for future in futures]
+        # Every encoding of the tick in one gallery query
+        encodings = [encoding for _, frame_encodings, _ in encoded for encoding in frame_encodings]
+        matchIds, matchDistances = self.face_index.match(encodings) if encodings else ([], np.zeros(0))
+        if any(pending for _, _, _, pending in work):
+            self.encoding.record(time.perf_counter() - start)
+
+        offset = 0
+        for (stream, frame, live_tracks, pending), (rows, frame_encodings, qualities) in zip(work, encoded):
+            count = len(frame_encodings)
+            frameIds, frameDistances = matchIds[offset:offset + count], matchDistances[offset:offset + count]
+            assign_matches(stream.tracker, pending, [pending[row] for row in rows], frameIds, frameDistances,
+                           frame.index)
+            offset += count
+            if self.quality_gate is not None:
+                for quality in qualities:
+                    pending[quality.row].quality = quality
+                self.quality_gate.note(qualities, dict(zip(rows, zip(frameIds, frameDistances))), stream.name)
+            if self.enrollment is not None:
+                for row, encoding, matchId, distance in zip(rows, frame_encodings, frameIds, frameDistances):
+                    self.enrollment.offer(matchId, encoding, distance, pending[row].liveness.score,
+                                          pending[row].quality)
+            if live_tracks:
+                stream.tracker.count_frame(len(live_tracks), count)
+            self.announce(stream, frame, live_tracks)
+            end = time.perf_counter()
+            stream.stats.record(end - tick_start, end - frame.captured_at)
+        return len(ready)
+
+    def announce(self, stream, frame, live_tracks):
+        for track in live_tracks:
+            if track.identity is None:
+                continue
+            studentInfo, marked = self.lookup_attendance(track.identity, camera=stream.name, distance=track.distance,
+                                                         liveness=track.liveness.score)
+            self.outcomes.count(studentInfo, marked)
+            if studentInfo is None:
+                continue
+            stream.recognitions += 1
+            stream.hold = stream.hold_frames
+            state = "marked" if marked else "already marked"
+            print(f"[{stream.name}] frame {frame.index}: {track.identity} {studentInfo.get('name', '')} {state}")
+            return
+
+    def stats(self):
+        summaries = [stream.summary() for stream in self.streams] + [self.inference.summary(),
+                                                                     self.encoding.summary(),
+                                                                     self.outcomes.summary()]
+        if self.quality_gate is not None:
+            summaries.append(self.quality_gate.stats())
+        if self.enrollment is not None:
+            summaries.append(self.enrollment.stats())
+        if hasattr(self.face_index, 'stats'):
+            summaries.append(self.face_index.stats())
+        return summaries
+
+
+def parse_source(source):
+    # Digits are camera indices; anything else (RTSP URL, file) goes to VideoCapture as is
+    return int(source) if source.isdigit() else source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-camera attendance server")
+    parser.add_argument('sources', nargs='+', help="camera indices, RTSP URLs or video files")
+    parser.add_argument('--model', default='../models/n_version_4_75.pt')
+    parser.add_argument('--backend', default=None, help="torch, onnx or openvino (default: from the extension)")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--threads', type=int, default=None, help="liveness runtime threads")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="encoding processes (capped at the number of streams and cores)")
+    parser.add_argument('--gallery', default='EncodeFile.gal')
+    parser.add_argument('--shards', default=None, help="directory of gallery shards (ShardedGallery.py build)")
+    parser.add_argument('--hot', nargs='*', default=[], help="shards searched before the global gallery")
+    parser.add_argument('--timetable', default=None, help="CSV of day,start,end,shard choosing the hot shards")
+    parser.add_argument('--single-pass', action='store_true', help="encode the YOLO real boxes directly")
+    parser.add_argument('--confidence', type=float, default=0.6)
+    parser.add_argument('--no-quality-gate', action='store_true', help="encode every face, however poor")
+    parser.add_argument('--quality-log', default=None, help="append every quality decision to this JSONL file")
+    parser.add_argument('--online-enrollment', default=None, metavar='PATH',
+                        help="add confident live captures to the gallery, kept in this side gallery")
+    parser.add_argument('--stats-interval', type=float, default=10.0)
+    parser.add_argument('--metrics-port', type=int, default=9109,
+                        help="local Prometheus /metrics endpoint (0: off), see KioskMetrics.py")
+    parser.add_argument('--metrics-log', default=None, help="append all stats as a JSON line every --stats-interval")
+    parser.add_argument('--profile-dir', default='profiles', help="where SIGUSR1 sampling profiles are written")
+    parser.add_argument('--ledger', default='attendance_ledger.db', help="local history of every recognition")
+    args = parser.parse_args()
+
+    # === Firebase Setup ===
+    cred = credentials.Certificate("serviceAccountKey.json")
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': "https://faceattendancerealtime-2e6b8-default-rtdb.firebaseio.com/"
+    })
+
+    if args.shards:
+        face_index = ShardedGallery(args.shards, args.gallery, Timetable(args.timetable) if args.timetable else args.hot)
+    else:
+        face_index = load_face_index(args.gallery)
+    enrollment = None
+    if args.online_enrollment:
+        enrollment = OnlineEnrollment(face_index, args.online_enrollment)
+        print(f"Loaded {enrollment.load()} online encodings")
+    yolo_model = load_liveness_model(args.model, args.backend, args.imgsz, args.threads)
+    if os.path.exists('attendance_journal.db'):
+        AttendanceSink(FirebaseBackend(db), journal_path='attendance_journal.db').start().stop()  # send old marks
+    attendance_ledger = AttendanceLedger(args.ledger)
+    attendance_sink = AttendanceSink(FirebaseBackend(db), journal=attendance_ledger).start()
+    profile_cache = ProfileCache(db)
+    print(f"Loaded {profile_cache.warm()} student profiles")
+    profile_cache.start()
+
+    # Same rule as the kiosk; the server loop is the only caller, so streams never race
+    lookup_attendance = attendance_lookup(profile_cache, attendance_sink, min_seconds=30)
+
+    server = MultiCameraServer([parse_source(source) for source in args.sources], yolo_model, face_index,
+                               lookup_attendance, args.workers, args.confidence, single_pass=args.single_pass,
+                               quality_gate=None if args.no_quality_gate else QualityGate(log_path=args.quality_log),
+                               enrollment=enrollment)
+    server.start()
+
+    def collect():
+        return server.stats() + [attendance_sink.stats(), profile_cache.stats()]
+
+    metrics = MetricsServer(collect, args.metrics_port).start() if args.metrics_port else None
+    metrics_log = MetricsLog(collect, args.metrics_log, args.stats_interval).start() if args.metrics_log else None
+    install_profiler_signal(SamplingProfiler(directory=args.profile_dir))
+    print(f"Serving {len(server.streams)} streams with {server.workers} encoding workers (Ctrl+C to stop)")
+    last_report = time.perf_counter()
+    try:
+        while True:
+            server.step()
+            if time.perf_counter() - last_report > args.stats_interval:
+                print(format_stats(collect()))
+                last_report = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_log is not None:
+            metrics_log.stop()
+        if metrics is not None:
+            metrics.stop()
+        server.stop()
+        attendance_sink.stop()
+        attendance_ledger.close()
+        profile_cache.stop()
+        print(format_stats(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
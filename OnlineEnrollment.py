@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+import numpy as np
+from GalleryFile import load_gallery, save_gallery
+
+# Grows the gallery from live captures. A recognized face is added as another
+# encoding of its student when the match was confident, the face is live and passed
+# the quality gate, and it is not a near-duplicate of what the gallery already has
+# (the match distance is to the student's nearest stored encoding). Each student gets
+# at most `cap` online encodings, one per `min_interval` seconds at most.
+# Additions are kept in a side gallery (EncodeFile.online.gal), merged into the
+# face index at startup, so re-running EncodeGenerator.py never loses them; delete
+# the file to drop them.
+
+
+class OnlineEnrollment:
+
+    def __init__(self, face_index, path='EncodeFile.online.gal', max_distance=0.4, min_novelty=0.15,
+                 min_liveness=0.9, cap=10, min_interval=60.0, save_every=10):
+        self.face_index = face_index
+        self.path = path
+        self.max_distance = max_distance  # confident matches only
+        self.min_novelty = min_novelty    # closer than this to a stored encoding adds nothing
+        self.min_liveness = min_liveness  # LivenessState.score of the track
+        self.cap = cap
+        self.min_interval = min_interval
+        self.save_every = save_every
+        self.encodings, self.ids = [], []
+        self._counts = {}
+        self._last_added = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+        self.offered = 0
+        self.added = 0
+        self.rejected = {}
+
+    def load(self):
+        # Re-adds the captures of earlier runs; returns how many
+        if not os.path.exists(self.path):
+            return 0
+        embeddings, _, ids = load_gallery(self.path)
+        if not ids:
+            return 0
+        embeddings = np.array(embeddings)
+        self._add(embeddings, ids)
+        with self._lock:
+            self.encodings.extend(embeddings)
+            self.ids.extend(ids)
+            for identity in ids:
+                self._counts[identity] = self._counts.get(identity, 0) + 1
+        return len(ids)
+
+    def _add(self, encodings, ids):
+        # Students now have several rows: same two-stage search load_face_index picks
+        # for such galleries (ShardedGallery has none; its shards are small)
+        if getattr(self.face_index, 'identities', False) is None:
+            self.face_index.build_identities()
+        self.face_index.add(encodings, ids)
+
+    def _reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return False
+
+    def offer(self, identity, encoding, distance, liveness=None, quality=None, now=None):
+        # One recognized face; returns whether it was added
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.offered += 1
+            if identity is None or distance > self.max_distance:
+                return self._reject('distance')
+            if distance < self.min_novelty:
+                return self._reject('duplicate')
+            if liveness is None or liveness < self.min_liveness:
+                return self._reject('liveness')
+            if quality is not None and not quality.passed:
+                return self._reject('quality')
+            if self._counts.get(identity, 0) >= self.cap:
+                return self._reject('cap')
+            if now - self._last_added.get(identity, -np.inf) < self.min_interval:
+                return self._reject('interval')
+
+            encoding = np.asarray(encoding, dtype=np.float32)
+            self._add([encoding], [identity])
+            self.encodings.append(encoding)
+            self.ids.append(identity)
+            self._counts[identity] = self._counts.get(identity, 0) + 1
+            self._last_added[identity] = now
+            self.added += 1
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save()
+            return True
+
+    def save(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def _save(self):
+        save_gallery(self.path, np.array(self.encodings, dtype=np.float32).reshape(-1, self.face_index.dim),
+                     self.ids, dim=self.face_index.dim)
+        self._unsaved = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stage': 'enrollment',
+                'kind': 'enrollment',
+                'offered': self.offered,
+                'added': self.added,
+                'online_encodings': len(self.ids),
+                'students': len(self._counts),
+                'rejected': dict(self.rejected),
+            }
@@ -0,0 +1,196 @@
+import copy
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from KioskPipeline import StageStats
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MISSING = object()  # cached "no such profile", so unknown ids don't go back to the network every frame
+
+
+def _split(path):
+    return [part for part in str(path).split('/') if part]
+
+
+class ProfileCache:
+    # Read-through cache of Students/{id} with LRU + TTL eviction.
+    # warm() bulk-loads the whole Students node once; start() keeps it fresh with a
+    # database listener, or a periodic re-read when listen() is not available.
+    # The 30-second duplicate check is answered from a local last-seen index, which
+    # survives profile eviction and is updated on every local mark.
+    # An id without a profile is cached as MISSING, with the same TTL and LRU slot.
+
+    def __init__(self, db, root='Students', max_entries=10000, ttl=600.0, refresh_interval=60.0):
+        self.db = db
+        self.root = root
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._profiles = OrderedDict()  # id -> (profile or MISSING, fetched_at)
+        self._last_seen = {}            # id -> datetime of last attendance
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._listener = None
+        self._refresher = None
+
+        self.fetch_stats = StageStats('profile fetch')
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0   # failed database reads
+
+    def warm(self):
+        start = time.perf_counter()
+        students = self.db.reference(self.root).get() or {}
+        self.fetch_stats.record(time.perf_counter() - start)
+        with self._lock:
+            self._drop_missing()
+            for student_id, profile in students.items():
+                self._store(student_id, profile)
+        return len(students)
+
+    def invalidate(self, student_id=None):
+        # Forget one id (or everything), e.g. after enrolling a student; the next get() reads it again
+        with self._lock:
+            if student_id is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(str(student_id), None)
+
+    def start(self):
+        # Prefer a change feed; fall back to polling the whole node
+        try:
+            self._listener = self.db.reference(self.root).listen(self._on_change)
+        except Exception:
+            traceback.print_exc()
+            self._refresher = threading.Thread(target=self._refresh_loop, name='profile-refresh', daemon=True)
+            self._refresher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+
+    def get(self, student_id):
+        student_id = str(student_id)
+        with self._lock:
+            entry = self._profiles.get(student_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._profiles.move_to_end(student_id)
+                self.hits += 1
+                return None if entry[0] is MISSING else copy.deepcopy(entry[0])
+            self.misses += 1
+
+        start = time.perf_counter()
+        try:
+            profile = self.db.reference(f'{self.root}/{student_id}').get()
+        except Exception:
+            self.errors += 1
+            raise
+        self.fetch_stats.record(time.perf_counter() - start)
+        with self._lock:
+            if profile is None:
+                self._store(student_id, MISSING)
+                return None
+            self._store(student_id, profile)
+        return copy.deepcopy(profile)
+
+    def seconds_since_seen(self, student_id, now=None):
+        last = self._last_seen.get(str(student_id))
+        if last is None:
+            return float('inf')
+        return ((now or datetime.now()) - last).total_seconds()
+
+    def note_marked(self, student_id, marked_at):
+        # Keep the cached profile in step with a mark we just queued
+        student_id = str(student_id)
+        with self._lock:
+            self._last_seen[student_id] = datetime.strptime(marked_at, TIME_FORMAT)
+            entry = self._profiles.get(student_id)
+            if entry is not None and entry[0] is not MISSING:
+                entry[0]['total_attendance'] = entry[0].get('total_attendance', 0) + 1
+                entry[0]['last_attendance_time'] = marked_at
+
+    def _store(self, student_id, profile):
+        student_id = str(student_id)
+        if profile is not MISSING and not isinstance(profile, dict):
+            self._profiles.pop(student_id, None)
+            return
+        self._profiles[student_id] = (profile, time.monotonic())
+        self._profiles.move_to_end(student_id)
+        if profile is not MISSING:
+            self._note_seen(student_id, profile.get('last_attendance_time'))
+        while len(self._profiles) > self.max_entries:
+            self._profiles.popitem(last=False)
+            self.evictions += 1
+
+    def _drop_missing(self):
+        for student_id in [student_id for student_id, entry in self._profiles.items() if entry[0] is MISSING]:
+            del self._profiles[student_id]
+
+    def _note_seen(self, student_id, last_attendance_time):
+        if not last_attendance_time:
+            return
+        try:
+            seen = datetime.strptime(last_attendance_time, TIME_FORMAT)
+        except ValueError:
+            return
+        # Never move backwards: a local mark may be newer than what the server has yet
+        if student_id not in self._last_seen or seen > self._last_seen[student_id]:
+            self._last_seen[student_id] = seen
+
+    def _on_change(self, event):
+        # firebase_admin listener events: a path relative to the root and the data there.
+        # A 'patch' carries several child paths at once; apply each as a 'put'.
+        parts = _split(event.path)
+        with self._lock:
+            if event.event_type == 'patch':
+                for key, value in (event.data or {}).items():
+                    self._apply(parts + _split(key), value)
+            else:
+                self._apply(parts, event.data)
+
+    def _apply(self, parts, data):
+        if not parts:
+            self._profiles.clear()
+            for student_id, profile in (data or {}).items():
+                self._store(student_id, profile)
+        elif len(parts) == 1:
+            self._store(parts[0], data)
+        else:
+            entry = self._profiles.get(parts[0])
+            if entry is not None and entry[0] is not MISSING and len(parts) == 2:
+                entry[0][parts[1]] = data
+                self._store(parts[0], entry[0])
+            else:
+                # Deeper change, or a profile we don't hold: the next get() re-reads it
+                self._profiles.pop(parts[0], None)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.warm()
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+
+    def stats(self):
+        summary = self.fetch_stats.summary()
+        lookups = self.hits + self.misses
+        with self._lock:
+            missing = sum(1 for entry, _ in self._profiles.values() if entry is MISSING)
+            size = len(self._profiles) - missing
+        summary.update({
+            'kind': 'profile_cache',
+            'size': size,
+            'missing': missing,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'errors': self.errors,
+        })
+        return summary
@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from FakeFirebase import FakeDatabase
+from AttendanceSink import AttendanceSink, FirebaseBackend, attendance_lookup
+from ProfileCache import ProfileCache
+from InferenceScheduler import InferenceScheduler
+from FaceQuality import QualityGate
+from GalleryFile import load_face_index
+from LivenessBackend import load_liveness_model
+from KioskPipeline import Frame, InferenceStage, KioskUI, LatestQueue, RecognitionStage
+
+# Replays a recorded clip (video file or folder of frames) through the kiosk's
+# recognition loop, headless and against an in-memory database, and writes per-stage
+# latency histograms as JSON:
+#   python ReplayBenchmark.py Samples/entrance.mp4 --fps 30 --output replay.json
+#   python ReplayBenchmark.py Samples/entrance.mp4 --baseline replay.json   # CI: exit 1 on regression
+# The stages are the kiosk's own (InferenceStage, RecognitionStage, KioskUI), called
+# one frame at a time on this thread, so a replay always sees every frame in order.
+# --fps paces frames like a camera would (frames that miss their slot are counted
+# as late); --fps 0 runs as fast as possible. With a clip of several people at the
+# door, --multi-subject vs the default shows the gain in people_per_minute, and
+# --quality-gate vs the default the drop in encodes_per_student and unmatched encodes.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+STAGES = ('capture', 'yolo', 'resize', 'locate', 'quality', 'encode', 'match', 'db', 'compose', 'frame')
+# Upper bucket edges in ms; the last bucket is everything above
+HISTOGRAM_EDGES_MS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class Histogram:
+
+    def __init__(self, name, edges=HISTOGRAM_EDGES_MS):
+        self.name = name
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.samples = []
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.samples.append(ms)
+        self.counts[int(np.searchsorted(self.edges, ms))] += 1
+
+    def summary(self):
+        samples = np.array(self.samples)
+        summary = {'count': len(samples)}
+        if len(samples):
+            p50, p90, p95, p99 = np.percentile(samples, [50, 90, 95, 99])
+            summary.update({'mean_ms': float(samples.mean()), 'max_ms': float(samples.max()),
+                            'total_ms': float(samples.sum()), 'p50_ms': float(p50), 'p90_ms': float(p90),
+                            'p95_ms': float(p95), 'p99_ms': float(p99)})
+        labels = [f"<={edge}" for edge in self.edges] + [f">{self.edges[-1]}"]
+        summary['buckets_ms'] = dict(zip(labels, self.counts))
+        return summary
+
+
+class TimedModel:
+    # Liveness backend wrapper that records every detect() call
+
+    def __init__(self, model, histogram):
+        self.model = model
+        self.histogram = histogram
+
+    def detect(self, img):
+        start = time.perf_counter()
+        rows = self.model.detect(img)
+        self.histogram.add(time.perf_counter() - start)
+        return rows
+
+
+class TimedIndex:
+    # FaceIndex wrapper that records every match() call
+
+    def __init__(self, face_index, histogram):
+        self.face_index = face_index
+        self.histogram = histogram
+
+    def match(self, queries, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.face_index.match(queries, *args, **kwargs)
+        self.histogram.add(time.perf_counter() - start)
+        return result
+
+
+def read_frames(source, size=(640, 480), flip=False, limit=None):
+    # Frames of a video file, or of the images in a folder in name order
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                       if name.lower().endswith(IMAGE_EXTENSIONS))
+        images = (cv2.imread(path) for path in paths)
+    else:
+        cap = cv2.VideoCapture(source)
+
+        def video():
+            try:
+                while True:
+                    success, img = cap.read()
+                    if not success:
+                        return
+                    yield img
+            finally:
+                cap.release()
+        images = video()
+
+    count = 0
+    for img in images:
+        if img is None:
+            continue
+        if limit is not None and count >= limit:
+            return
+        if img.shape[1::-1] != size:
+            img = cv2.resize(img, size)
+        yield cv2.flip(img, 1) if flip else img
+        count += 1
+
+
+def source_fps(source):
+    if os.path.isdir(source):
+        return 0.0
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps and fps < 1000 else 0.0
+
+
+def stub_students(ids):
+    # Profiles for every gallery id, in the Students/{id} shape the UI draws
+    return {str(student_id): {'name': str(student_id), 'major': 'Replay', 'starting_year': 2020,
+                              'total_attendance': 0, 'standing': 'G', 'year': 1,
+                              'last_attendance_time': '2000-01-01 00:00:00'}
+            for student_id in ids}
+
+
+def replay(frames, yolo_model, face_index, lookup_attendance, imgBackground, imgModeList, fps=0.0,
+           confidence_threshold=0.6, classNames=("fake", "real"), single_pass=False, scheduler=None, media_fps=30.0,
+           multi_subject=False, quality_gate=None):
+    # scheduler: optional InferenceScheduler, clocked by the clip (frame index / media_fps)
+    # rather than the wall, so a gated replay is the same at any --fps
+    histograms = {name: Histogram(name) for name in STAGES}
+    stop_event, ui_busy, liveness_reset = threading.Event(), threading.Event(), threading.Event()
+    detections_queue, events_queue = LatestQueue(), LatestQueue(64 if multi_subject else 1)
+    timings = {}
+
+    def timed_lookup(id, **details):
+        start = time.perf_counter()
+        result = lookup_attendance(id, **details)
+        histograms['db'].add(time.perf_counter() - start)
+        return result
+
+    inference = InferenceStage(None, [detections_queue], stop_event,
+                               TimedModel(yolo_model, histograms['yolo']), confidence_threshold, classNames)
+    recognition = RecognitionStage(detections_queue, events_queue, stop_event, ui_busy,
+                                   TimedIndex(face_index, histograms['match']), timed_lookup,
+                                   single_pass=single_pass, timings=timings, multi_subject=multi_subject,
+                                   liveness_reset=liveness_reset, quality_gate=quality_gate)
+    ui = KioskUI(imgBackground, imgModeList, ui_busy, liveness_reset, info_frames=20 if multi_subject else 40,
+                 multi_subject=multi_subject)
+
+    frames = iter(frames)
+    recognitions, marks, late = [], 0, 0
+    detections = None
+    started = time.perf_counter()
+    index = 0
+    while True:
+        if fps:
+            # Frame index / fps is when the camera would have delivered this frame
+            delay = started + index / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1 / fps:
+                late += 1
+        start = time.perf_counter()
+        img = next(frames, None)
+        if img is None:
+            break
+        frame = Frame(index, time.perf_counter(), img)
+        histograms['capture'].add(frame.captured_at - start)
+
+        clock = index / media_fps
+        if scheduler is None or scheduler.should_run(img, clock):
+            inference.process(frame)
+            detections = detections_queue.get(0)
+            if scheduler is not None:
+                scheduler.note_faces(len(detections.boxes), clock)
+            timings.clear()
+            recognition.process(detections)
+            for step in ('resize', 'locate', 'quality', 'encode'):
+                if step in timings:
+                    histograms[step].add(timings[step])
+        events = []
+        while True:
+            event = events_queue.get(0)
+            if event is None:
+                break
+            events.append(event)
+            recognitions.append({'frame': index, 'student_id': event.student_id, 'marked': event.marked})
+            marks += int(event.marked)
+
+        compose_start = time.perf_counter()
+        for event in events[:-1]:
+            ui.push(event)
+        ui.compose(img, detections, events[-1] if events else None)
+        end = time.perf_counter()
+        histograms['compose'].add(end - compose_start)
+        histograms['frame'].add(end - start)
+        index += 1
+
+    wall = time.perf_counter() - started
+    clip_minutes = index / media_fps / 60
+    students = len({recognition['student_id'] for recognition in recognitions})
+    return {
+        'frames': index,
+        'wall_s': wall,
+        'fps': index / wall if wall else 0.0,
+        'paced_fps': fps,
+        'late_frames': late,
+        'recognitions': recognitions,
+        'marks': marks,
+        'first_recognition_frame': recognitions[0]['frame'] if recognitions else None,
+        'students': students,
+        # Distinct students recognized per minute of clip time: doorway throughput
+        'people_per_minute': students / clip_minutes if clip_minutes else 0.0,
+        'tracker': recognition.tracker.stats(),
+        # dlib encodes spent per recognized student (lower is better, see --quality-gate)
+        'encodes_per_student': recognition.tracker.encoded_faces / students if students else None,
+        'scheduler': scheduler.stats() if scheduler is not None else None,
+        'quality': quality_gate.stats() if quality_gate is not None else None,
+        'stages': {name: histogram.summary() for name, histogram in histograms.items()},
+    }
+
+
+def check_regression(result, baseline, max_slowdown):
+    # Throughput and frame latency against a previous run; returns failure messages
+    failures = []
+    if baseline.get('frames') != result['frames']:
+        failures.append(f"frame count {result['frames']} != baseline {baseline.get('frames')}")
+    if not result['paced_fps'] and result['fps'] < baseline['fps'] * (1 - max_slowdown):
+        failures.append(f"throughput {result['fps']:.1f} fps < baseline {baseline['fps']:.1f} fps")
+    for key in ('p50_ms', 'p95_ms'):
+        now, before = result['stages']['frame'].get(key), baseline['stages']['frame'].get(key)
+        if now is not None and before and now > before * (1 + max_slowdown):
+            failures.append(f"frame {key} {now:.1f} > baseline {before:.1f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless replay of a recorded clip through the kiosk loop")
+    parser.add_argument('source', help="video file or folder of frames")
+    parser.add_argument('--model', default='../models/n_version_4_75.pt')
+    parser.add_argument('--backend', default=None, help="torch, onnx or openvino (default: from the extension)")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--gallery', default='EncodeFile.gal')
+    parser.add_argument('--fps', type=float, default=None,
+                        help="pace frames at this rate; 0 = as fast as possible (default: the clip's rate)")
+    parser.add_argument('--limit', type=int, default=None, help="stop after this many frames")
+    parser.add_argument('--flip', action='store_true', help="mirror frames like the live camera")
+    parser.add_argument('--single-pass', action='store_true')
+    parser.add_argument('--motion-gate', action='store_true', help="run the models through InferenceScheduler")
+    parser.add_argument('--multi-subject', action='store_true', help="every live face gets its own event")
+    parser.add_argument('--quality-gate', action='store_true', help="skip faces that fail the pre-encode checks")
+    parser.add_argument('--quality-log', default=None,
+                        help="append every quality decision and its match to this JSONL file "
+                             "(without --quality-gate every face is still encoded)")
+    parser.add_argument('--confidence', type=float, default=0.6)
+    parser.add_argument('--db-latency', type=float, default=0.0, help="simulated database round trip (s)")
+    parser.add_argument('--output', help="write the JSON report here (default: stdout)")
+    parser.add_argument('--baseline', help="previous JSON report; exit 1 on a regression")
+    parser.add_argument('--max-slowdown', type=float, default=0.2, help="tolerated regression vs the baseline")
+    args = parser.parse_args()
+
+    face_index = load_face_index(args.gallery)
+    yolo_model = load_liveness_model(args.model, args.backend, args.imgsz, args.threads)
+    imgBackground = cv2.imread('Resources/background.png')
+    folderModePath = 'Resources/Modes'
+    imgModeList = [cv2.imread(os.path.join(folderModePath, path)) for path in sorted(os.listdir(folderModePath))]
+
+    # Stub attendance backend: the real sink and cache over an in-memory database
+    database = FakeDatabase({'Students': stub_students(face_index.ids)}, latency=args.db_latency)
+    with tempfile.TemporaryDirectory() as journal_dir:
+        attendance_sink = AttendanceSink(FirebaseBackend(database),
+                                         journal_path=os.path.join(journal_dir, 'journal.db')).start()
+        profile_cache = ProfileCache(database)
+        profile_cache.warm()
+        fps = source_fps(args.source) if args.fps is None else args.fps
+        scheduler = InferenceScheduler() if args.motion_gate else None
+        quality_gate = None
+        if args.quality_gate or args.quality_log:
+            quality_gate = QualityGate(enforce=args.quality_gate, log_path=args.quality_log)
+        try:
+            result = replay(read_frames(args.source, flip=args.flip, limit=args.limit), yolo_model, face_index,
+                            attendance_lookup(profile_cache, attendance_sink), imgBackground, imgModeList,
+                            fps, args.confidence, single_pass=args.single_pass, scheduler=scheduler,
+                            media_fps=source_fps(args.source) or 30.0, multi_subject=args.multi_subject,
+                            quality_gate=quality_gate)
+        finally:
+            attendance_sink.stop()
+            if quality_gate is not None:
+                quality_gate.close()
+    result.update({'source': args.source, 'model': args.model, 'single_pass': args.single_pass,
+                   'motion_gate': args.motion_gate, 'multi_subject': args.multi_subject,
+                   'quality_gate': args.quality_gate})
+
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    print(f"{result['frames']} frames in {result['wall_s']:.1f} s ({result['fps']:.1f} fps), "
+          f"{result['late_frames']} late, {len(result['recognitions'])} recognitions, "
+          f"first at frame {result['first_recognition_frame']}, {result['people_per_minute']:.1f} people/min",
+          file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = check_regression(result, json.load(f), args.max_slowdown)
+        for failure in failures:
+            print(f"REGRESSION: {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,424 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from FakeFirebase import FakeDatabase
+
+# Bulk import and export of the Students tree.
+#   python RosterTool.py import roster.csv           (also .jsonl / .parquet)
+#   python RosterTool.py export students.parquet
+#   python RosterTool.py bench --students 20000 --latency 0.02
+# Rows are streamed and validated against the schema main.py reads, and written as
+# chunked multi-path update()s: one round trip per chunk instead of one per student.
+# Each field is its own path, so other fields of a student are never clobbered, and
+# total_attendance / last_attendance_time (owned by the kiosks) are only written for
+# students that are new to the database, unless --overwrite-counters is given.
+# Re-running an import is therefore harmless. A failed chunk is retried with
+# exponential backoff; after the last retry the import stops and a checkpoint
+# (<input>.progress.json) lets the next run resume after the last written chunk.
+# Parquet needs pyarrow.
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TEXT_FIELDS = ('name', 'major', 'standing', 'year')
+INT_FIELDS = ('starting_year', 'total_attendance')
+COUNTER_FIELDS = ('total_attendance', 'last_attendance_time')
+FIELDS = ('name', 'major', 'starting_year', 'total_attendance', 'standing', 'year', 'last_attendance_time')
+DEFAULTS = {'total_attendance': 0, 'last_attendance_time': "2000-01-01 00:00:00"}
+ID_COLUMNS = ('id', 'student_id')
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet'}
+FORBIDDEN_KEY_CHARS = set('.$#[]/')
+
+
+class RosterError(ValueError):
+    pass
+
+
+def file_format(path, fmt=None):
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt not in FORMATS.values():
+        raise RosterError(f"unknown roster format for {path}; use one of {sorted(set(FORMATS.values()))}")
+    return fmt
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RosterError("Parquet rosters need pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def read_rows(path, fmt=None, batch_size=4096):
+    # Yields (line number, row dict); line numbers count the header for CSV
+    fmt = file_format(path, fmt)
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line_num, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        row = RosterError(f"bad JSON: {e}")
+                    yield line_num, row
+    else:
+        pyarrow = import_pyarrow()
+        line_num = 0
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size):
+            for row in batch.to_pylist():
+                line_num += 1
+                yield line_num, row
+
+
+def to_int(field, value):
+    if isinstance(value, bool):
+        raise RosterError(f"{field} must be an integer, got {value!r}")
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise RosterError(f"{field} must be an integer, got {value!r}") from None
+
+
+def validate(row):
+    # One input row -> (student_id, {field: value}) with only the fields present in the row
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise RosterError("row is not an object")
+    student_id = next((row[column] for column in ID_COLUMNS if row.get(column) not in (None, '')), None)
+    if student_id is None:
+        raise RosterError("missing id")
+    student_id = str(student_id).strip()
+    if not student_id or FORBIDDEN_KEY_CHARS & set(student_id) or len(student_id.encode()) > 768:
+        raise RosterError(f"id {student_id!r} is not a valid database key")
+
+    record = {}
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value is None or str(value).strip() == '':
+            raise RosterError(f"missing {field}")
+        record[field] = str(value).strip()
+    record['starting_year'] = to_int('starting_year', row.get('starting_year'))
+    if row.get('total_attendance') not in (None, ''):
+        record['total_attendance'] = to_int('total_attendance', row['total_attendance'])
+        if record['total_attendance'] < 0:
+            raise RosterError("total_attendance is negative")
+    if row.get('last_attendance_time') not in (None, ''):
+        value = str(row['last_attendance_time']).strip()
+        try:
+            datetime.strptime(value, TIME_FORMAT)
+        except ValueError:
+            raise RosterError(f"last_attendance_time {value!r} is not {TIME_FORMAT}") from None
+        record['last_attendance_time'] = value
+    return student_id, record
+
+
+def update_with_retry(ref, paths, retries=5, backoff=0.5, max_backoff=30.0):
+    # Returns the number of retries needed; re-raises after the last one
+    for attempt in range(retries + 1):
+        try:
+            ref.update(paths)
+            return attempt
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(max_backoff, backoff * 2 ** attempt)
+            print(f"update of {len(paths)} paths failed ({e}), retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+
+class Checkpoint:
+    # Rows of one input file already written; ignored if the file changed since
+
+    def __init__(self, source):
+        self.path = source + '.progress.json'
+        stat = os.stat(source)
+        self.identity = {'source': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if any(saved.get(key) != value for key, value in self.identity.items()):
+            print(f"ignoring {self.path}: the input changed since it was written", file=sys.stderr)
+            return 0
+        return saved.get('rows', 0)
+
+    def save(self, rows):
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(dict(self.identity, rows=rows), f)
+        os.replace(temp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def import_roster(db, path, root='Students', fmt=None, chunk_size=500, retries=5, backoff=0.5,
+                  overwrite_counters=False, strict=False, resume=True, dry_run=False):
+    ref = None if dry_run else db.reference(root)
+    checkpoint = Checkpoint(path) if resume and not dry_run else None
+    skip = checkpoint.load() if checkpoint else 0
+    existing = set() if dry_run else set((ref.get(shallow=True) or {}).keys())
+    report = {'rows': 0, 'resumed_after': skip, 'written': 0, 'new': 0, 'rejected': 0,
+              'chunks': 0, 'retries': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+    paths, students, rows = {}, 0, 0
+
+    def flush():
+        report['retries'] += update_with_retry(ref, paths, retries, backoff)
+        report['chunks'] += 1
+        report['written'] += students
+        if checkpoint:
+            checkpoint.save(rows)
+        paths.clear()
+
+    for line_num, row in read_rows(path, fmt):
+        rows += 1
+        if rows <= skip:
+            continue
+        report['rows'] += 1
+        try:
+            student_id, record = validate(row)
+        except RosterError as e:
+            if strict:
+                raise RosterError(f"{path}:{line_num}: {e}") from None
+            print(f"{path}:{line_num}: rejected: {e}", file=sys.stderr)
+            report['rejected'] += 1
+            continue
+        if dry_run:
+            continue
+        new = student_id not in existing
+        if new:
+            report['new'] += 1
+            existing.add(student_id)
+            record = dict(DEFAULTS, **record)
+        elif not overwrite_counters:
+            for field in COUNTER_FIELDS:
+                record.pop(field, None)
+        for field, value in record.items():
+            paths[f'{student_id}/{field}'] = value
+        students += 1
+        if students == chunk_size:
+            flush()
+            students = 0
+    if paths:
+        flush()
+    if checkpoint:
+        checkpoint.clear()
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+def iter_students(db, root='Students', page_size=1000):
+    # Pages through the tree in key order; start_at is inclusive, so each page after
+    # the first asks for one extra row and drops the key it started at
+    ref = db.reference(root)
+    last = None
+    while True:
+        query = ref.order_by_key()
+        if last is not None:
+            query = query.start_at(last)
+        limit = page_size if last is None else page_size + 1
+        page = query.limit_to_first(limit).get() or {}
+        items = [(key, value) for key, value in page.items() if key != last]
+        for key, value in items:
+            if isinstance(value, dict):
+                yield key, value
+        if len(page) < limit or not items:
+            return
+        last = items[-1][0]
+
+
+def export_row(student_id, student):
+    return dict({'id': student_id}, **{field: student.get(field) for field in FIELDS})
+
+
+def export_roster(db, path, root='Students', fmt=None, page_size=1000):
+    fmt = file_format(path, fmt)
+    count = 0
+    start = time.perf_counter()
+    students = iter_students(db, root, page_size)
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, ('id',) + FIELDS)
+            writer.writeheader()
+            for student_id, student in students:
+                writer.writerow(export_row(student_id, student))
+                count += 1
+    elif fmt == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            for student_id, student in students:
+                f.write(json.dumps(export_row(student_id, student), ensure_ascii=False) + '\n')
+                count += 1
+    else:
+        pyarrow = import_pyarrow()
+        schema = pyarrow.schema([('id', pyarrow.string())] + [
+            (field, pyarrow.int64() if field in INT_FIELDS else pyarrow.string()) for field in FIELDS])
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            batch = []
+            for student_id, student in students:
+                batch.append(export_row(student_id, student))
+                if len(batch) == page_size:
+                    writer.write_table(pyarrow.Table.from_pylist(batch, schema))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema))
+                count += len(batch)
+    return {'students': count, 'seconds': time.perf_counter() - start}
+
+
+def synthetic_roster(count, seed=0):
+    rng = random.Random(seed)
+    majors = ["CSE AIML", "Physics", "Robotics", "Economics", "Biology"]
+    for index in range(count):
+        yield {'id': f"{index:07d}", 'name': f"Student {index}", 'major': rng.choice(majors),
+               'starting_year': rng.randint(2018, 2025), 'total_attendance': rng.randint(0, 60),
+               'standing': rng.choice("GB"), 'year': str(rng.randint(1, 5)),
+               'last_attendance_time': "2022-12-11 00:54:34"}
+
+
+def write_rows(path, rows):
+    # Synthetic input for the benchmark, in the format of the extension
+    fmt = file_format(path)
+    rows = list(rows)
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, ('id',) + FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    elif fmt == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+    else:
+        pyarrow = import_pyarrow()
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), path)
+
+
+def bench(args):
+    try:
+        import_pyarrow()
+        formats = ('csv', 'jsonl', 'parquet')
+    except RosterError:
+        formats = ('csv', 'jsonl')
+        print("pyarrow not installed: skipping Parquet")
+    roster = list(synthetic_roster(args.students))
+    expected = {row['id']: {field: row[field] for field in FIELDS} for row in roster}
+    print(f"{args.students} students, {args.latency * 1000:.0f} ms per round trip, "
+          f"chunks of {args.chunk_size}, pages of {args.page_size}")
+    print(f"{'operation':>18} {'round trips':>12} {'seconds':>9} {'students/s':>11}")
+
+    # The old AddDataToDatabase loop, one set() per student, timed on a sample
+    database = FakeDatabase(latency=args.latency)
+    sample = roster[:args.legacy_sample]
+    start = time.perf_counter()
+    for row in sample:
+        database.reference('Students').child(row['id']).set({field: row[field] for field in FIELDS})
+    elapsed = time.perf_counter() - start
+    print(f"{'per-student set':>18} {database.calls:>12} {elapsed:9.2f} {len(sample) / elapsed:11.0f}"
+          f"  ({len(sample)} sampled)")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as folder:
+        for fmt in formats:
+            source = os.path.join(folder, f"roster.{fmt}")
+            write_rows(source, roster)
+            database = FakeDatabase(latency=args.latency)
+            report = import_roster(database, source, chunk_size=args.chunk_size, resume=False)
+            print(f"{'import ' + fmt:>18} {database.calls:>12} {report['seconds']:9.2f}"
+                  f" {report['written'] / report['seconds']:11.0f}")
+
+            again = import_roster(database, source, chunk_size=args.chunk_size, resume=False)
+            if database.data['Students'] != expected or again['new']:
+                print(f"FAIL: {fmt} import does not reproduce the roster or is not idempotent")
+                failed = True
+
+            target = os.path.join(folder, f"export.{fmt}")
+            calls = database.calls
+            report = export_roster(database, target, page_size=args.page_size)
+            print(f"{'export ' + fmt:>18} {database.calls - calls:>12} {report['seconds']:9.2f}"
+                  f" {report['students'] / report['seconds']:11.0f}")
+            exported = {student_id: record for student_id, record in
+                        (validate(row) for _, row in read_rows(target))}
+            if exported != expected:
+                print(f"FAIL: {fmt} export does not round-trip")
+                failed = True
+    if failed:
+        sys.exit(1)
+    print("imports reproduce the roster, re-imports add nothing, exports round-trip")
+
+
+def connect(credentials_path, database_url):
+    import firebase_admin
+    from firebase_admin import credentials, db
+    firebase_admin.initialize_app(credentials.Certificate(credentials_path), {'databaseURL': database_url})
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import, export and benchmark the Students roster")
+    parser.add_argument('--credentials', default='serviceAccountKey.json')
+    parser.add_argument('--database-url', default="https://faceattendancerealtime-2e6b8-default-rtdb.firebaseio.com/")
+    parser.add_argument('--root', default='Students')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help="write a CSV / JSONL / Parquet roster to the database")
+    importer.add_argument('path')
+    importer.add_argument('--format', choices=sorted(set(FORMATS.values())), default=None)
+    importer.add_argument('--chunk-size', type=int, default=500, help="students per multi-path update")
+    importer.add_argument('--retries', type=int, default=5)
+    importer.add_argument('--overwrite-counters', action='store_true',
+                          help="also write total_attendance / last_attendance_time of existing students")
+    importer.add_argument('--strict', action='store_true', help="abort on the first invalid row")
+    importer.add_argument('--no-resume', action='store_true', help="ignore and do not write a checkpoint")
+    importer.add_argument('--dry-run', action='store_true', help="only validate the input")
+
+    exporter = commands.add_parser('export', help="write the Students tree to a CSV / JSONL / Parquet file")
+    exporter.add_argument('path')
+    exporter.add_argument('--format', choices=sorted(set(FORMATS.values())), default=None)
+    exporter.add_argument('--page-size', type=int, default=1000)
+
+    benchmark = commands.add_parser('bench', help="import / export throughput against FakeFirebase")
+    benchmark.add_argument('--students', type=int, default=20000)
+    benchmark.add_argument('--latency', type=float, default=0.02, help="seconds per simulated round trip")
+    benchmark.add_argument('--chunk-size', type=int, default=500)
+    benchmark.add_argument('--page-size', type=int, default=1000)
+    benchmark.add_argument('--legacy-sample', type=int, default=200,
+                           help="students written the old way, one set() each")
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args)
+        return
+    try:
+        if args.command == 'import':
+            db = None if args.dry_run else connect(args.credentials, args.database_url)
+            report = import_roster(db, args.path, args.root, args.format, args.chunk_size, args.retries,
+                                   overwrite_counters=args.overwrite_counters, strict=args.strict,
+                                   resume=not args.no_resume, dry_run=args.dry_run)
+        else:
+            report = export_roster(connect(args.credentials, args.database_url), args.path, args.root,
+                                   args.format, args.page_size)
+    except RosterError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
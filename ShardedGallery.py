@@ -0,0 +1,316 @@
+import argparse
+import csv
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from FaceIndex import DEFAULT_TOLERANCE
+from GalleryFile import load_face_index, load_gallery, read_header, save_gallery
+
+# Hierarchical gallery for large deployments. The global gallery (EncodeFile.gal)
+# holds everyone; named partitions (a building, a course section) are smaller
+# gallery files in one directory, <shard>.gal. A kiosk searches its hot shards
+# first and only escalates the faces they do not answer to the global gallery.
+# match() has the FaceIndex interface, so it drops in wherever face_index is used.
+# Shards are memory mapped on first use and the least recently used ones are
+# dropped beyond max_loaded; stats() says which tier answered each query.
+#   python ShardedGallery.py build EncodeFile.gal partitions.csv --out Gallery
+#   python ShardedGallery.py bench --sizes 10000 50000 100000 200000
+# partitions.csv has one "shard,student_id" row per membership (a student can be in
+# several shards). A shard hit is accepted up to hot_tolerance, stricter than the
+# global 0.6: a shard does not hold the person's nearest look-alikes, so a loose
+# shard hit could be someone the global gallery would have matched better.
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+class Timetable:
+    # Hot shards by time: CSV rows "day,start,end,shard" (day mon..sun or *, times HH:MM)
+
+    def __init__(self, path):
+        self.slots = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                day = row['day'].strip().lower()[:3]
+                if day != '*' and day not in WEEKDAYS:
+                    raise ValueError(f"{path}: unknown day {row['day']!r}")
+                self.slots.append((day, row['start'].strip(), row['end'].strip(), row['shard'].strip()))
+
+    def __call__(self, now=None):
+        now = now or datetime.now()
+        day, clock = WEEKDAYS[now.weekday()], now.strftime('%H:%M')
+        return [shard for slot_day, start, end, shard in self.slots
+                if slot_day in ('*', day) and start <= clock < end]
+
+
+class ShardedGallery:
+
+    def __init__(self, directory, global_path='EncodeFile.gal', hot=(), max_loaded=4,
+                 hot_tolerance=0.5):
+        self.directory = directory
+        self.global_path = global_path
+        self.hot = hot                    # shard names, or a callable (e.g. Timetable) returning them
+        self.max_loaded = max_loaded      # shards kept mapped, besides the global gallery
+        self.hot_tolerance = hot_tolerance
+        self._shards = OrderedDict()      # name -> FaceIndex, least recently used first
+        self._global = None
+        self._online = []                 # (encoding, id) added at runtime (OnlineEnrollment)
+        self._lock = threading.RLock()
+
+        self.tiers = {}                   # tier -> [queries answered, searches, seconds]
+        self.loads = 0
+        self.evictions = 0
+
+    def shard_names(self):
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.directory) if name.endswith('.gal'))
+
+    def shard(self, name):
+        # The FaceIndex of one shard, mapped on first use; None if there is no such shard
+        with self._lock:
+            index = self._shards.get(name)
+            if index is not None:
+                self._shards.move_to_end(name)
+                return index
+            path = os.path.join(self.directory, f'{name}.gal')
+            if not os.path.exists(path):
+                return None
+            index = load_face_index(path)
+            self._add_online(index, self._online)
+            self._shards[name] = index
+            self.loads += 1
+            while len(self._shards) > self.max_loaded:
+                self._shards.popitem(last=False)
+                self.evictions += 1
+            return index
+
+    def global_index(self):
+        with self._lock:
+            if self._global is None:
+                self._global = load_face_index(self.global_path)
+                if self._online:
+                    self._global.add([encoding for encoding, _ in self._online], [i for _, i in self._online])
+                self.loads += 1
+            return self._global
+
+    @property
+    def dim(self):
+        return read_header(self.global_path)['dim']
+
+    def add(self, encodings, ids):
+        # Runtime encodings of known students: the global gallery gets them all, a
+        # shard those of its own members (also when it is mapped again later)
+        rows = [(np.asarray(encoding, dtype=np.float32), str(i)) for encoding, i in zip(encodings, ids)]
+        with self._lock:
+            self._online.extend(rows)
+            if self._global is not None:
+                self._global.add([encoding for encoding, _ in rows], [i for _, i in rows])
+            for index in self._shards.values():
+                self._add_online(index, rows)
+
+    @staticmethod
+    def _add_online(index, rows):
+        members = set(index.ids)
+        rows = [(encoding, i) for encoding, i in rows if i in members]
+        if rows:
+            index.add([encoding for encoding, _ in rows], [i for _, i in rows])
+
+    @property
+    def ids(self):
+        return self.global_index().ids
+
+    def __len__(self):
+        return len(self.global_index())
+
+    def hot_shards(self, now=None):
+        return list(self.hot(now) if callable(self.hot) else self.hot)
+
+    def set_hot(self, hot):
+        self.hot = hot
+
+    def _note(self, tier, answered, seconds):
+        entry = self.tiers.setdefault(tier, [0, 0, 0.0])
+        entry[0] += answered
+        entry[1] += 1
+        entry[2] += seconds
+
+    def match(self, queries, tolerance=DEFAULT_TOLERANCE):
+        q = np.asarray(queries, dtype=np.float32)
+        if q.size == 0:
+            return [], np.zeros(0, dtype=np.float32)
+        q = q.reshape(len(queries), -1)
+        ids = [None] * len(q)
+        distances = np.full(len(q), np.inf, dtype=np.float32)
+        pending = np.arange(len(q))
+        with self._lock:
+            for name in self.hot_shards():
+                index = self.shard(name)
+                if index is None or len(index) == 0:
+                    continue
+                start = time.perf_counter()
+                found, found_distances = index.match(q[pending], min(tolerance, self.hot_tolerance))
+                hits = [j for j, identity in enumerate(found) if identity is not None]
+                for j in hits:
+                    ids[pending[j]] = found[j]
+                distances[pending] = np.minimum(distances[pending], found_distances)
+                self._note(f'hot:{name}', len(hits), time.perf_counter() - start)
+                pending = np.delete(pending, hits)
+                if not len(pending):
+                    return ids, distances
+
+            start = time.perf_counter()
+            found, found_distances = self.global_index().match(q[pending], tolerance)
+            hits = 0
+            for j, identity in enumerate(found):
+                if identity is not None:
+                    ids[pending[j]] = identity
+                    hits += 1
+            distances[pending] = found_distances
+            self._note('global', hits, time.perf_counter() - start)
+            self._note('miss', len(pending) - hits, 0.0)
+        return ids, distances
+
+    def mapped_bytes(self):
+        with self._lock:
+            indexes = list(self._shards.values()) + ([self._global] if self._global is not None else [])
+            return sum(index.embeddings.nbytes + index.sq_norms.nbytes for index in indexes)
+
+    def stats(self):
+        with self._lock:
+            total = sum(entry[0] for entry in self.tiers.values())
+            return {
+                'stage': 'gallery',
+                'kind': 'gallery',
+                'tiers': {tier: {'queries': answered, 'share': answered / total if total else 0.0,
+                                 'ms_per_search': seconds / searches * 1000 if searches else 0.0}
+                          for tier, (answered, searches, seconds) in self.tiers.items()},
+                'loaded': list(self._shards) + (['global'] if self._global is not None else []),
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'mapped_mb': self.mapped_bytes() / 2 ** 20,
+            }
+
+
+def read_partitions(path):
+    # {shard: set of student ids} from "shard,student_id" rows
+    partitions = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            partitions.setdefault(row['shard'].strip(), set()).add(row['student_id'].strip())
+    return partitions
+
+
+def build_shards(global_path, partitions, directory):
+    # One gallery file per partition, with every global row of its students
+    embeddings, _, ids = load_gallery(global_path)
+    ids = np.array(ids, dtype=object)
+    os.makedirs(directory, exist_ok=True)
+    sizes = {}
+    for name, members in partitions.items():
+        rows = np.flatnonzero(np.isin(ids, list(members)))
+        save_gallery(os.path.join(directory, f'{name}.gal'), np.asarray(embeddings[rows]), list(ids[rows]),
+                     dim=embeddings.shape[1])
+        sizes[name] = (len(rows), len(members - set(ids[rows])))
+    return sizes
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def bench(args):
+    rng = np.random.default_rng(args.seed)
+    print(f"hot shard of {args.shard_size}, {args.hit_rate * 100:.0f}% of faces from it, "
+          f"batches of {args.batch}, {args.queries} queries")
+    print(f"{'gallery':>8} {'mode':>8} {'ms/batch':>9} {'p95 ms':>8} {'agree':>7} {'mapped MB':>10} {'RSS MB':>8}  tiers")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            # Face-like geometry: different people ~1.0 apart, the same person ~0.35
+            gallery = rng.normal(0, 0.7 / np.sqrt(128), (size, 128)).astype(np.float32)
+            ids = [f"{i:07d}" for i in range(size)]
+            global_path = os.path.join(folder, 'global.gal')
+            save_gallery(global_path, gallery, ids)
+            hot = rng.choice(size, args.shard_size, replace=False)
+            build_shards(global_path, {'hot': {ids[i] for i in hot}}, os.path.join(folder, 'shards'))
+            del gallery
+
+            embeddings = load_gallery(global_path)[0]
+            batches = []
+            for _ in range(args.queries // args.batch):
+                people = np.where(rng.random(args.batch) < args.hit_rate,
+                                  rng.choice(hot, args.batch), rng.integers(0, size, args.batch))
+                noise = rng.normal(0, 0.35 / np.sqrt(128), (args.batch, 128)).astype(np.float32)
+                batches.append((np.asarray(embeddings[people]) + noise, [ids[i] for i in people]))
+            del embeddings
+
+            modes = [('flat', lambda: load_face_index(global_path))]
+            if size >= args.ivf_from:
+                modes.append(('ivf', lambda: ivf_index(global_path)))
+            modes.append(('sharded', lambda: ShardedGallery(os.path.join(folder, 'shards'), global_path,
+                                                            hot=['hot'], hot_tolerance=args.hot_tolerance)))
+            for mode, make in modes:
+                index = make()
+                times, correct = [], 0
+                for queries, truth in batches:
+                    start = time.perf_counter()
+                    found, _ = index.match(queries)
+                    times.append((time.perf_counter() - start) * 1000)
+                    correct += sum(a == b for a, b in zip(found, truth))
+                times = np.array(times)
+                if isinstance(index, ShardedGallery):
+                    stats = index.stats()
+                    mapped = stats['mapped_mb']
+                    tiers = ", ".join(f"{tier} {entry['share'] * 100:.0f}% ({entry['ms_per_search']:.2f} ms)"
+                                      for tier, entry in stats['tiers'].items())
+                else:
+                    mapped = (index.embeddings.nbytes + index.sq_norms.nbytes) / 2 ** 20
+                    tiers = ""
+                print(f"{size:>8} {mode:>8} {times.mean():9.3f} {np.percentile(times, 95):8.3f} "
+                      f"{correct / (len(batches) * args.batch):7.3f} {mapped:10.1f} {rss_mb():8.0f}  {tiers}")
+                del index
+
+
+def ivf_index(path):
+    index = load_face_index(path)
+    index.build_ivf()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and benchmark gallery shards")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="write one gallery file per partition")
+    build.add_argument('gallery', help="global gallery, e.g. EncodeFile.gal")
+    build.add_argument('partitions', help="CSV with shard,student_id columns")
+    build.add_argument('--out', default='Gallery')
+
+    benchmark = commands.add_parser('bench', help="query latency and memory against a growing global gallery")
+    benchmark.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000, 200000])
+    benchmark.add_argument('--shard-size', type=int, default=500)
+    benchmark.add_argument('--hit-rate', type=float, default=0.9, help="share of faces from the hot shard")
+    benchmark.add_argument('--hot-tolerance', type=float, default=0.5)
+    benchmark.add_argument('--batch', type=int, default=4, help="faces per match() call")
+    benchmark.add_argument('--queries', type=int, default=2000)
+    benchmark.add_argument('--ivf-from', type=int, default=100000, help="also time build_ivf() from this size")
+    benchmark.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args)
+        return
+    sizes = build_shards(args.gallery, read_partitions(args.partitions), args.out)
+    for name, (rows, missing) in sorted(sizes.items()):
+        print(f"{name}: {rows} encodings" + (f", {missing} students not in the gallery" if missing else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,188 +1,244 @@
 import os
-import pickle
+import time
 import cv2
-import face_recognition
-import numpy as np
-from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, db
-from ultralytics import YOLO
-
-# === Firebase Setup ===
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': "https://faceattendancerealtime-2e6b8-default-rtdb.firebaseio.com/"
-})
-
-# === Load Background and UI Assets ===
-imgBackground = cv2.imread('Resources/background.png')
-folderModePath = 'Resources/Modes'
-modePathList = os.listdir(folderModePath)
-imgModeList = [cv2.imread(os.path.join(folderModePath, path)) for path in modePathList]
-
-# === Load Precomputed Face Encodings ===
-print("Loading Encode File ...")
-with open('EncodeFile.p', 'rb') as file:
-    encodeListKnownWithIds = pickle.load(file)
-encodeListKnown, studentIds = encodeListKnownWithIds
-print("Encode File Loaded")
+from GalleryFile import load_face_index
+from ShardedGallery import ShardedGallery
+from LivenessBackend import load_liveness_model
+from KioskPipeline import KioskPipeline, format_stats
+from AttendanceSink import AttendanceSink, FirebaseBackend, attendance_lookup
+from AttendanceLedger import AttendanceLedger
+from ProfileCache import ProfileCache
+from InferenceScheduler import InferenceScheduler
+from LivenessAggregator import LivenessAggregator
+from FaceQuality import QualityGate
+from OnlineEnrollment import OnlineEnrollment
+from KioskStartup import Startup, warmup_face_models, warmup_gallery, warmup_liveness
+from KioskMetrics import MetricsLog, MetricsServer, SamplingProfiler, install_profiler_signal
+
+# === Gallery ===
+# EncodeFile.gal is memory mapped, so kiosk processes on one host share its pages.
+# Convert an old EncodeFile.p once with ConvertEncodeFile.py
+# Multi-campus: with gallery_shards (a directory from ShardedGallery.py build) this
+# kiosk searches its hot shards first and only escalates misses to the whole gallery.
+# hot_shards is a list of shard names, or a timetable:
+#   from ShardedGallery import Timetable
+#   hot_shards = Timetable('Gallery/timetable.csv')
+gallery_shards = None
+hot_shards = []
+# Online enrollment: confident, live, good-quality recognitions are added as extra
+# encodings of the student (capped, kept in EncodeFile.online.gal; see OnlineEnrollment.py)
+online_enrollment = False
 
 # === YOLO Anti-Spoofing Setup ===
-yolo_model = YOLO("../models/n_version_4_75.pt")
+# The .pt checkpoint runs on PyTorch; point this at an export from ExportLivenessModel.py
+# (.onnx, optionally INT8) to run on ONNX Runtime, or pass liveness_backend='openvino'.
+liveness_model_path = "../models/n_version_4_75.pt"
+liveness_backend = None       # None: chosen from the file extension
+liveness_imgsz = 640          # smaller (e.g. 480, 320) is faster on CPU-only kiosks
+liveness_threads = None       # None: runtime default
 confidence_threshold = 0.6
+# True: encode the YOLO "real" boxes directly and skip the dlib HOG pass (see BenchmarkDetectors.py)
+single_pass = False
+# Run the models at a low rate while the scene is static and nobody is in front of the camera
+motion_gating = True
+# True: every live face in the frame is marked and queued on screen (busy doorways), see ReplayBenchmark.py
+multi_subject = False
 classNames = ["fake", "real"]  # Model predicts whether face is fake or real
-
-# === Camera and App State Variables ===
-cap = cv2.VideoCapture(0)
-cap.set(3, 640)
-cap.set(4, 480)
-
-modeType = 0         # Determines which UI mode is shown
-counter = 0          # Controls timing for displaying attendance info
-id = -1              # ID of the recognized student
-studentInfo = {}     # Info fetched from Firebase
-
-# Buffer to avoid sudden fake-real flickers
-real_face_buffer = []
-buffer_size = 5      # Must see 4+ "real" frames to proceed
-
-# === Main Loop ===
-while True:
-    success, img = cap.read()
-    img = cv2.flip(img, 1)  # Mirror camera for natural view
-
-    # Draw webcam into background layout
-    frame = imgBackground.copy()
-    frame[162:162 + 480, 55:55 + 640] = img
-    frame[44:44 + 633, 808:808 + 414] = imgModeList[modeType]
-
-    # === Anti-Spoofing Check ===
-    real_face_detected = False
-    results = yolo_model(img, stream=True, verbose=False)
-
-    for r in results:
-        for box in r.boxes:
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
-
-            if conf > confidence_threshold:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                label = classNames[cls]
-                color = (0, 255, 0) if label == "real" else (0, 0, 255)
-
-                # Draw detection box on background layout
-                cv2.rectangle(frame, (55 + x1, 162 + y1), (55 + x2, 162 + y2), color, 2)
-
-                # Store prediction in buffer
-                real_face_buffer.append(label)
-                if len(real_face_buffer) > buffer_size:
-                    real_face_buffer.pop(0)
-
-    # Check if most frames in buffer are "real"
-    if real_face_buffer.count("real") >= buffer_size - 1:
-        real_face_detected = True
-
-    # === If Real Face Detected, Proceed to Face Recognition ===
-    if real_face_detected and counter == 0:
-        imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
-        imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
-        faceCurFrame = face_recognition.face_locations(imgS)
-        encodeCurFrame = face_recognition.face_encodings(imgS, faceCurFrame)
-
-        if faceCurFrame:
-            for encodeFace, faceLoc in zip(encodeCurFrame, faceCurFrame):
-                matches = face_recognition.compare_faces(encodeListKnown, encodeFace)
-                faceDis = face_recognition.face_distance(encodeListKnown, encodeFace)
-                matchIndex = np.argmin(faceDis)
-
-                if matches[matchIndex]:
-                    y1, x2, y2, x1 = [val * 4 for val in faceLoc]
-
-                    # Draw green corner box around recognized face
-                    corner_color = (0, 255, 0)
-                    corner_len = 20
-                    thickness = 2
-                    x1_disp, y1_disp = 55 + x1, 162 + y1
-                    x2_disp, y2_disp = 55 + x2, 162 + y2
-
-                    cv2.line(frame, (x1_disp, y1_disp), (x1_disp + corner_len, y1_disp), corner_color, thickness)
-                    cv2.line(frame, (x1_disp, y1_disp), (x1_disp, y1_disp + corner_len), corner_color, thickness)
-                    cv2.line(frame, (x2_disp, y1_disp), (x2_disp - corner_len, y1_disp), corner_color, thickness)
-                    cv2.line(frame, (x2_disp, y1_disp), (x2_disp, y1_disp + corner_len), corner_color, thickness)
-                    cv2.line(frame, (x1_disp, y2_disp), (x1_disp + corner_len, y2_disp), corner_color, thickness)
-                    cv2.line(frame, (x1_disp, y2_disp), (x1_disp, y2_disp - corner_len), corner_color, thickness)
-                    cv2.line(frame, (x2_disp, y2_disp), (x2_disp - corner_len, y2_disp), corner_color, thickness)
-                    cv2.line(frame, (x2_disp, y2_disp), (x2_disp, y2_disp - corner_len), corner_color, thickness)
-
-                    id = studentIds[matchIndex]
-                    counter = 1
-                    modeType = 1  # Show attendance template
-
-    # === Attendance Logic ===
-    if counter != 0:
-        if counter == 1:
-            # Fetch student info from Firebase
-            studentInfo = db.reference(f'Students/{id}').get()
-            datetimeObject = datetime.strptime(studentInfo['last_attendance_time'], "%Y-%m-%d %H:%M:%S")
-            secondsElapsed = (datetime.now() - datetimeObject).total_seconds()
-
-
-            # Prevents marking attendance if it was marked less than a certain time frame (in seconds)
-            if secondsElapsed > 30:               # === THIS IS THE 30-SECOND BUFFER LOGIC ==============================
-                ref = db.reference(f'Students/{id}')
-                studentInfo['total_attendance'] += 1
-                ref.child('total_attendance').set(studentInfo['total_attendance'])
-                ref.child('last_attendance_time').set(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            else:
-                modeType = 3  # Already marked
-                counter = 0  # Skip rest of the attendance flow
-
-        # === Show student info (Mode 1) for 40 frames ===
-        if 1 <= counter <= 40:
-            modeType = 1
-            frame[44:44 + 633, 808:808 + 414] = imgModeList[modeType]
-
-            cv2.putText(frame, str(studentInfo["total_attendance"]), (861, 125),
-                        cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 1)
-            cv2.putText(frame, str(studentInfo["major"]), (1006, 550),
-                        cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, str(id), (1006, 493),
-                        cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, str(studentInfo["standing"]), (910, 625),
-                        cv2.FONT_HERSHEY_COMPLEX, 0.6, (100, 100, 100), 1)
-            cv2.putText(frame, str(studentInfo["year"]), (1025, 625),
-                        cv2.FONT_HERSHEY_COMPLEX, 0.6, (100, 100, 100), 1)
-            cv2.putText(frame, str(studentInfo["starting_year"]), (1125, 625),
-                        cv2.FONT_HERSHEY_COMPLEX, 0.6, (100, 100, 100), 1)
-
-            (w, _), _ = cv2.getTextSize(studentInfo['name'], cv2.FONT_HERSHEY_COMPLEX, 1, 1)
-            offset = (414 - w) // 2
-            cv2.putText(frame, str(studentInfo['name']), (808 + offset, 445),
-                        cv2.FONT_HERSHEY_COMPLEX, 1, (50, 50, 50), 1)
-
-        # === Mode 2: Simple animation, no info ===
-        elif 41 <= counter < 70:
-            modeType = 2
-            frame[44:44 + 633, 808:808 + 414] = imgModeList[modeType]
-
-        # After 70 frames, reset everything
-        counter += 1
-        if counter >= 70:
-            counter = 0
-            modeType = 0
-            studentInfo = {}
-            id = -1
-            real_face_buffer.clear()
-    else:
-        # Reset to default state if no attendance being processed
-        modeType = 0
-        counter = 0
-
-    # === Show Final Frame ===
-    cv2.imshow("Face attendance", frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# === Cleanup ===
-cap.release()
-cv2.destroyAllWindows()
+# Per-face liveness: a face counts as real once its weighted confidence reaches `enter`
+# and 4 of its last 5 frames were labelled real; it drops out below `exit`.
+liveness = LivenessAggregator(window=5, alpha=0.5, enter=0.7, exit=0.4)
+# Faces too small, blurred, badly lit or turned away are not encoded (see FaceQuality.py);
+# set log_path to record every decision for tuning the thresholds, or None to encode every face
+quality_gate = QualityGate(min_size=20, min_blur=15.0, max_yaw=0.35, max_roll=25.0, log_path=None)
+
+# === Startup ===
+# Everything below loads concurrently and every model runs once on a synthetic frame
+# before the camera goes live (see KioskStartup.py). The readiness state and the
+# per-component timings are kept in status_path for a supervisor or health check.
+status_path = 'kiosk_status.json'
+stats_interval = 10  # seconds between stage throughput / latency reports
+
+# === Metrics ===
+# Prometheus text on http://127.0.0.1:9108/metrics, JSON on /stats and the readiness
+# state on /ready (see KioskMetrics.py); None turns the endpoint off. With
+# metrics_log_path every stats_interval appends one JSON line of all the stats.
+# `kill -USR1 <pid>` starts a sampling profile of every thread and the next one writes
+# it to profile_dir; on Windows use http://127.0.0.1:9108/profile?seconds=10.
+metrics_port = 9108
+metrics_log_path = None
+profile_dir = 'profiles'
+
+
+def init_firebase():
+    import firebase_admin
+    from firebase_admin import credentials, db
+    cred = credentials.Certificate("serviceAccountKey.json")
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': "https://faceattendancerealtime-2e6b8-default-rtdb.firebaseio.com/"
+    })
+    return db
+
+
+def load_assets():
+    imgBackground = cv2.imread('Resources/background.png')
+    folderModePath = 'Resources/Modes'
+    modePathList = os.listdir(folderModePath)
+    imgModeList = [cv2.imread(os.path.join(folderModePath, path)) for path in modePathList]
+    return imgBackground, imgModeList
+
+
+def load_gallery():
+    # One float32 matrix with precomputed norms; every face in a frame is matched in one query
+    if gallery_shards:
+        return ShardedGallery(gallery_shards, 'EncodeFile.gal', hot=hot_shards)
+    return load_face_index('EncodeFile.gal')
+
+
+def load_enrollment(startup):
+    if not online_enrollment:
+        return None
+    enrollment = OnlineEnrollment(startup.result('gallery'), 'EncodeFile.online.gal')
+    print(f"Loaded {enrollment.load()} online encodings")
+    return enrollment
+
+
+def load_face_models():
+    # Imports dlib and loads its detector, landmark and encoder models
+    import face_recognition
+    return face_recognition
+
+
+def open_camera():
+    cap = cv2.VideoCapture(0)
+    cap.set(3, 640)
+    cap.set(4, 480)
+    if not cap.isOpened():
+        raise RuntimeError("camera 0 could not be opened")
+    cap.read()  # the first frame waits for the sensor and auto exposure
+    return cap
+
+
+def open_attendance(startup):
+    # Every recognition is appended to a local ledger (reports: AttendanceLedger.py); the
+    # Firebase counters are synced from it in batches by a background thread, so an
+    # outage or a restart never loses attendance.
+    db = startup.result('firebase')
+    old_sink = drain_old_journal(db) if os.path.exists('attendance_journal.db') else None
+    attendance_ledger = AttendanceLedger('attendance_ledger.db', camera='kiosk')
+    attendance_sink = AttendanceSink(FirebaseBackend(db), journal=attendance_ledger).start()
+    return attendance_ledger, attendance_sink, old_sink
+
+
+def drain_old_journal(db):
+    # Marks left in the journal of an older version: sent now, or, offline, by a sink
+    # that keeps retrying in the background until they are out (None once sent)
+    old_sink = AttendanceSink(FirebaseBackend(db), journal_path='attendance_journal.db')
+    try:
+        while old_sink.flush():
+            pass
+    except Exception as error:
+        print(f"{old_sink.pending()} old attendance marks not sent yet ({error!r}); retrying in the background")
+        return old_sink.start()
+    old_sink.stop(flush=False)
+    return None
+
+
+def load_profiles(startup):
+    # Bulk-loaded once and kept fresh by a database listener; misses fall through to Firebase.
+    profile_cache = ProfileCache(startup.result('firebase'))
+    print(f"Loaded {profile_cache.warm()} student profiles")
+    profile_cache.start()
+    return profile_cache
+
+
+def warm_gallery(startup):
+    startup.result('enrollment')  # online encodings are merged in first
+    warmup_gallery(startup.result('gallery'))
+
+
+def main():
+    startup = Startup(status_path)
+    sources = []  # stats() callables, added once their component is up
+
+    def collect():
+        return [startup.stats()] + [summary for stats in sources for summary in stats()]
+
+    # Up first, so /ready answers while the rest loads
+    metrics = MetricsServer(collect, metrics_port, status=startup.status).start() if metrics_port else None
+    install_profiler_signal(SamplingProfiler(directory=profile_dir))
+    startup.submit('firebase', init_firebase)
+    startup.submit('assets', load_assets)
+    startup.submit('gallery', load_gallery)
+    startup.submit('enrollment', load_enrollment, startup)
+    startup.submit('face_models', load_face_models)
+    startup.submit('liveness_model', load_liveness_model, liveness_model_path, liveness_backend, liveness_imgsz,
+                   liveness_threads)
+    startup.submit('camera', open_camera)
+    startup.submit('attendance', open_attendance, startup)
+    startup.submit('profiles', load_profiles, startup)
+    # Warmups start as soon as their model is loaded; the gallery one after the
+    # online encodings are merged in
+    startup.submit('warmup_liveness', lambda: warmup_liveness(startup.result('liveness_model')))
+    startup.submit('warmup_faces', lambda: warmup_face_models(startup.result('face_models'), quality_gate))
+    startup.submit('warmup_gallery', warm_gallery, startup)
+    try:
+        parts = startup.wait()
+    except Exception:
+        print(startup.report())
+        raise
+    imgBackground, imgModeList = parts['assets']
+    face_index, enrollment, cap = parts['gallery'], parts['enrollment'], parts['camera']
+    attendance_ledger, attendance_sink, old_sink = parts['attendance']
+    profile_cache = parts['profiles']
+
+    # Runs on the recognition thread; a student is marked at most once every 30 seconds.
+    lookup_attendance = attendance_lookup(profile_cache, attendance_sink, min_seconds=30)
+
+    # === Pipeline: capture -> anti-spoofing -> recognition threads, render loop here ===
+    pipeline = KioskPipeline(cap, parts['liveness_model'], face_index, lookup_attendance, imgBackground,
+                             imgModeList, confidence_threshold=confidence_threshold, classNames=classNames,
+                             single_pass=single_pass, scheduler=InferenceScheduler() if motion_gating else None,
+                             multi_subject=multi_subject, liveness=liveness, quality_gate=quality_gate,
+                             enrollment=enrollment)
+    pipeline.start()
+    sources.append(lambda: pipeline.stats() + [attendance_sink.stats(), profile_cache.stats()])
+    metrics_log = MetricsLog(collect, metrics_log_path, stats_interval).start() if metrics_log_path else None
+    startup.ready()
+    print(startup.report())
+    last_report = time.perf_counter()
+
+    # === Main Loop ===
+    try:
+        while True:
+            frame = pipeline.render_next()
+            if frame is None:
+                continue
+
+            # === Show Final Frame ===
+            cv2.imshow("Face attendance", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+
+            if time.perf_counter() - last_report > stats_interval:
+                print(format_stats(pipeline.stats() + [attendance_sink.stats(), profile_cache.stats()]))
+                last_report = time.perf_counter()
+    finally:
+        # === Cleanup ===
+        startup.set_state('stopped')
+        if metrics_log is not None:
+            metrics_log.stop()
+        if metrics is not None:
+            metrics.stop()
+        pipeline.stop()
+        attendance_sink.stop()
+        attendance_ledger.close()
+        if old_sink is not None:
+            old_sink.stop()
+        profile_cache.stop()
+        print(format_stats(pipeline.stats()))
+        cap.release()
+        cv2.destroyAllWindows()
+
+
+if __name__ == '__main__':
+    main()